@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -14,6 +16,32 @@ class Settings(BaseSettings):
     DATABASE_USER: str
     DATABASE_PASSWORD: str
 
+    # Пул соединений с БД (на один воркер)
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+    # Общий лимит соединений на все воркеры uvicorn (None — без лимита)
+    DB_MAX_CONNECTIONS: int | None = None
+    WEB_CONCURRENCY: int = 1
+
+    def db_pool_limits(self) -> tuple[int, int]:
+        """
+        Размер пула и overflow для одного воркера.
+
+        Если задан DB_MAX_CONNECTIONS, он делится между WEB_CONCURRENCY
+        воркерами, чтобы все воркеры вместе не превысили лимит Postgres.
+        """
+        if self.DB_MAX_CONNECTIONS is None:
+            return self.DB_POOL_SIZE, self.DB_MAX_OVERFLOW
+        budget = max(self.DB_MAX_CONNECTIONS // max(self.WEB_CONCURRENCY, 1), 1)
+        pool_size = min(self.DB_POOL_SIZE, budget)
+        return pool_size, min(self.DB_MAX_OVERFLOW, budget - pool_size)
+
     # API
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
@@ -21,11 +49,104 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     SECURE_COOKIES: bool = True
     DEBUG: bool = False
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 300
+    # Хэширование паролей: алгоритм и его стоимость
+    PASSWORD_HASH_ALGORITHM: Literal["scrypt", "pbkdf2_sha256"] = "scrypt"
+    PASSWORD_SCRYPT_N: int = 2 ** 14
+    PASSWORD_SCRYPT_R: int = 8
+    PASSWORD_SCRYPT_P: int = 1
+    PASSWORD_PBKDF2_ITERATIONS: int = 600000
+    # Потоков для хэширования паролей (JWT подписывается и проверяется в event loop)
+    CRYPTO_WORKERS: int = 2
+
+    # Логирование
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_QUEUE_OVERFLOW: Literal["drop_new", "drop_oldest"] = "drop_new"
+    # Доля успешных запросов, попадающих в лог: общая и по шаблонам маршрутов
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_SAMPLE_RATES: dict[str, float] = {}
+    # Не больше стольких записей об успешных запросах в секунду (0 — без ограничения)
+    LOG_SUCCESS_BUDGET: int = 0
+    # Запросы не быстрее этого логируются всегда, как и ответы с ошибкой
+    LOG_SLOW_REQUEST_MS: float = 1000
+    # Одинаковые предупреждения и ошибки пишутся не чаще раза в столько секунд
+    LOG_DEDUP_WINDOW: float = 60.0
+
+    # Пул клиентов Telegram
+    TG_POOL_MAX_CONNECTED: int = 100
+    TG_POOL_IDLE_TIMEOUT: int = 600
+    TG_POOL_HEALTH_CHECK_INTERVAL: int = 60
+    # Сколько клиентов из TG_POOL_MAX_CONNECTED можно закрепить под хранилище непрочитанных
+    TG_POOL_MAX_PINNED: int = 50
+    # Через сколько секунд после изменения строка сессии записывается в БД
+    SESSION_WRITE_DELAY: float = 5.0
+    # Раз в сколько секунд время активности профилей (last_login) пишется в БД
+    ACTIVITY_FLUSH_INTERVAL: float = 10.0
+
+    # Лимиты запросов к Telegram на профиль: запросов в секунду и размер всплеска
+    TG_RATE_READ: float = 5.0
+    TG_RATE_READ_BURST: int = 10
+    TG_RATE_SEND: float = 1.0
+    TG_RATE_SEND_BURST: int = 3
+    TG_RATE_ACK: float = 2.0
+    TG_RATE_ACK_BURST: int = 5
+    TG_RATE_AUTH: float = 0.2
+    TG_RATE_AUTH_BURST: int = 3
+    # Во сколько раз снижать скорость на FloodWait и возвращать после успешного вызова
+    TG_RATE_FLOOD_BACKOFF: float = 0.5
+    TG_RATE_RECOVERY: float = 1.05
+    TG_RATE_MIN: float = 0.05
+    # FloodWait не длиннее стольких секунд пережидается, и RPC повторяется один раз
+    TG_RATE_FLOOD_RETRY_MAX: int = 10
+
+    # Непрочитанные сообщения
+    UNREAD_FETCH_CONCURRENCY: int = 4
+    UNREAD_FLOOD_WAIT_MAX: int = 30
+    UNREAD_FLOOD_WAIT_RETRIES: int = 3
+    UNREAD_STREAM_BUFFER: int = 8
+    # Все профили пользователя: сколько профилей опрашивать одновременно (на весь сервис)
+    UNREAD_ALL_CONCURRENCY: int = 16
+    UNREAD_ALL_PROFILE_TIMEOUT: float = 30.0
+    READ_ACK_BATCH_DELAY: float = 1.0
+    READ_ACK_MAX_RETRIES: int = 5
+
+    # Локальное хранилище непрочитанных: закреплённые клиенты пишут входящие в БД
+    UNREAD_FROM_STORE: bool = False
+    MESSAGE_STORE_FLUSH_INTERVAL: float = 0.5
+    MESSAGE_STORE_RECONNECT_INTERVAL: int = 60
+    MESSAGE_STORE_BACKFILL_LIMIT: int = 100
+    # Сколько клиентов профилей подключать одновременно при запуске и переподключении
+    MESSAGE_STORE_CONNECT_CONCURRENCY: int = 8
+
+    # Пакетная отправка
+    SEND_BATCH_MAX_SIZE: int = 1000
+    SEND_BATCH_INTERVAL: float = 1.0
+    SEND_BATCH_FLOOD_WAIT_MAX: int = 300
+    SEND_BATCH_JOB_TTL: int = 3600
+    # Сколько секунд send_batch с wait=True ждёт окончания, дальше отдаёт прогресс
+    SEND_BATCH_WAIT_TIMEOUT: float = 300
+
+    # Хранилище кэшей (пользователи по токену, получатели): memory — в каждом воркере своё,
+    # redis — общее для всех воркеров
+    CACHE_BACKEND: Literal["memory", "redis"] = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    # Недоступный Redis должен давать промах кэша быстро, а не висеть до TCP-таймаута
+    REDIS_SOCKET_TIMEOUT: float = 0.5
+    REDIS_CONNECT_TIMEOUT: float = 0.5
+    CACHE_KEY_PREFIX: str = "tgapi"
+
+    # Кэш диалогов
+    DIALOG_CACHE_TTL: int = 60
+
+    # Кэш получателей
+    ENTITY_CACHE_SIZE: int = 10000
+    ENTITY_CACHE_TTL: int = 86400
+    ENTITY_CACHE_NEGATIVE_TTL: int = 300
 
     class ConfigDict:
         env_file = "example.env"
 
-
     @classmethod
     def for_testing(cls):
         """Создание тестовых настроек"""
@@ -1,5 +1,12 @@
+import time
+
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 from app.config.config import get_settings
+from app.services.metrics import Counter, Gauge, Histogram
+from app.services.timings import add_timing
 
 settings = get_settings()
 
@@ -8,21 +15,120 @@ SQLALCHEMY_DATABASE_URL = (
     f"@{settings.DATABASE_URL}:{settings.DATABASE_PORT}/{settings.DATABASE_NAME}"
 )
 
+
+class PoolStats:
+    """Счётчики выдачи соединений из пула: сколько раз, сколько ждали, сколько раз не дождались"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+
+pool_stats = PoolStats()
+
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание свободного соединения из пула БД",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+db_pool_checkout_timeouts = Counter("db_pool_checkout_timeouts_total", "Не дождались соединения из пула БД")
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который меряет время ожидания свободного соединения"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            db_pool_checkout_timeouts.inc()
+            raise
+        wait = time.perf_counter() - start
+        pool_stats.record(wait)
+        db_pool_checkout_wait.observe(wait)
+        return connection
+
+
+pool_size, max_overflow = settings.db_pool_limits()
+
 engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    echo=True,
+    poolclass=MeteredQueuePool,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO,
+    connect_args={
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS)},
+    },
 )
 
+
+# Начало запроса хранится в его контексте выполнения, а не на соединении:
+# у упавшего запроса after_cursor_execute не вызывается, и общий стек на
+# соединении сдвигался бы для всех следующих запросов
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    # время запросов к БД идёт в db_ms текущего HTTP запроса
+    add_timing("db", time.perf_counter() - context.query_start)
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _query_failed(exception_context):
+    # упавший запрос (например, по statement_timeout) тоже занимал БД
+    start = getattr(exception_context.execution_context, "query_start", None)
+    if start is not None:
+        add_timing("db", time.perf_counter() - start)
+
+
 SessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
+Gauge("db_pool_size", "Размер пула соединений с БД").set_function(lambda: engine.sync_engine.pool.size())
+Gauge("db_pool_checked_out", "Выданные соединения БД").set_function(lambda: engine.sync_engine.pool.checkedout())
+Gauge("db_pool_overflow", "Соединения БД сверх размера пула").set_function(
+    lambda: max(engine.sync_engine.pool.overflow(), 0))
+
+
+def get_pool_status() -> dict:
+    """Текущее состояние пула соединений для подбора его размера под нагрузкой"""
+    pool = engine.sync_engine.pool
+    checkouts = pool_stats.checkouts
+    return {
+        "size": pool.size(),
+        "max_overflow": max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": checkouts,
+        "timeouts": pool_stats.timeouts,
+        "avg_wait_ms": round(pool_stats.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+        "max_wait_ms": round(pool_stats.wait_max * 1000, 3),
+    }
+
+
 async def get_db():
     async with SessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, Index
+from datetime import datetime
+from app.db.base import Base
+
+
+class TelegramMessage(Base):
+    """Входящее сообщение профиля, полученное из обновлений Telegram"""
+    __tablename__ = "telegram_messages"
+
+    profile_id = Column(Integer, ForeignKey("telegram_profiles.id"), primary_key=True)
+    # id чата в формате Telethon (с префиксом -100 для каналов)
+    chat_id = Column(BigInteger, primary_key=True)
+    message_id = Column(BigInteger, primary_key=True)
+    chat_name = Column(String(255), nullable=True)
+    sender_name = Column(String(255), nullable=True)
+    text = Column(Text, nullable=True)
+    date = Column(DateTime(timezone=True))
+    is_read = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        # Непрочитанные профиля — частичный индекс, прочитанные в него не попадают
+        Index(
+            "ix_telegram_messages_unread",
+            "profile_id", "chat_id", "message_id",
+            postgresql_where=is_read.is_(False),
+        ),
+        # Лента профиля по дате: keyset-пагинация по (date, chat_id, message_id)
+        Index("ix_telegram_messages_profile_date", "profile_id", "date", "chat_id", "message_id"),
+    )
+
+
+class TelegramHistoryRange(Base):
+    """
+    Непрерывный участок истории чата, целиком сохранённый в telegram_messages:
+    все сообщения с min_id <= id <= max_id уже есть в таблице.
+    reached_start — участок доходит до первого сообщения чата.
+    """
+    __tablename__ = "telegram_history_ranges"
+
+    profile_id = Column(Integer, ForeignKey("telegram_profiles.id"), primary_key=True)
+    chat_id = Column(BigInteger, primary_key=True)
+    min_id = Column(BigInteger)
+    max_id = Column(BigInteger)
+    reached_start = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
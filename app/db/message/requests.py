@@ -0,0 +1,228 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.message.models import TelegramMessage, TelegramHistoryRange
+
+# Строк в одном INSERT: держимся далеко от лимита параметров asyncpg (32767)
+UPSERT_CHUNK_SIZE = 1000
+
+
+def _upsert_statements(rows: list[dict], update_read: bool):
+    """
+    INSERT ... ON CONFLICT DO UPDATE пачками по UPSERT_CHUNK_SIZE строк.
+
+    update_read=False оставляет is_read у уже сохранённых сообщений как есть,
+    чтобы повторно пришедшее сообщение не стало снова непрочитанным.
+    """
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = insert(TelegramMessage).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        set_ = {
+            "chat_name": stmt.excluded.chat_name,
+            "sender_name": stmt.excluded.sender_name,
+            "text": stmt.excluded.text,
+        }
+        if update_read:
+            set_["is_read"] = stmt.excluded.is_read
+        yield stmt.on_conflict_do_update(
+            index_elements=[TelegramMessage.profile_id, TelegramMessage.chat_id, TelegramMessage.message_id],
+            set_=set_,
+        )
+
+
+def _mark_read_statement(profile_id: int, chat_id: int, max_id: int):
+    return (
+        update(TelegramMessage)
+        .where(
+            TelegramMessage.profile_id == profile_id,
+            TelegramMessage.chat_id == chat_id,
+            TelegramMessage.message_id <= max_id,
+            TelegramMessage.is_read.is_(False),
+        )
+        .values(is_read=True)
+    )
+
+
+async def save_messages(
+        session: AsyncSession,
+        rows: list[dict],
+        reads: list[tuple[int, int, int]] = (),
+):
+    """
+    Одной транзакцией: вставить или обновить сообщения и отметить
+    прочитанными (profile_id, chat_id, max_id) — именно в таком порядке,
+    чтобы отметка о прочтении не потерялась для только что пришедших сообщений.
+    """
+    async with session as session:
+        for stmt in _upsert_statements(rows, update_read=False):
+            await session.execute(stmt)
+        for profile_id, chat_id, max_id in reads:
+            await session.execute(_mark_read_statement(profile_id, chat_id, max_id))
+        await session.commit()
+
+
+async def reset_unread_messages(session: AsyncSession, profile_id: int, rows: list[dict], before: datetime):
+    """
+    Заменить непрочитанные профиля актуальным снимком из Telegram.
+
+    Прочитанными отмечаются только строки, записанные до начала снимка (before):
+    сообщения, которые фоновая запись успела сохранить, пока снимок собирался,
+    в него не попали и должны остаться непрочитанными.
+    """
+    async with session as session:
+        await session.execute(
+            update(TelegramMessage)
+            .where(
+                TelegramMessage.profile_id == profile_id,
+                TelegramMessage.is_read.is_(False),
+                TelegramMessage.created_at < before,
+            )
+            .values(is_read=True)
+        )
+        for stmt in _upsert_statements(rows, update_read=True):
+            await session.execute(stmt)
+        await session.commit()
+
+
+async def get_stored_unread(session: AsyncSession, profile_id: int, limit: int) -> list:
+    """
+    Непрочитанные сообщения профиля одним запросом по частичному индексу:
+    не больше limit самых новых на чат, чаты — от самого свежего.
+    """
+    ranked = (
+        select(
+            TelegramMessage.chat_id,
+            TelegramMessage.message_id,
+            TelegramMessage.chat_name,
+            TelegramMessage.sender_name,
+            TelegramMessage.text,
+            TelegramMessage.date,
+            func.row_number().over(
+                partition_by=TelegramMessage.chat_id,
+                order_by=TelegramMessage.message_id.desc(),
+            ).label("position"),
+            func.max(TelegramMessage.date).over(partition_by=TelegramMessage.chat_id).label("chat_date"),
+        )
+        .where(TelegramMessage.profile_id == profile_id, TelegramMessage.is_read.is_(False))
+        .subquery()
+    )
+    stmt = (
+        select(ranked)
+        .where(ranked.c.position <= limit)
+        .order_by(ranked.c.chat_date.desc(), ranked.c.chat_id, ranked.c.message_id.desc())
+    )
+    async with session as session:
+        result = await session.execute(stmt)
+        return list(result.mappings())
+
+
+async def get_history_range(session: AsyncSession, profile_id: int, chat_id: int) -> TelegramHistoryRange | None:
+    stmt = select(TelegramHistoryRange).where(
+        TelegramHistoryRange.profile_id == profile_id,
+        TelegramHistoryRange.chat_id == chat_id,
+    )
+    async with session as session:
+        result = await session.execute(stmt)
+        return result.scalar()
+
+
+async def get_chat_history(
+        session: AsyncSession,
+        profile_id: int,
+        chat_id: int,
+        before_id: int,
+        min_id: int,
+        limit: int,
+) -> list:
+    """Страница истории чата из хранилища: min_id <= id < before_id, от новых к старым"""
+    stmt = (
+        select(
+            TelegramMessage.chat_id,
+            TelegramMessage.message_id,
+            TelegramMessage.chat_name,
+            TelegramMessage.sender_name,
+            TelegramMessage.text,
+            TelegramMessage.date,
+        )
+        .where(
+            TelegramMessage.profile_id == profile_id,
+            TelegramMessage.chat_id == chat_id,
+            TelegramMessage.message_id < before_id,
+            TelegramMessage.message_id >= min_id,
+        )
+        .order_by(TelegramMessage.message_id.desc())
+        .limit(limit)
+    )
+    async with session as session:
+        result = await session.execute(stmt)
+        return list(result.mappings())
+
+
+async def get_profile_history(
+        session: AsyncSession,
+        profile_id: int,
+        before: tuple[datetime, int, int] | None,
+        limit: int,
+) -> list:
+    """
+    Сохранённые сообщения всех чатов профиля по дате, от новых к старым.
+    before — ключ (date, chat_id, message_id) последнего сообщения прошлой страницы.
+    """
+    stmt = select(
+        TelegramMessage.chat_id,
+        TelegramMessage.message_id,
+        TelegramMessage.chat_name,
+        TelegramMessage.sender_name,
+        TelegramMessage.text,
+        TelegramMessage.date,
+    ).where(TelegramMessage.profile_id == profile_id)
+    if before is not None:
+        stmt = stmt.where(
+            tuple_(TelegramMessage.date, TelegramMessage.chat_id, TelegramMessage.message_id) < tuple_(*before)
+        )
+    stmt = stmt.order_by(
+        TelegramMessage.date.desc(),
+        TelegramMessage.chat_id.desc(),
+        TelegramMessage.message_id.desc(),
+    ).limit(limit)
+    async with session as session:
+        result = await session.execute(stmt)
+        return list(result.mappings())
+
+
+async def save_history_page(
+        session: AsyncSession,
+        profile_id: int,
+        chat_id: int,
+        rows: list[dict],
+        min_id: int,
+        max_id: int,
+        reached_start: bool,
+):
+    """
+    Одной транзакцией: сохранить страницу истории, полученную из Telegram,
+    и записать непрерывный участок [min_id, max_id], который она покрывает.
+    """
+    stmt = insert(TelegramHistoryRange).values(
+        profile_id=profile_id,
+        chat_id=chat_id,
+        min_id=min_id,
+        max_id=max_id,
+        reached_start=reached_start,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TelegramHistoryRange.profile_id, TelegramHistoryRange.chat_id],
+        set_={
+            "min_id": stmt.excluded.min_id,
+            "max_id": stmt.excluded.max_id,
+            "reached_start": stmt.excluded.reached_start,
+            "updated_at": datetime.now(),
+        },
+    )
+    async with session as session:
+        for upsert in _upsert_statements(rows, update_read=False):
+            await session.execute(upsert)
+        await session.execute(stmt)
+        await session.commit()
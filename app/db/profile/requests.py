@@ -1,11 +1,14 @@
 from datetime import datetime
 
 from typing import Sequence
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.profile.models import TelegramProfile
 
+# phone_code_hash=None означает «очистить», поэтому «не передан» — отдельное значение
+_UNSET = object()
+
 
 async def get_profile_by_phone(session: AsyncSession, phone: str) -> TelegramProfile | None:
     stmt = select(TelegramProfile).where(TelegramProfile.phone == phone)
@@ -46,27 +49,44 @@ async def update_profile(
         profile: TelegramProfile,
         *,
         is_authorized: bool | None = None,
-        phone_code_hash: str | None = None,
+        phone_code_hash=_UNSET,
         first_name: str | None = None,
         last_name: str | None = None,
         username: str | None = None,
 ) -> TelegramProfile:
+    """
+    Один UPDATE только по переданным полям, без refresh.
+    last_login здесь не трогаем — его пишет activity_writer.
+    """
+    values = {}
     if is_authorized is not None:
-        profile.is_authorized = is_authorized
-    if phone_code_hash is not None:
-        profile.phone_code_hash = phone_code_hash
+        values["is_authorized"] = is_authorized
+    if phone_code_hash is not _UNSET:
+        values["phone_code_hash"] = phone_code_hash
     if first_name is not None:
-        profile.first_name = first_name
+        values["first_name"] = first_name
     if last_name is not None:
-        profile.last_name = last_name
+        values["last_name"] = last_name
     if username is not None:
-        profile.username = username
-    profile.last_login = datetime.now()
+        values["username"] = username
+    values = {key: value for key, value in values.items() if getattr(profile, key) != value}
+    if not values:
+        return profile
+
+    stmt = update(TelegramProfile).where(TelegramProfile.id == profile.id).values(**values)
     async with session as session:
-        session.add(profile)
+        await session.execute(stmt)
+        await session.commit()
+    for key, value in values.items():
+        setattr(profile, key, value)
+    return profile
+
+
+async def set_profile_authorized(session: AsyncSession, profile_id: int, is_authorized: bool):
+    stmt = update(TelegramProfile).where(TelegramProfile.id == profile_id).values(is_authorized=is_authorized)
+    async with session as session:
+        await session.execute(stmt)
         await session.commit()
-        await session.refresh(profile)
-        return profile
 
 
 async def get_users_profiles(session: AsyncSession, user_id) -> Sequence[TelegramProfile]:
@@ -74,3 +94,13 @@ async def get_users_profiles(session: AsyncSession, user_id) -> Sequence[Telegra
     async with session as session:
         result = await session.execute(stmt)
         return result.unique().scalars().all()
+
+
+async def update_last_login(session: AsyncSession, last_login: dict[int, datetime]):
+    """Время активности нескольких профилей одним UPDATE по первичному ключу (executemany)"""
+    async with session as session:
+        await session.execute(
+            update(TelegramProfile),
+            [{"id": profile_id, "last_login": at} for profile_id, at in last_login.items()],
+        )
+        await session.commit()
@@ -1,4 +1,6 @@
-from sqlalchemy import select
+from dataclasses import dataclass
+
+from sqlalchemy import select, update, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.profile.models import TelegramProfile
@@ -45,12 +47,108 @@ async def update_session(
         is_active: bool | None = None,
         session_string: str | None = None,
 ) -> TelegramSession:
-    if is_active is not None:
-        tg_session.is_active = is_active
-    if session_string is not None:
-        tg_session.session_string = session_string
+    """Записать только изменившиеся поля; если ничего не изменилось — запроса нет"""
+    values = {}
+    if is_active is not None and is_active != tg_session.is_active:
+        values["is_active"] = is_active
+    if session_string is not None and session_string != tg_session.session_string:
+        values["session_string"] = session_string
+    if not values:
+        return tg_session
+
+    stmt = update(TelegramSession).where(TelegramSession.id == tg_session.id).values(**values)
     async with session as session:
-        session.add(tg_session)
+        await session.execute(stmt)
         await session.commit()
-        await session.refresh(tg_session)
-        return tg_session
+    for key, value in values.items():
+        setattr(tg_session, key, value)
+    return tg_session
+
+
+@dataclass(frozen=True)
+class ProfileSession:
+    """Профиль пользователя вместе с его активной сессией Telegram"""
+    profile_id: int
+    phone: str
+    is_authorized: bool
+    session_id: int | None
+    session_string: str | None
+
+
+async def get_profile_session(
+        session: AsyncSession,
+        user_id: int,
+        phone: str,
+) -> ProfileSession | None:
+    """
+    Одним запросом: профиль по телефону с проверкой владельца и его
+    активная сессия (если есть). None — профиль не найден или чужой.
+    """
+    stmt = (
+        select(
+            TelegramProfile.id,
+            TelegramProfile.phone,
+            TelegramProfile.is_authorized,
+            TelegramSession.id,
+            TelegramSession.session_string,
+        )
+        .outerjoin(
+            TelegramSession,
+            and_(
+                TelegramSession.profile_id == TelegramProfile.id,
+                TelegramSession.is_active.is_(True),
+            ),
+        )
+        .where(
+            TelegramProfile.phone == phone,
+            TelegramProfile.user_id == user_id,
+        )
+        .order_by(TelegramSession.id.desc())
+        .limit(1)
+    )
+    async with session as session:
+        result = await session.execute(stmt)
+        row = result.first()
+        if row is None:
+            return None
+        return ProfileSession(*row)
+
+
+async def deactivate_tg_session(session: AsyncSession, session_id: int):
+    stmt = update(TelegramSession).where(TelegramSession.id == session_id).values(is_active=False)
+    async with session as session:
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def update_session_strings(session: AsyncSession, session_strings: dict[int, str]):
+    """Строки нескольких сессий одним UPDATE по первичному ключу (executemany)"""
+    async with session as session:
+        await session.execute(
+            update(TelegramSession),
+            [{"id": session_id, "session_string": value} for session_id, value in session_strings.items()],
+        )
+        await session.commit()
+
+
+async def get_authorized_profile_sessions(session: AsyncSession) -> list[ProfileSession]:
+    """Все авторизованные профили с их последней активной сессией"""
+    stmt = (
+        select(
+            TelegramProfile.id,
+            TelegramProfile.phone,
+            TelegramProfile.is_authorized,
+            TelegramSession.id,
+            TelegramSession.session_string,
+        )
+        .join(TelegramSession, TelegramSession.profile_id == TelegramProfile.id)
+        .where(
+            TelegramProfile.is_authorized.is_(True),
+            TelegramSession.is_active.is_(True),
+        )
+        .order_by(TelegramProfile.id, TelegramSession.id.desc())
+        .distinct(TelegramProfile.id)
+    )
+    async with session as session:
+        result = await session.execute(stmt)
+        return [ProfileSession(*row) for row in result.all()]
@@ -1,4 +1,4 @@
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.user.models import User
@@ -32,4 +32,11 @@ async def create_user(
         session.add(user)
         await session.commit()
         await session.refresh(user)
-        return user
\ No newline at end of file
+        return user
+
+
+async def update_password_hash(session: AsyncSession, user_id: int, password_hash: str):
+    stmt = update(User).where(User.id == user_id).values(password_hash=password_hash)
+    async with session as session:
+        await session.execute(stmt)
+        await session.commit()
@@ -1,10 +1,22 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
+from app.config.config import get_settings
 from app.db.base import Base
 from app.db.database import engine
-from app.middleware.logging import LoggingMiddleware
+from app.middleware.logging import LoggingMiddleware, install_error_dedup, log_listener
+from app.middleware.metrics import MetricsMiddleware
 from app.routers.router import router
+from app.services.activity import activity_writer
+from app.services.broadcast import batch_scheduler
+from app.services.cache import close_redis
+from app.services.client_pool import client_pool
+from app.services.crypto import shutdown_crypto_executor
+from app.services.message_sync import message_sync
+from app.services.read_ack import read_ack_queue
+from app.services.session_writer import session_writer
+
+settings = get_settings()
 
 
 async def init_models():
@@ -14,8 +26,24 @@ async def init_models():
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
+    log_listener.start()  # поток, который пишет логи запросов вне event loop
     await init_models()  # создаём таблицы асинхронно
+    await session_writer.start()
+    await activity_writer.start()
+    await client_pool.start()
+    await read_ack_queue.start()
+    if settings.UNREAD_FROM_STORE:
+        await message_sync.start()  # закреплённые клиенты слушают входящие всех профилей
     yield
+    await batch_scheduler.close()
+    await message_sync.close()  # дописываем накопленные сообщения в БД
+    await read_ack_queue.close()  # досылаем отложенные отметки о прочтении
+    await client_pool.close()  # отключаем клиентов, изменившиеся сессии уходят в session_writer
+    await session_writer.close()  # дописываем несохранённые строки сессий
+    await activity_writer.close()  # и время активности профилей
+    shutdown_crypto_executor()
+    await close_redis()
+    log_listener.stop()  # дописываем оставшиеся в очереди логи
 
 
 def get_application():
@@ -30,7 +58,9 @@ def get_application():
     )
 
     application.include_router(router)
+    install_error_dedup()
     application.add_middleware(LoggingMiddleware)
+    application.add_middleware(MetricsMiddleware)
 
     return application
 
@@ -1,3 +1,6 @@
+import json
+import time
+from dataclasses import dataclass
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status, Cookie, Response, Request
@@ -13,12 +16,101 @@ from app.config.config import get_settings
 from app.db.database import get_db
 from app.db.user.models import User
 from app.db.user.requests import get_user_by_id
+from app.services.cache import MISSING, Codec, CacheBackend, create_cache_backend
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 security = HTTPBearer(auto_error=False)
 
 
+@dataclass(frozen=True)
+class Principal:
+    """Аутентифицированный пользователь: то, что нужно обработчикам от User"""
+    id: int
+    email: str
+    created_at: datetime
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, created_at=user.created_at)
+
+
+class PrincipalCodec(Codec):
+    """Principal как JSON-массив [id, email, created_at]"""
+
+    def dumps(self, principal: Principal) -> bytes:
+        return json.dumps(
+            [principal.id, principal.email, principal.created_at.isoformat()],
+            separators=(",", ":"),
+        ).encode()
+
+    def loads(self, data: bytes) -> Principal:
+        user_id, email, created_at = json.loads(data)
+        return Principal(id=user_id, email=email, created_at=datetime.fromisoformat(created_at))
+
+
+class PrincipalCache:
+    """
+    Кэш проверенных access токенов, ключ — подпись токена.
+
+    Запись живёт не дольше ttl и не дольше срока действия самого токена,
+    поэтому повторный запрос с тем же токеном не проверяет подпись и не
+    ходит в БД. Все токены пользователя можно сбросить через invalidate_user.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.ttl = ttl
+        self.backend = backend
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return token.rsplit(".", 1)[-1]
+
+    @staticmethod
+    def _user_tag(user_id: int) -> str:
+        return f"user:{user_id}"
+
+    async def get(self, token: str) -> Principal | None:
+        principal = await self.backend.get(self._key(token))
+        return None if principal is MISSING else principal
+
+    async def set(self, token: str, principal: Principal, expires_at: float):
+        ttl = min(self.ttl, expires_at - time.time())
+        await self.backend.set(self._key(token), principal, ttl, tags=(self._user_tag(principal.id),))
+
+    async def invalidate_token(self, token: str):
+        await self.backend.delete(self._key(token))
+
+    async def invalidate_user(self, user_id: int):
+        await self.backend.delete_tag(self._user_tag(user_id))
+
+
+principal_cache = PrincipalCache(
+    create_cache_backend("principal", max_size=settings.PRINCIPAL_CACHE_SIZE, codec=PrincipalCodec()),
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+)
+
+
+async def forget_tokens(*tokens: str | None):
+    """
+    Выход: сбросить кэш переданных токенов и всех остальных токенов их
+    пользователя. Пользователь берётся из кэша, а если токена в нём нет —
+    из самого токена.
+    """
+    for token in {token for token in tokens if token}:
+        principal = await principal_cache.get(token)
+        user_id = principal.id if principal is not None else None
+        if user_id is None:
+            try:
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+                user_id = payload.get("user_id")
+            except JWTError:
+                pass
+        await principal_cache.invalidate_token(token)
+        if user_id is not None:
+            await principal_cache.invalidate_user(user_id)
+
+
 def create_access_token(user_id: int):
     """Создать JWT токен"""
     expire = datetime.now() + timedelta(
@@ -47,8 +139,7 @@ def create_refresh_token(user_id: int) -> str:
     return encoded_jwt
 
 
-def create_tokens(user_id: int) -> dict:
-    """Создать пару access и refresh токенов"""
+def _create_token_pair(user_id: int) -> dict:
     return {
         "access_token": create_access_token(user_id),
         "refresh_token": create_refresh_token(user_id),
@@ -56,6 +147,15 @@ def create_tokens(user_id: int) -> dict:
     }
 
 
+async def create_tokens(user_id: int) -> dict:
+    """
+    Создать пару access и refresh токенов. HS256 по короткому токену — микросекунды,
+    поэтому подпись идёт прямо в event loop: пул crypto занят хэшированием паролей,
+    и очередь к нему только задержала бы выдачу токенов во время волны логинов.
+    """
+    return _create_token_pair(user_id)
+
+
 def clear_auth_cookies(response: Response):
     """Удалить токены из cookies"""
     response.delete_cookie(key="access_token")
@@ -90,7 +190,7 @@ async def get_current_user(
         credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
         access_token: Optional[str] = Cookie(None),
         db: AsyncSession = Depends(get_db)
-) -> User:
+) -> Principal:
     """Получить текущего пользователя по access токену"""
 
     jwt_token = None
@@ -106,6 +206,11 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    principal = await principal_cache.get(jwt_token)
+    if principal is not None:
+        request.state.user = principal
+        return principal
+
     try:
         payload = jwt.decode(
             jwt_token,
@@ -130,7 +235,7 @@ async def get_current_user(
                 headers={"WWW-Authenticate": "Bearer"},
             )
     except JWTError as e:
-        logger.error(f"JWT decode error: {e}")
+        logger.error("JWT decode error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
@@ -144,8 +249,10 @@ async def get_current_user(
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    request.state.user = user
-    return user
+    principal = Principal.from_user(user)
+    await principal_cache.set(jwt_token, principal, payload["exp"])
+    request.state.user = principal
+    return principal
 
 
 async def verify_refresh_token(
@@ -182,7 +289,7 @@ async def verify_refresh_token(
                 detail="Invalid refresh token"
             )
     except JWTError as e:
-        logger.error(f"JWT decode error: {e}")
+        logger.error("JWT decode error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token"
@@ -1,10 +1,21 @@
 import json
 import logging
+import queue
+import random
 import time
 import traceback
-from typing import Callable
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config.config import get_settings
+from app.services.metrics import Gauge
+from app.services.timings import RequestTimings, request_timings
+
+settings = get_settings()
+
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
@@ -21,55 +32,237 @@ class JsonFormatter(logging.Formatter):
                 'message': record.getMessage(),
                 'time': self.formatTime(record, '%Y-%m-%d %H:%M:%S'),
             }
+            if getattr(record, 'repeated', 0):
+                log_obj['repeated'] = record.repeated
             return json.dumps(log_obj, ensure_ascii=False)
 
 
+class BoundedQueueHandler(QueueHandler):
+    """
+    Кладёт записи в ограниченную очередь, из которой их пишет отдельный поток.
+
+    Форматирование и запись в поток вывода происходят в потоке QueueListener,
+    а не в event loop. Если очередь заполнена, запись отбрасывается
+    (overflow="drop_new") или вытесняет самую старую (overflow="drop_oldest");
+    число потерянных записей считается в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "drop_new"):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Форматирует JsonFormatter в потоке-писателе, здесь запись не трогаем
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == "drop_oldest":
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass
+            self.dropped += 1
+
+
+class LogSampler:
+    """
+    Решает, писать ли в лог успешный запрос.
+
+    Доля записей задаётся для шаблона маршрута (route_rates) или общая (rate).
+    Если budget > 0 и за прошлую секунду успешных запросов было больше budget,
+    доля дополнительно урезается до budget / их число — объём логов под
+    нагрузкой не растёт вместе с RPS. Медленные запросы и ответы с ошибкой
+    сюда не попадают: их пишут всегда.
+    """
+
+    def __init__(self, rate: float, route_rates: dict[str, float], budget: int):
+        self.rate = rate
+        self.route_rates = route_rates
+        self.budget = budget
+        self._second = 0
+        self._count = 0
+        self._previous = 0
+
+    def sample_rate(self, route: str) -> float:
+        """Доля, с которой сейчас пишется успешный запрос маршрута route"""
+        rate = self.route_rates.get(route, self.rate)
+        if not self.budget:
+            return rate
+        second = int(time.monotonic())
+        if second != self._second:
+            self._previous = self._count if second == self._second + 1 else 0
+            self._second = second
+            self._count = 0
+        self._count += 1
+        if self._previous > self.budget:
+            rate = min(rate, self.budget / self._previous)
+        return rate
+
+    def keep(self, route: str) -> float | None:
+        """Доля для поля sample_rate, если запись оставлена, иначе None"""
+        rate = self.sample_rate(route)
+        if rate >= 1 or random.random() < rate:
+            return rate
+        return None
+
+
+class ErrorDeduplicationFilter(logging.Filter):
+    """
+    Схлопывает повторы одинаковых предупреждений и ошибок.
+
+    Запись с тем же логгером, уровнем и текстом, что уже была в последние
+    window секунд, отбрасывается; первая запись после окна получает поле
+    repeated — сколько повторов было пропущено. Помнит не больше max_keys
+    разных сообщений, самые давние забываются.
+    """
+
+    def __init__(self, window: float, max_keys: int = 1000):
+        super().__init__()
+        self.window = window
+        self.max_keys = max_keys
+        self._seen: OrderedDict[tuple, list] = OrderedDict()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.window <= 0 or isinstance(record.msg, dict):
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is not None and now - seen[0] < self.window:
+            seen[1] += 1
+            return False
+
+        self._seen[key] = [now, 0]
+        self._seen.move_to_end(key)
+        if len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+        if seen is not None and seen[1]:
+            record.repeated = seen[1]
+            record.msg = f"{record.getMessage()} (повторов за {self.window:g} с: {seen[1]})"
+            record.args = None
+        return True
+
+
+log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+queue_handler = BoundedQueueHandler(log_queue, overflow=settings.LOG_QUEUE_OVERFLOW)
+
+Gauge("log_queue_dropped_records", "Записи лога, отброшенные при переполнении очереди").set_function(
+    lambda: queue_handler.dropped)
+Gauge("log_queue_size", "Записи лога в очереди на запись").set_function(log_queue.qsize)
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(JsonFormatter())
+log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
 logger = logging.getLogger('fastapi_app.middleware')
 logger.setLevel(logging.INFO)
 logger.propagate = False
-handler = logging.StreamHandler()
-handler.setFormatter(JsonFormatter())
-logger.addHandler(handler)
+logger.addHandler(queue_handler)
+
+log_sampler = LogSampler(settings.LOG_SAMPLE_RATE, settings.LOG_SAMPLE_RATES, settings.LOG_SUCCESS_BUDGET)
+error_dedup = ErrorDeduplicationFilter(settings.LOG_DEDUP_WINDOW)
+
+
+def install_error_dedup():
+    """Подключить схлопывание повторов к обработчикам корневого логгера (логи сервисов)"""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(error_dedup)
+
 
+class LoggingMiddleware:
+    """
+    Чистый ASGI middleware логирования запросов.
+
+    Не оборачивает ответ в отдельную задачу и не буферизует тело: сообщения
+    ответа проходят дальше как есть, статус запоминается из
+    http.response.start, а запись в лог делается, когда ушёл последний кусок
+    тела (для потоковых ответов — после окончания потока).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable):
         start = time.perf_counter()
+        status_code = 500
+        logged = False
+        timings = RequestTimings()
+        token = request_timings.set(timings)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, logged
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                logged = True
+                self.log(scope, status_code, start, time.perf_counter(), timings)
 
         try:
-            response = await call_next(request)
-            end = time.perf_counter()
-            await self.log(request, response, start, end)
-            return response
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
-            end = time.perf_counter()
-            await self.log_exception(request, e, start, end)
+            if not logged:
+                self.log_exception(scope, e, start, time.perf_counter(), timings)
             raise
+        finally:
+            request_timings.reset(token)
 
     @staticmethod
-    async def log(request: Request, response: Response, start: float, end: float):
-        request_duration_ms = round((end - start) * 1000, 2)
-
+    def _request_info(scope: Scope) -> dict:
         # Получение пользователя (если используется аутентификация)
-        user = getattr(request.state, 'user', None)
+        user = scope.get('state', {}).get('user')
         username = getattr(user, 'email', '') if user else ''
 
         # Получение IP адреса
-        user_ip = request.headers.get('X-Real-IP') or \
-                  request.headers.get('X-Forwarded-For', '').split(',')[0] or \
-                  request.client.host if request.client else ''
+        headers = Headers(scope=scope)
+        client = scope.get('client')
+        user_ip = headers.get('X-Real-IP') or \
+                  headers.get('X-Forwarded-For', '').split(',')[0] or \
+                  (client[0] if client else '')
 
-        log_data = {
-            'http_code': response.status_code,
+        path = scope.get('root_path', '') + scope['path']
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        host = headers.get('host') or (scope['server'][0] if scope.get('server') else '')
+        request_url = f"{scope.get('scheme', 'http')}://{host}{path}"
+        if query_string:
+            request_url += f"?{query_string}"
+
+        return {
             'username': username,
             'user_ip': user_ip,
-            'request_method': request.method,
-            'request_url': str(request.url),
-            'request_path': request.url.path,
-            'request_duration_ms': request_duration_ms,
+            'request_method': scope['method'],
+            'request_url': request_url,
+            'request_path': scope['path'],
+        }
+
+    @classmethod
+    def log(cls, scope: Scope, status_code: int, start: float, end: float, timings: RequestTimings = None):
+        duration_ms = round((end - start) * 1000, 2)
+        sample_rate = 1.0
+        # ошибки и медленные запросы пишутся всегда, остальное — по доле маршрута
+        if status_code < 400 and duration_ms < settings.LOG_SLOW_REQUEST_MS:
+            route = getattr(scope.get('route'), 'path', scope['path'])
+            sample_rate = log_sampler.keep(route)
+            if sample_rate is None:
+                return
+
+        log_data = {
+            'http_code': status_code,
+            **cls._request_info(scope),
+            'request_duration_ms': duration_ms,
+            **(timings or RequestTimings()).log_fields(),
+            'sample_rate': sample_rate,
         }
 
-        status_code = response.status_code
         if status_code >= 500:
             logger.error(msg=log_data)
         elif status_code >= 400:
@@ -77,25 +270,14 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         else:
             logger.info(msg=log_data)
 
-    @staticmethod
-    async def log_exception(request: Request, exception: Exception, start: float, end: float):
-        request_duration_ms = round((end - start) * 1000, 2)
-
-        user = getattr(request.state, 'user', None)
-        username = getattr(user, 'email', '') if user else ''
-
-        user_ip = request.headers.get('X-Real-IP') or \
-                  request.headers.get('X-Forwarded-For', '').split(',')[0] or \
-                  request.client.host if request.client else ''
-
+    @classmethod
+    def log_exception(cls, scope: Scope, exception: Exception, start: float, end: float,
+                      timings: RequestTimings = None):
         log_data = {
             'http_code': 500,
-            'username': username,
-            'user_ip': user_ip,
-            'request_method': request.method,
-            'request_url': str(request.url),
-            'request_path': request.url.path,
-            'request_duration_ms': request_duration_ms,
+            **cls._request_info(scope),
+            'request_duration_ms': round((end - start) * 1000, 2),
+            **(timings or RequestTimings()).log_fields(),
             'exception': str(exception),
             'exception_type': type(exception).__name__,
             'traceback': traceback.format_exc(),
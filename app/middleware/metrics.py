@@ -0,0 +1,66 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import Counter, Gauge, Histogram
+
+http_requests = Counter("http_requests_total", "HTTP запросы", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "Время обработки HTTP запроса", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP запросы в обработке", ("method",))
+
+UNMATCHED_ROUTE = "<unmatched>"
+# Методы вне этого списка пишутся одной меткой — клиент не должен плодить серии
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+OTHER_METHOD = "other"
+
+
+def _route(scope: Scope) -> str:
+    """Шаблон маршрута (/messages/send/batch/{job_id}), а не сам путь — чтобы не плодить метки"""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+
+def _method(scope: Scope) -> str:
+    method = scope["method"]
+    return method if method in HTTP_METHODS else OTHER_METHOD
+
+
+class MetricsMiddleware:
+    """Чистый ASGI middleware: число, статусы и время запросов по маршрутам, запросы в обработке"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = _method(scope)
+        in_flight = http_requests_in_flight.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+        status_code = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            recorded = True
+            in_flight.dec()
+            route = _route(scope)
+            http_requests.labels(method, route, str(status_code)).inc()
+            http_request_duration.labels(method, route).observe(time.perf_counter() - start)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not recorded:
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not recorded:
+                record()
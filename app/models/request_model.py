@@ -1,4 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from typing import Literal
+
+from pydantic import BaseModel, EmailStr, Field, model_validator
 
 
 class RegisterRequest(BaseModel):
@@ -27,7 +29,24 @@ class PasswordRequest(BaseModel):
 
 class MessagesRequest(BaseModel):
     phone: str
-    limit: int = 50
+    limit: int = Field(50, ge=1, le=100)
+    read_ack: Literal["sync", "deferred", "none"] = "deferred"
+
+
+class AllMessagesRequest(BaseModel):
+    limit: int = Field(50, ge=1, le=100)
+    read_ack: Literal["sync", "deferred", "none"] = "deferred"
+
+
+class MessagesStreamRequest(MessagesRequest):
+    format: Literal["ndjson", "sse"] = "ndjson"
+
+
+class MessagesHistoryRequest(BaseModel):
+    phone: str
+    peer_id: int | None = None
+    cursor: str | None = None
+    limit: int = Field(50, ge=1, le=100)
 
 
 class SendMessageRequest(BaseModel):
@@ -36,6 +55,34 @@ class SendMessageRequest(BaseModel):
     tg_receiver: str
 
 
+class SendBatchRequest(BaseModel):
+    """
+    Пакетная отправка: один текст от phone всем tg_receivers
+    и/или произвольные сообщения в messages (в том числе от разных профилей).
+    """
+    phone: str | None = None
+    text: str | None = None
+    tg_receivers: list[str] = []
+    messages: list[SendMessageRequest] = []
+    wait: bool = False
+
+    @model_validator(mode="after")
+    def check_broadcast(self):
+        if self.tg_receivers and (self.phone is None or self.text is None):
+            raise ValueError("phone и text обязательны вместе с tg_receivers")
+        return self
+
+    def expand(self) -> list[dict]:
+        messages = [
+            {"phone": self.phone, "text": self.text, "tg_receiver": receiver}
+            for receiver in self.tg_receivers
+        ]
+        messages.extend(message.model_dump() for message in self.messages)
+        return messages
+
+
 class DialogsRequest(BaseModel):
     phone: str
-    limit: int = 50
+    # не больше одного запроса messages.getDialogs (100 диалогов) на страницу
+    limit: int = Field(50, ge=1, le=100)
+    cursor: str | None = None
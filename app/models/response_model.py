@@ -0,0 +1,118 @@
+from typing import Literal
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+
+from app.services.timings import timed
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ через orjson без jsonable_encoder и повторной валидации.
+
+    Сервисы уже собирают ответ из простых типов (даты — строками ISO), и
+    его структура описана response_model маршрута, поэтому словарь сразу
+    кодируется в байты. Время кодирования идёт в serialize_ms запроса.
+    """
+
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return orjson.dumps(content)
+
+
+class UnreadMessage(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    id: int
+    from_: str | None = Field(alias="from")
+    text: str | None
+    date: str
+    chat_name: str | None
+    chat_id: int
+
+
+class UnreadMessagesResponse(BaseModel):
+    status: Literal["success"]
+    count: int
+    messages: list[UnreadMessage]
+
+
+class ProfileUnreadMessage(UnreadMessage):
+    phone: str
+
+
+class ProfileUnreadResult(BaseModel):
+    phone: str
+    status: Literal["success", "error"]
+    count: int | None = None
+    message: str | None = None
+
+
+class AllUnreadMessagesResponse(BaseModel):
+    status: Literal["success", "partial"]
+    count: int
+    profiles: list[ProfileUnreadResult]
+    messages: list[ProfileUnreadMessage]
+
+
+class HistoryResponse(BaseModel):
+    status: Literal["success"]
+    count: int
+    messages: list[UnreadMessage]
+    next_cursor: str | None
+    source: Literal["store", "telegram"]
+
+
+class SendMessageResponse(BaseModel):
+    status: Literal["success"]
+    message: str
+
+
+class BatchResult(BaseModel):
+    phone: str
+    tg_receiver: str
+    status: Literal["pending", "sent", "error"]
+    message: str | None
+
+
+class BatchJobResponse(BaseModel):
+    status: Literal["running", "done"]
+    job_id: str
+    total: int
+    sent: int
+    failed: int
+    pending: int
+    results: list[BatchResult] | None = None
+
+
+class Dialog(BaseModel):
+    id: int
+    peer_id: int
+    name: str
+    unread_count: int
+    is_group: bool
+    is_channel: bool
+
+
+class DialogsResponse(BaseModel):
+    status: Literal["success"]
+    dialogs: list[Dialog]
+    next_cursor: str | None
+
+
+class Profile(BaseModel):
+    id: int
+    phone: str
+    is_authorized: bool
+    is_active: bool
+    first_name: str | None
+    last_name: str | None
+    username: str | None
+    created_at: str
+    last_login: str | None
+
+
+class ProfilesResponse(BaseModel):
+    status: Literal["success"]
+    profiles: list[Profile]
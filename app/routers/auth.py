@@ -1,4 +1,3 @@
-import hashlib
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException
@@ -7,9 +6,10 @@ from starlette.responses import JSONResponse
 
 from app.config.config import get_settings
 from app.db.database import get_db
-from app.db.user.requests import get_app_user, create_user
-from app.middleware.jwt import create_tokens, set_auth_cookies
+from app.db.user.requests import get_app_user, create_user, update_password_hash
+from app.middleware.jwt import create_tokens, set_auth_cookies, principal_cache
 from app.models.request_model import RegisterRequest, LoginRequest
+from app.services.crypto import hash_password, verify_password, needs_rehash
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,12 +35,12 @@ class AuthRouter:
             existing_user = await get_app_user(db, payload.email)
             if existing_user:
                 raise HTTPException(status_code=400, detail="Email already registered")
-            password_hash = hashlib.sha256(payload.password.encode()).hexdigest()
+            password_hash = await hash_password(payload.password)
             user = await create_user(db, payload.email, password_hash)
 
-            tokens = create_tokens(user.id)
+            tokens = await create_tokens(user.id)
 
-            logger.info(f"User {payload.email} registered")
+            logger.info("User %s registered", payload.email)
 
             response = JSONResponse(
                 content={"detail": "registered"},
@@ -50,7 +50,7 @@ class AuthRouter:
             return response
 
         except Exception as e:
-            logger.error(f"Registration error: {e}")
+            logger.error("Registration error: %s", e)
             raise HTTPException(status_code=400, detail=str(e))
 
     @staticmethod
@@ -60,12 +60,17 @@ class AuthRouter:
     ):
         try:
             user = await get_app_user(db, payload.email)
-            password_hash = hashlib.sha256(payload.password.encode()).hexdigest()
-            if not user or user.password_hash != password_hash:
+            # пароль проверяется и для неизвестного email, иначе его выдаёт время ответа
+            if not await verify_password(payload.password, user.password_hash if user else None) or not user:
                 raise HTTPException(status_code=401, detail="Invalid credentials")
-            tokens = create_tokens(user.id)
+            if needs_rehash(user.password_hash):
+                # старый sha256 или устаревшие параметры — перехэшируем, пока пароль известен
+                await update_password_hash(db, user.id, await hash_password(payload.password))
+                # хэш пароля изменился — закэшированные токены пользователя проверяются заново
+                await principal_cache.invalidate_user(user.id)
+            tokens = await create_tokens(user.id)
 
-            logger.info(f"User {payload.email} logged in")
+            logger.info("User %s logged in", payload.email)
 
             response = JSONResponse(
                 content={"detail": "logged in"},
@@ -75,5 +80,5 @@ class AuthRouter:
             return response
 
         except Exception as e:
-            logger.error(f"Login error: {e}")
+            logger.error("Login error: %s", e)
             raise HTTPException(status_code=401, detail=str(e))
@@ -1,11 +1,32 @@
+import orjson
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.database import get_db
-from app.db.user.models import User
-from app.middleware.jwt import get_current_user
-from app.models.request_model import SendMessageRequest, DialogsRequest, MessagesRequest
-from app.services.messages import get_unread_messages, send_message, get_dialogs
+from app.middleware.jwt import get_current_user, Principal
+from app.models.request_model import SendMessageRequest, DialogsRequest, MessagesRequest, MessagesStreamRequest, \
+    SendBatchRequest, MessagesHistoryRequest, AllMessagesRequest
+from app.models.response_model import FastJSONResponse, UnreadMessagesResponse, AllUnreadMessagesResponse, \
+    HistoryResponse, SendMessageResponse, BatchJobResponse, DialogsResponse
+from app.services.broadcast import send_batch, get_batch_status
+from app.services.messages import get_unread_messages, send_message, get_dialogs, stream_unread_messages, \
+    get_history, get_all_unread_messages
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+async def _encode_stream(records, stream_format: str):
+    """Закодировать записи потока в NDJSON или Server-Sent Events"""
+    async for record in records:
+        data = orjson.dumps(record)
+        if stream_format == "sse":
+            yield b"event: " + record["type"].encode() + b"\ndata: " + data + b"\n\n"
+        else:
+            yield data + b"\n"
 
 
 class MessagesRouter:
@@ -14,27 +35,81 @@ class MessagesRouter:
         self._register_routes()
 
     def _register_routes(self):
-        self.router.post("/messages/unread")(self.get_messages_endpoint)
-        self.router.post("/messages/send")(self.send_message_endpoint)
-        self.router.post("/messages/dialogs")(self.get_dialogs_endpoint)
+        # Ответы кодируются FastJSONResponse, response_model описывает их схему; FastAPI
+        # ответ по ней не проверяет, соответствие ответов сервисов схеме проверяют тесты
+        self.router.post("/messages/unread", response_model=UnreadMessagesResponse)(self.get_messages_endpoint)
+        self.router.post("/messages/unread/stream")(self.stream_messages_endpoint)
+        self.router.post("/messages/unread/all", response_model=AllUnreadMessagesResponse)(
+            self.get_all_messages_endpoint)
+        self.router.post("/messages/history", response_model=HistoryResponse)(self.get_history_endpoint)
+        self.router.post("/messages/send", response_model=SendMessageResponse)(self.send_message_endpoint)
+        self.router.post("/messages/send/batch", response_model=BatchJobResponse)(self.send_batch_endpoint)
+        self.router.get("/messages/send/batch/{job_id}", response_model=BatchJobResponse)(self.get_batch_endpoint)
+        self.router.post("/messages/dialogs", response_model=DialogsResponse)(self.get_dialogs_endpoint)
 
     @staticmethod
     async def get_messages_endpoint(
             request: MessagesRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
+            db: AsyncSession = Depends(get_db)
+    ):
+        result = await get_unread_messages(db, user.id, request.phone, request.limit, request.read_ack)
+
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+
+        return FastJSONResponse(result)
+
+    @staticmethod
+    async def get_all_messages_endpoint(
+            request: AllMessagesRequest,
+            user: Principal = Depends(get_current_user),
+            db: AsyncSession = Depends(get_db)
+    ):
+        """Непрочитанные сообщения всех профилей пользователя одним запросом"""
+        result = await get_all_unread_messages(db, user.id, request.limit, request.read_ack)
+
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+
+        return FastJSONResponse(result)
+
+    @staticmethod
+    async def stream_messages_endpoint(
+            request: MessagesStreamRequest,
+            user: Principal = Depends(get_current_user),
+            db: AsyncSession = Depends(get_db)
+    ):
+        """Непрочитанные сообщения потоком, по мере загрузки диалогов"""
+        result = await stream_unread_messages(db, user.id, request.phone, request.limit, request.read_ack)
+
+        # Если вернулся словарь — это ошибка, поток не начинаем
+        if isinstance(result, dict):
+            raise HTTPException(status_code=400, detail=result["message"])
+
+        return StreamingResponse(
+            _encode_stream(result, request.format),
+            media_type=STREAM_MEDIA_TYPES[request.format],
+        )
+
+    @staticmethod
+    async def get_history_endpoint(
+            request: MessagesHistoryRequest,
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
-        result = await get_unread_messages(db, user.id, request.phone, request.limit)
+        """История сообщений постранично, по курсору next_cursor"""
+        result = await get_history(db, user.id, request.phone, request.peer_id, request.cursor, request.limit)
 
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
 
-        return result
+        return FastJSONResponse(result)
 
     @staticmethod
     async def send_message_endpoint(
             request: SendMessageRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
         """Отправить сообщение от профиля"""
@@ -43,17 +118,44 @@ class MessagesRouter:
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
 
-        return result
+        return FastJSONResponse(result)
+
+    @staticmethod
+    async def send_batch_endpoint(
+            request: SendBatchRequest,
+            user: Principal = Depends(get_current_user),
+            db: AsyncSession = Depends(get_db)
+    ):
+        """Отправить пачку сообщений через планировщик с учётом FloodWait"""
+        result = await send_batch(db, user.id, request.expand(), request.wait)
+
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["message"])
+
+        return FastJSONResponse(result)
+
+    @staticmethod
+    async def get_batch_endpoint(
+            job_id: str,
+            user: Principal = Depends(get_current_user),
+    ):
+        """Прогресс пакетной отправки"""
+        result = get_batch_status(user.id, job_id)
+
+        if result["status"] == "error":
+            raise HTTPException(status_code=404, detail=result["message"])
+
+        return FastJSONResponse(result)
 
     @staticmethod
     async def get_dialogs_endpoint(
             request: DialogsRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
-        """Получить список диалогов профиля"""
-        result = await get_dialogs(user.id, request.phone, db, request.limit)
+        """Список диалогов профиля постранично, по курсору next_cursor"""
+        result = await get_dialogs(user.id, request.phone, db, request.limit, request.cursor)
 
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
-        return result
+        return FastJSONResponse(result)
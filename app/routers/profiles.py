@@ -2,9 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.database import get_db
-from app.db.user.models import User
-from app.middleware.jwt import get_current_user
+from app.middleware.jwt import get_current_user, Principal
 from app.models.request_model import PhoneRequest, CodeRequest, PasswordRequest
+from app.models.response_model import FastJSONResponse, ProfilesResponse
 from app.services.auth import start_auth, verify_code, get_user_profiles, verify_password
 
 
@@ -14,14 +14,15 @@ class ProfilesRouter:
         self._register_routes()
 
     def _register_routes(self):
-        self.router.get("/profiles")(self.list_profiles)
+        # response_model — схема для документации, ответ FastJSONResponse по ней не проверяется
+        self.router.get("/profiles", response_model=ProfilesResponse)(self.list_profiles)
         self.router.post("/profiles/start")(self.start_auth_profile)
         self.router.post("/profiles/code")(self.auth_verify_code)
         self.router.post("/profiles/password")(self.password)
 
     @staticmethod
     async def list_profiles(
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
         """Получить все профили пользователя"""
@@ -29,12 +30,12 @@ class ProfilesRouter:
         if result["status"] == "error":
             raise HTTPException(status_code=400, detail=result["message"])
 
-        return result
+        return FastJSONResponse(result)
 
     @staticmethod
     async def start_auth_profile(
             request: PhoneRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
         """Начать авторизацию нового профиля"""
@@ -49,7 +50,7 @@ class ProfilesRouter:
     @staticmethod
     async def auth_verify_code(
             request: CodeRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
         """Подтвердить код"""
@@ -63,7 +64,7 @@ class ProfilesRouter:
     @staticmethod
     async def password(
             request: PasswordRequest,
-            user: User = Depends(get_current_user),
+            user: Principal = Depends(get_current_user),
             db: AsyncSession = Depends(get_db)
     ):
         """Подтвердить пароль 2FA"""
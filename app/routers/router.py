@@ -3,8 +3,9 @@ from app.routers.auth import AuthRouter
 from app.routers.messages import MessagesRouter
 from app.routers.profiles import ProfilesRouter
 from app.routers.utils import UtilsRouter
+from app.services.timings import TimedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 
 AuthRouter(router)
 ProfilesRouter(router)
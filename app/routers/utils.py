@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, Response
+from typing import Optional
 
+from fastapi import APIRouter, Cookie, Depends, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.db.database import get_pool_status
 from app.db.user.models import User
+from app.services.metrics import metrics_registry
+from app.services.rate_limit import rate_limiter
 from app.middleware.jwt import get_current_user, verify_refresh_token, create_tokens, set_auth_cookies, \
-    clear_auth_cookies
+    clear_auth_cookies, Principal, forget_tokens, security
 
 class UtilsRouter:
     def __init__(self, router: APIRouter):
@@ -13,7 +20,10 @@ class UtilsRouter:
         self.router.post("/refresh")(self.refresh_tokens)
         self.router.post("/logout")(self.logout)
         self.router.get("/health")(self.health)
+        self.router.get("/health/db")(self.health_db)
+        self.router.get("/health/telegram")(self.health_telegram)
         self.router.get("/me")(self.get_me)
+        self.router.get("/metrics")(self.metrics)
 
     @staticmethod
     async def health():
@@ -21,7 +31,22 @@ class UtilsRouter:
         return {"status": "ok"}
 
     @staticmethod
-    async def get_me(user: User = Depends(get_current_user)):
+    async def health_db():
+        """Состояние пула соединений с БД"""
+        return {"status": "ok", "pool": get_pool_status()}
+
+    @staticmethod
+    async def health_telegram():
+        """Очереди и ожидание ограничителя запросов к Telegram по классам методов"""
+        return {"status": "ok", "rate_limit": rate_limiter.stats()}
+
+    @staticmethod
+    async def metrics():
+        """Метрики процесса в формате Prometheus"""
+        return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @staticmethod
+    async def get_me(user: Principal = Depends(get_current_user)):
         """Получить информацию о текущем пользователе"""
         return {
             "id": user.id,
@@ -35,13 +60,18 @@ class UtilsRouter:
             user: User = Depends(verify_refresh_token)
     ):
         """Обновить access токен используя refresh токен"""
-        tokens = create_tokens(user.id)
+        tokens = await create_tokens(user.id)
         set_auth_cookies(response, tokens["access_token"], tokens["refresh_token"])
 
         return tokens
 
     @staticmethod
-    async def logout(response: Response):
-        """Выход пользователя"""
+    async def logout(
+            response: Response,
+            credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+            access_token: Optional[str] = Cookie(None),
+    ):
+        """Выход пользователя: токен из заголовка и из cookie больше не берётся из кэша"""
+        await forget_tokens(credentials.credentials if credentials else None, access_token)
         clear_auth_cookies(response)
         return {"message": "Successfully logged out"}
@@ -0,0 +1,55 @@
+import logging
+from datetime import datetime
+
+from app.config.config import get_settings
+from app.db.database import SessionLocal
+from app.db.profile.requests import update_last_login
+from app.services.worker import DelayedFlushWorker
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class ActivityWriter(DelayedFlushWorker):
+    """
+    Отложенная запись времени активности профилей (last_login).
+
+    touch только запоминает время в памяти; повторные отметки одного профиля
+    схлопываются в самую позднюю. Фоновый воркер раз в flush_interval секунд
+    пишет накопленное одним UPDATE, при остановке приложения — дописывает.
+    """
+
+    name = "Activity writer"
+
+    def __init__(self, flush_interval: float):
+        super().__init__(delay=flush_interval)
+        self._pending: dict[int, datetime] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, profile_id: int, at: datetime | None = None):
+        at = at or datetime.now()
+        previous = self._pending.get(profile_id)
+        if previous is None or previous < at:
+            self._pending[profile_id] = at
+        self.wakeup()
+
+    def last_seen(self, profile_id: int) -> datetime | None:
+        """Ещё не записанное в БД время активности профиля"""
+        return self._pending.get(profile_id)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            async with SessionLocal() as db:
+                await update_last_login(db, pending)
+        except Exception:
+            for profile_id, at in pending.items():
+                self.touch(profile_id, at)
+            raise
+
+
+activity_writer = ActivityWriter(flush_interval=settings.ACTIVITY_FLUSH_INTERVAL)
@@ -1,7 +1,9 @@
 import logging
+import time
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.sessions import StringSession
 
 from app.config.config import get_settings
@@ -9,6 +11,10 @@ from app.db.profile.requests import get_profile_by_phone, create_profile, update
     get_users_profiles, get_tg_profile
 from app.db.session.requests import get_tg_session, update_session, create_tg_session
 from app.db.user.requests import get_user_by_id
+from app.services.activity import activity_writer
+from app.services.metrics import Counter, Histogram
+from app.services.rate_limit import rate_limiter, AUTH
+from app.services.timings import add_timing, timed
 
 settings = get_settings()
 
@@ -42,7 +48,8 @@ async def _prepare_client_for_profile(
     client, session_record = await _get_client(db, phone)
 
     if not client.is_connected():
-        await client.connect()
+        with timed("tg_connect"):
+            await client.connect()
 
     return profile, client, session_record
 
@@ -55,11 +62,57 @@ async def _get_client(db: AsyncSession, phone: str):
 
     # Используем существующую сессию или создаем пустую
     session_string = session_record.session_string if session_record else None
-    session = StringSession(session_string)
 
-    client = TelegramClient(session, settings.API_ID, settings.API_HASH)
+    return _build_client(session_string), session_record
+
+
+telegram_rpc_duration = Histogram("telegram_rpc_duration_seconds", "Время RPC к Telegram", ("method",))
+telegram_rpc_errors = Counter("telegram_rpc_errors_total", "Ошибки RPC к Telegram", ("method", "error"))
+
+
+class MeteredTelegramClient(TelegramClient):
+    """
+    TelegramClient, который меряет каждый RPC (время и ошибки по методу MTProto)
+    и отчитывается о нём в текущий блок rate_limiter.limit: каждая страница
+    многостраничного вызова берёт свой токен, короткий FloodWait пережидается
+    и RPC повторяется один раз.
+    """
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        await rate_limiter.before_rpc()
+        try:
+            return await self._metered_call(request, ordered, flood_sleep_threshold)
+        except FloodWaitError as e:
+            if not await rate_limiter.flood_wait(e):
+                raise
+        return await self._metered_call(request, ordered, flood_sleep_threshold)
+
+    async def _metered_call(self, request, ordered, flood_sleep_threshold):
+        # список — несколько запросов одним контейнером, метим по первому
+        method = type(request[0] if isinstance(request, list) and request else request).__name__
+        start = time.perf_counter()
+        try:
+            return await super().__call__(request, ordered=ordered, flood_sleep_threshold=flood_sleep_threshold)
+        except Exception as e:
+            telegram_rpc_errors.labels(method, type(e).__name__).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            telegram_rpc_duration.labels(method).observe(elapsed)
+            add_timing("tg_rpc", elapsed)
+
+
+def _build_client(session_string: str | None) -> TelegramClient:
+    """
+    Создать клиент Telethon из строки сессии (None — пустая сессия).
 
-    return client, session_record
+    flood_sleep_threshold=0: Telethon не спит на FloodWait сам, а отдаёт его
+    rate_limiter, который учитывает паузу в bucket профиля и в метриках;
+    короткие паузы (TG_RATE_FLOOD_RETRY_MAX) пережидает MeteredTelegramClient.
+    """
+    return MeteredTelegramClient(
+        StringSession(session_string), settings.API_ID, settings.API_HASH, flood_sleep_threshold=0,
+    )
 
 
 async def start_auth(db: AsyncSession, user_id: int, phone: str):
@@ -82,7 +135,7 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
         profile = await get_tg_profile(db, user_id, phone)
 
         if profile and profile.is_authorized:
-            logger.info(f"User {user_id} already authorized profile {phone}")
+            logger.info("User %s already authorized profile %s", user_id, phone)
             return {
                 "status": "already_authorized",
                 "message": "Этот профиль уже авторизован",
@@ -100,7 +153,8 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
         client, session_record = await _get_client(db, phone)
 
         if not client.is_connected():
-            await client.connect()
+            with timed("tg_connect"):
+                await client.connect()
 
         # Если уже авторизован в Telethon
         if await client.is_user_authorized():
@@ -109,7 +163,8 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
                 profile,
                 is_authorized=True,
             )
-            logger.info(f"User {user_id} already authorized profile {phone}")
+            activity_writer.touch(profile.id)
+            logger.info("User %s already authorized profile %s", user_id, phone)
             return {
                 "status": "already_authorized",
                 "message": "Профиль уже авторизован в Telegram",
@@ -117,7 +172,8 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
             }
 
         # Отправить код
-        result = await client.send_code_request(phone)
+        async with rate_limiter.limit(phone, AUTH):
+            result = await client.send_code_request(phone)
 
         session_string = client.session.save()
         if session_record:
@@ -131,7 +187,8 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
             profile,
             phone_code_hash=result.phone_code_hash,
         )
-        logger.info(f"Auth started for user {user_id}, phone {phone}")
+        activity_writer.touch(profile.id)
+        logger.info("Auth started for user %s, phone %s", user_id, phone)
         return {
             "status": "code_sent",
             "message": "Код отправлен в Telegram",
@@ -139,7 +196,7 @@ async def start_auth(db: AsyncSession, user_id: int, phone: str):
         }
 
     except Exception as e:
-        logger.error(f"Auth start error for user {user_id}, phone {phone}: {e}")
+        logger.error("Auth start error for user %s, phone %s: %s", user_id, phone, e)
         return {"status": "error", "message": str(e)}
 
 
@@ -155,27 +212,31 @@ async def verify_code(db: AsyncSession, user_id: int, phone: str, code: str):
         profile, client, session_record = result
 
         if not client.is_connected():
-            await client.connect()
+            with timed("tg_connect"):
+                await client.connect()
 
         # Используй сохраненный хеш
         try:
-            await client.sign_in(
-                phone=profile.phone,
-                code=code,
-                phone_code_hash=profile.phone_code_hash
-            )
+            async with rate_limiter.limit(phone, AUTH):
+                await client.sign_in(
+                    phone=profile.phone,
+                    code=code,
+                    phone_code_hash=profile.phone_code_hash
+                )
         except Exception as e:
-            logger.error(f"Sign in error: {e}")
+            logger.error("Sign in error: %s", e)
             raise
         session_string = client.session.save()
         await update_session(db, session_record, session_string=session_string)
         # Получить информацию о профиле
-        me = await client.get_me()
+        async with rate_limiter.limit(phone, AUTH):
+            me = await client.get_me()
 
         await update_profile(db, profile, is_authorized=True, phone_code_hash=None, first_name=me.first_name,
                              last_name=me.last_name, username=me.username)
+        activity_writer.touch(profile.id)
 
-        logger.info(f"User {user_id} authorized profile {phone}")
+        logger.info("User %s authorized profile %s", user_id, phone)
         return {
             "status": "success",
             "message": "Авторизация успешна",
@@ -184,7 +245,7 @@ async def verify_code(db: AsyncSession, user_id: int, phone: str, code: str):
         }
 
     except Exception as e:
-        logger.error(f"Code verification error: {e}")
+        logger.error("Code verification error: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -200,23 +261,27 @@ async def verify_password(db: AsyncSession, user_id: int, phone: str, password:
         profile, client, session_record = result
 
         if not client.is_connected():
-            await client.connect()
+            with timed("tg_connect"):
+                await client.connect()
 
-        await client.sign_in(password=password)
+        async with rate_limiter.limit(phone, AUTH):
+            await client.sign_in(password=password)
 
         # Получить информацию о профиле
-        me = await client.get_me()
+        async with rate_limiter.limit(phone, AUTH):
+            me = await client.get_me()
 
         # Обновить профиль
         await update_profile(db, profile, is_authorized=True, phone_code_hash=None, first_name=me.first_name,
                              last_name=me.last_name, username=me.username)
+        activity_writer.touch(profile.id)
 
         # Создать сессию
 
         session_string = client.session.save()
         await update_session(db, session_record, session_string=session_string)
 
-        logger.info(f"User {user_id} authorized profile {phone} with password")
+        logger.info("User %s authorized profile %s with password", user_id, phone)
 
         return {
             "status": "success",
@@ -225,7 +290,7 @@ async def verify_password(db: AsyncSession, user_id: int, phone: str, password:
         }
 
     except Exception as e:
-        logger.error(f"Password verification error: {e}")
+        logger.error("Password verification error: %s", e)
         return {"status": "error", "message": str(e)}
 
 
@@ -233,7 +298,9 @@ async def get_user_profiles(db: AsyncSession, user_id: int):
     """Получить все профили пользователя"""
     try:
         profiles = await get_users_profiles(db, user_id)
-        logger.info(f"User {user_id} got profiles: {profiles}")
+        logger.info("User %s got %d profiles", user_id, len(profiles))
+        # ещё не записанное время активности свежее, чем в БД
+        last_logins = {p.id: activity_writer.last_seen(p.id) or p.last_login for p in profiles}
         return {
             "status": "success",
             "profiles": [
@@ -246,12 +313,12 @@ async def get_user_profiles(db: AsyncSession, user_id: int):
                     "last_name": p.last_name,
                     "username": p.username,
                     "created_at": p.created_at.isoformat(),
-                    "last_login": p.last_login.isoformat() if p.last_login else None
+                    "last_login": last_logins[p.id].isoformat() if last_logins[p.id] else None
                 }
                 for p in profiles
             ]
         }
 
     except Exception as e:
-        logger.error(f"Error getting profiles for user {user_id}: {e}")
+        logger.error("Error getting profiles for user %s: %s", user_id, e)
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telethon.errors import FloodWaitError
+
+from app.config.config import get_settings
+from app.db.database import SessionLocal
+from app.db.session.requests import get_profile_session
+from app.services.client_pool import client_pool
+from app.services.messages import _prepare_authorized_client, _get_tg_entity
+from app.services.rate_limit import rate_limiter, SEND
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchJob:
+    """Пакетная отправка: результат по каждому получателю в порядке запроса"""
+    id: str
+    user_id: int
+    results: list[dict]
+    created_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def __post_init__(self):
+        self.pending = len(self.results)
+        if not self.pending:
+            self._finish()
+
+    def set_result(self, index: int, status: str, message: str | None = None):
+        self.results[index]["status"] = status
+        self.results[index]["message"] = message
+        self.pending -= 1
+        if not self.pending:
+            self._finish()
+
+    def _finish(self):
+        self.finished_at = time.monotonic()
+        self.done.set()
+
+    def to_dict(self, with_results: bool = True) -> dict:
+        counts = {"pending": 0, "sent": 0, "error": 0}
+        for result in self.results:
+            counts[result["status"]] += 1
+        data = {
+            "status": "done" if self.done.is_set() else "running",
+            "job_id": self.id,
+            "total": len(self.results),
+            "sent": counts["sent"],
+            "failed": counts["error"],
+            "pending": counts["pending"],
+        }
+        if with_results:
+            data["results"] = self.results
+        return data
+
+
+@dataclass
+class _Send:
+    job: BatchJob
+    index: int
+    user_id: int
+    tg_receiver: str
+    text: str
+
+
+class ProfileSender:
+    """
+    Очередь отправок одного профиля.
+
+    Отправляет по одному сообщению не чаще, чем раз в interval секунд.
+    На FloodWait ждёт указанное Telegram время и повторяет ту же отправку,
+    если ожидание не длиннее flood_wait_max, иначе помечает её ошибкой.
+    Клиент берётся из пула один раз на серию отправок и возвращается, когда
+    очередь опустела.
+    """
+
+    def __init__(self, phone: str, interval: float, flood_wait_max: float):
+        self.phone = phone
+        self.interval = interval
+        self.flood_wait_max = flood_wait_max
+        self.queue: asyncio.Queue[_Send] = asyncio.Queue()
+        self._next_send_at = 0.0
+        self._worker: asyncio.Task | None = None
+
+    def submit(self, send: _Send):
+        self.queue.put_nowait(send)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def _fail_queued(self, send: _Send, message: str):
+        """Пометить ошибкой текущую отправку и всё, что ждёт в очереди профиля"""
+        send.job.set_result(send.index, "error", message)
+        while not self.queue.empty():
+            queued = self.queue.get_nowait()
+            queued.job.set_result(queued.index, "error", message)
+
+    async def _run(self):
+        while not self.queue.empty():
+            send = self.queue.get_nowait()
+            try:
+                async with SessionLocal() as db:
+                    error, client, _ = await _prepare_authorized_client(db, send.user_id, self.phone)
+            except Exception as e:
+                # иначе задачи профиля навсегда остались бы в pending; следующий submit поднимет воркер заново
+                logger.error("Batch sender for profile %s failed to get a client: %s", self.phone, e)
+                self._fail_queued(send, str(e))
+                continue
+            if error:
+                send.job.set_result(send.index, "error", error["message"])
+                continue
+            try:
+                while True:
+                    await self._send(client, send)
+                    if self.queue.empty():
+                        break
+                    send = self.queue.get_nowait()
+            finally:
+                client_pool.release(self.phone)
+
+    async def _send(self, client, send: _Send):
+        while True:
+            delay = self._next_send_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_send_at = time.monotonic() + self.interval
+            try:
+                entity = await _get_tg_entity(client, self.phone, send.tg_receiver)
+                async with rate_limiter.limit(self.phone, SEND):
+                    await client.send_message(entity, send.text)
+            except FloodWaitError as e:
+                if e.seconds > self.flood_wait_max:
+                    send.job.set_result(send.index, "error", str(e))
+                    return
+                logger.info("FloodWait %ss in batch send from profile %s, retrying", e.seconds, self.phone)
+                self._next_send_at = time.monotonic() + e.seconds
+                continue
+            except Exception as e:
+                logger.error("Batch send error from profile %s to %s: %s", self.phone, send.tg_receiver, e)
+                send.job.set_result(send.index, "error", str(e))
+                return
+            send.job.set_result(send.index, "sent")
+            return
+
+
+class BatchScheduler:
+    """Пакетные отправки: по одному ProfileSender на профиль и реестр задач для опроса прогресса"""
+
+    def __init__(self, interval: float, flood_wait_max: float, job_ttl: float):
+        self.interval = interval
+        self.flood_wait_max = flood_wait_max
+        self.job_ttl = job_ttl
+        self._senders: dict[str, ProfileSender] = {}
+        self._jobs: dict[str, BatchJob] = {}
+
+    async def submit(self, db: AsyncSession, user_id: int, messages: list[dict]) -> BatchJob:
+        """
+        Поставить сообщения в очередь.
+
+        Профили проверяются сразу: сообщения от чужих или неавторизованных
+        профилей сразу получают статус error, остальные ждут отправки.
+        """
+        self._forget_finished_jobs()
+        job = BatchJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            results=[
+                {"phone": m["phone"], "tg_receiver": m["tg_receiver"], "status": "pending", "message": None}
+                for m in messages
+            ],
+        )
+        self._jobs[job.id] = job
+
+        errors = {}
+        for phone in dict.fromkeys(m["phone"] for m in messages):
+            profile_session = await get_profile_session(db, user_id, phone)
+            if not profile_session:
+                errors[phone] = "Профиль не найден"
+            elif not profile_session.is_authorized or profile_session.session_id is None:
+                errors[phone] = "Профиль не авторизован"
+
+        for index, message in enumerate(messages):
+            phone = message["phone"]
+            if phone in errors:
+                job.set_result(index, "error", errors[phone])
+                continue
+            self._sender(phone).submit(
+                _Send(job=job, index=index, user_id=user_id, tg_receiver=message["tg_receiver"], text=message["text"])
+            )
+
+        logger.info("User %s submitted batch %s with %s messages", user_id, job.id, len(messages))
+        return job
+
+    def get_job(self, job_id: str, user_id: int) -> BatchJob | None:
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def close(self):
+        for sender in self._senders.values():
+            await sender.close()
+
+    def _sender(self, phone: str) -> ProfileSender:
+        sender = self._senders.get(phone)
+        if sender is None:
+            sender = self._senders[phone] = ProfileSender(phone, self.interval, self.flood_wait_max)
+        return sender
+
+    def _forget_finished_jobs(self):
+        deadline = time.monotonic() - self.job_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < deadline]:
+            del self._jobs[job_id]
+
+
+batch_scheduler = BatchScheduler(
+    interval=settings.SEND_BATCH_INTERVAL,
+    flood_wait_max=settings.SEND_BATCH_FLOOD_WAIT_MAX,
+    job_ttl=settings.SEND_BATCH_JOB_TTL,
+)
+
+
+async def send_batch(db: AsyncSession, user_id: int, messages: list[dict], wait: bool = False):
+    """Отправить пачку сообщений; wait=True — дождаться окончания и вернуть все результаты"""
+    try:
+        if len(messages) > settings.SEND_BATCH_MAX_SIZE:
+            return {
+                "status": "error",
+                "message": f"Не больше {settings.SEND_BATCH_MAX_SIZE} сообщений в одной пачке",
+            }
+
+        job = await batch_scheduler.submit(db, user_id, messages)
+        if wait:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=settings.SEND_BATCH_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                # отправка продолжается, прогресс — через GET /messages/send/batch/{job_id}
+                pass
+            return job.to_dict()
+        return job.to_dict(with_results=False)
+
+    except Exception as e:
+        logger.error("Error submitting batch for user %s: %s", user_id, e)
+        return {"status": "error", "message": str(e)}
+
+
+def get_batch_status(user_id: int, job_id: str):
+    """Прогресс пакетной отправки"""
+    job = batch_scheduler.get_job(job_id, user_id)
+    if job is None:
+        return {"status": "error", "message": "Задача не найдена"}
+    return job.to_dict()
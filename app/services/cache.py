@@ -0,0 +1,229 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.config.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш с вытеснением давно не использованных
+    записей и временем жизни на каждую запись.
+
+    on_remove вызывается с ключом каждой записи, которая ушла из кэша:
+    удалена, вытеснена или оказалась просроченной.
+    """
+
+    def __init__(self, max_size: int, on_remove: Callable[[Hashable], None] | None = None):
+        self.max_size = max_size
+        self.on_remove = on_remove
+        self._items: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Any:
+        """Значение по ключу или MISSING, если записи нет или она просрочена"""
+        item = self._items.get(key)
+        if item is None:
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return MISSING
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            evicted, _ = self._items.popitem(last=False)
+            if self.on_remove is not None:
+                self.on_remove(evicted)
+
+    def delete(self, key: Hashable):
+        if self._items.pop(key, None) is not None and self.on_remove is not None:
+            self.on_remove(key)
+
+
+class Codec(ABC):
+    """Сериализация значений кэша для хранилища вне процесса"""
+
+    @abstractmethod
+    def dumps(self, value) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes):
+        ...
+
+
+class CacheBackend(ABC):
+    """
+    Хранилище кэша с TTL на запись и тегами для группового сброса.
+
+    Ключи — строки внутри пространства имён кэша. get возвращает MISSING,
+    если записи нет или она просрочена.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def delete_tag(self, tag: str):
+        """Удалить все записи, сохранённые с тегом tag"""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Кэш в памяти процесса: значения хранятся как есть, без сериализации.
+
+    Теги помнят только живые записи: ключ, ушедший из LRU (вытеснен,
+    просрочен или удалён), убирается из всех своих тегов.
+    """
+
+    def __init__(self, max_size: int):
+        self._cache = LRUCache(max_size, on_remove=self._forget_tags)
+        self._tags: dict[str, set[str]] = {}
+        self._key_tags: dict[str, set[str]] = {}
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        if ttl <= 0:
+            return
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+            self._key_tags.setdefault(key, set()).add(tag)
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+    async def delete_tag(self, tag: str):
+        for key in self._tags.pop(tag, ()):
+            self._cache.delete(key)
+
+    def _forget_tags(self, key: str):
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общий для всех воркеров кэш в Redis.
+
+    Значения сериализуются codec кэша, TTL ставится самим Redis. Тег — это
+    множество ключей записей; запись и её теги пишутся одним пайплайном,
+    живёт множество не меньше самой долгой записи в нём.
+
+    Кэш не должен ронять запросы: ошибка Redis пишется в лог, чтение
+    считается промахом, запись и сброс пропускаются.
+    """
+
+    def __init__(self, redis: Redis, namespace: str, codec: Codec):
+        self.redis = redis
+        self.namespace = f"{settings.CACHE_KEY_PREFIX}:{namespace}"
+        self.codec = codec
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    async def get(self, key: str) -> Any:
+        try:
+            data = await self.redis.get(self._key(key))
+        except RedisError as e:
+            logger.error("Redis cache %s read error: %s", self.namespace, e)
+            return MISSING
+        return MISSING if data is None else self.codec.loads(data)
+
+    async def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        ttl_ms = int(ttl * 1000)
+        if ttl_ms <= 0:
+            return
+        key = self._key(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, self.codec.dumps(value), px=ttl_ms)
+            for tag in tags:
+                tag_key = self._tag_key(tag)
+                pipe.sadd(tag_key, key)
+                pipe.pexpire(tag_key, ttl_ms, nx=True)
+                pipe.pexpire(tag_key, ttl_ms, gt=True)
+            try:
+                await pipe.execute()
+            except RedisError as e:
+                logger.error("Redis cache %s write error: %s", self.namespace, e)
+
+    async def delete(self, key: str):
+        try:
+            await self.redis.delete(self._key(key))
+        except RedisError as e:
+            logger.error("Redis cache %s delete error: %s", self.namespace, e)
+
+    async def delete_tag(self, tag: str):
+        tag_key = self._tag_key(tag)
+        try:
+            keys = await self.redis.smembers(tag_key)
+            await self.redis.delete(tag_key, *keys)
+        except RedisError as e:
+            logger.error("Redis cache %s delete error: %s", self.namespace, e)
+
+
+_redis: Redis | None = None
+
+
+def get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        )
+    return _redis
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+def create_cache_backend(namespace: str, max_size: int, codec: Codec) -> CacheBackend:
+    """Хранилище кэша по настройке CACHE_BACKEND: memory — свой у каждого воркера, redis — общее"""
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend(get_redis(), namespace, codec)
+    return MemoryCacheBackend(max_size)
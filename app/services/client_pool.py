@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from telethon import TelegramClient
+
+from app.config.config import get_settings
+from app.db.database import SessionLocal
+from app.db.session.requests import get_tg_session, update_session
+from app.services.metrics import Gauge
+from app.services.session_writer import session_writer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PooledClient:
+    client: TelegramClient
+    in_use: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    last_checked: float = field(default_factory=time.monotonic)
+
+
+class TelegramClientPool:
+    """
+    Пул долгоживущих клиентов Telethon, ключ — телефон профиля.
+
+    - одновременно подключено не больше max_connected клиентов;
+    - при переполнении вытесняется давно не использованный свободный клиент,
+      перед отключением его строка сессии сохраняется через on_evict;
+    - клиент, который давно не проверялся, перед выдачей проходит health check;
+    - фоновая задача отключает клиентов, простаивающих дольше idle_timeout;
+    - закреплённые через pin профили не вытесняются ни по простою, ни при
+      переполнении (их клиенты держат подписку на обновления Telegram);
+      закрепить можно не больше max_pinned профилей, чтобы под запросы
+      остальных профилей оставалось место.
+
+    Подписчики on_connect / on_disconnect (например, кэши, живущие на событиях
+    Telegram) вызываются, когда клиент попадает в пул и когда он отключается.
+    """
+
+    def __init__(
+            self,
+            max_connected: int,
+            idle_timeout: float,
+            health_check_interval: float,
+            max_pinned: int | None = None,
+            on_evict: Callable[[str, TelegramClient], Awaitable[None]] | None = None,
+    ):
+        self.max_connected = max_connected
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.max_pinned = max_connected if max_pinned is None else max_pinned
+        self.on_evict = on_evict
+        self._clients: OrderedDict[str, _PooledClient] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._pinned: set[str] = set()
+        self._reaper: asyncio.Task | None = None
+        self.on_connect: list[Callable[[str, TelegramClient], None]] = []
+        self.on_disconnect: list[Callable[[str, TelegramClient], None]] = []
+
+    def __len__(self):
+        return len(self._clients)
+
+    def lock(self, phone: str) -> asyncio.Lock:
+        """Блокировка на создание клиента для профиля, чтобы не делать два handshake подряд"""
+        lock = self._locks.get(phone)
+        if lock is None:
+            lock = self._locks[phone] = asyncio.Lock()
+        return lock
+
+    def pin(self, phone: str) -> bool:
+        """Закрепить клиент профиля; False, если лимит закреплённых уже исчерпан"""
+        if phone not in self._pinned and len(self._pinned) >= self.max_pinned:
+            return False
+        self._pinned.add(phone)
+        return True
+
+    def unpin(self, phone: str):
+        self._pinned.discard(phone)
+
+    def is_pinned(self, phone: str) -> bool:
+        return phone in self._pinned
+
+    def stats(self) -> dict:
+        return {
+            "connected": len(self._clients),
+            "in_use": sum(1 for entry in self._clients.values() if entry.in_use),
+            "pinned": len(self._pinned),
+            "max_connected": self.max_connected,
+            "max_pinned": self.max_pinned,
+        }
+
+    async def checkout(self, phone: str) -> TelegramClient | None:
+        """Выдать живой клиент из пула или None, если его нужно создать заново"""
+        entry = self._clients.get(phone)
+        if entry is None:
+            return None
+
+        if not await self._is_healthy(entry):
+            logger.info("Pooled client for profile %s failed health check", phone)
+            await self.discard(phone)
+            return None
+
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        self._clients.move_to_end(phone)
+        return entry.client
+
+    async def put(self, phone: str, client: TelegramClient) -> TelegramClient:
+        """Положить подключённый и авторизованный клиент в пул, сразу выдав его вызывающему"""
+        previous = self._clients.pop(phone, None)
+        if previous is not None and previous.client is not client:
+            await self._disconnect(phone, previous.client)
+
+        self._clients[phone] = _PooledClient(client=client, in_use=1)
+        self._notify(self.on_connect, phone, client)
+        await self._evict_overflow()
+        return client
+
+    def release(self, phone: str):
+        """Вернуть клиент в пул после обработки запроса"""
+        entry = self._clients.get(phone)
+        if entry is None:
+            return
+        entry.in_use = max(entry.in_use - 1, 0)
+        entry.last_used = time.monotonic()
+
+    async def discard(self, phone: str):
+        """Убрать клиент из пула без сохранения сессии (сессия истекла или соединение умерло)"""
+        entry = self._clients.pop(phone, None)
+        if entry is not None:
+            await self._disconnect(phone, entry.client)
+
+    async def evict_idle(self):
+        """Отключить клиентов, простаивающих дольше idle_timeout"""
+        deadline = time.monotonic() - self.idle_timeout
+        for phone, entry in list(self._clients.items()):
+            if entry.in_use == 0 and entry.last_used < deadline and phone not in self._pinned:
+                await self._evict(phone)
+
+    async def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def close(self):
+        """Остановить фоновую задачу и отключить всех клиентов с сохранением сессий"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for phone in list(self._clients):
+            await self._evict(phone)
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error("Client pool reaper error: %s", e)
+
+    async def _is_healthy(self, entry: _PooledClient) -> bool:
+        if not entry.client.is_connected():
+            return False
+        if entry.in_use or time.monotonic() - entry.last_checked < self.health_check_interval:
+            return True
+        try:
+            if not await entry.client.is_user_authorized():
+                return False
+        except Exception as e:
+            logger.error("Client pool health check error: %s", e)
+            return False
+        entry.last_checked = time.monotonic()
+        return True
+
+    async def _evict_overflow(self):
+        overflow = len(self._clients) - self.max_connected
+        if overflow <= 0:
+            return
+        idle = [
+            phone for phone, entry in self._clients.items()
+            if entry.in_use == 0 and phone not in self._pinned
+        ]
+        for phone in idle[:overflow]:
+            await self._evict(phone)
+        if len(self._clients) > self.max_connected:
+            logger.warning("Client pool is over capacity: %s/%s clients in use", len(self._clients), self.max_connected)
+
+    async def _evict(self, phone: str):
+        entry = self._clients.pop(phone, None)
+        if entry is None:
+            return
+        if self.on_evict is not None:
+            try:
+                await self.on_evict(phone, entry.client)
+            except Exception as e:
+                logger.error("Error saving session for evicted profile %s: %s", phone, e)
+        await self._disconnect(phone, entry.client)
+
+    def _notify(self, hooks: list, phone: str, client: TelegramClient):
+        for hook in hooks:
+            try:
+                hook(phone, client)
+            except Exception as e:
+                logger.error("Client pool hook error for profile %s: %s", phone, e)
+
+    async def _disconnect(self, phone: str, client: TelegramClient):
+        self._notify(self.on_disconnect, phone, client)
+        try:
+            await client.disconnect()
+        except Exception as e:
+            logger.error("Error disconnecting client for profile %s: %s", phone, e)
+
+
+async def _save_session(phone: str, client: TelegramClient):
+    """Записать актуальную строку сессии вытесняемого клиента в БД, если она изменилась"""
+    if session_writer.is_tracked(phone):
+        session_writer.write(phone, client.session.save())
+        return
+    async with SessionLocal() as db:
+        session_record = await get_tg_session(db, phone)
+        if session_record:
+            await update_session(db, session_record, session_string=client.session.save())
+
+
+client_pool = TelegramClientPool(
+    max_connected=settings.TG_POOL_MAX_CONNECTED,
+    idle_timeout=settings.TG_POOL_IDLE_TIMEOUT,
+    health_check_interval=settings.TG_POOL_HEALTH_CHECK_INTERVAL,
+    max_pinned=settings.TG_POOL_MAX_PINNED,
+    on_evict=_save_session,
+)
+
+Gauge("telegram_clients_connected", "Подключённые клиенты Telegram в пуле").set_function(
+    lambda: client_pool.stats()["connected"])
+Gauge("telegram_clients_in_use", "Клиенты Telegram, занятые запросами").set_function(
+    lambda: client_pool.stats()["in_use"])
+Gauge("telegram_clients_pinned", "Закреплённые клиенты Telegram").set_function(
+    lambda: client_pool.stats()["pinned"])
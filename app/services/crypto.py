@@ -0,0 +1,113 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.config.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Пул только для KDF паролей (десятки миллисекунд на задачу): hashlib.scrypt и
+# pbkdf2_hmac отпускают GIL, поэтому потоков достаточно, чтобы не блокировать
+# event loop. JWT (HS256, микросекунды) сюда не отправляется, чтобы проверка
+# токенов не стояла в очереди за хэшированием во время волны логинов
+crypto_executor = ThreadPoolExecutor(max_workers=settings.CRYPTO_WORKERS, thread_name_prefix="crypto")
+
+SCRYPT = "scrypt"
+PBKDF2 = "pbkdf2_sha256"
+
+# Хэш случайного пароля с текущими параметрами: по нему проверяются входы на неизвестный email
+_dummy_hash: str | None = None
+
+
+async def run_crypto(func, *args, **kwargs):
+    """Выполнить хэширование пароля в пуле потоков, не занимая event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(crypto_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_crypto_executor():
+    crypto_executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem с запасом: scrypt требует 128 * n * r байт
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def _hash_password(password: str) -> str:
+    """
+    Хэш пароля в формате алгоритм$параметры$соль$хэш:
+    scrypt$n$r$p$salt$hash или pbkdf2_sha256$iterations$salt$hash
+    """
+    salt = os.urandom(16)
+    if settings.PASSWORD_HASH_ALGORITHM == PBKDF2:
+        iterations = settings.PASSWORD_PBKDF2_ITERATIONS
+        digest = _pbkdf2(password, salt, iterations)
+        return f"{PBKDF2}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+    n, r, p = settings.PASSWORD_SCRYPT_N, settings.PASSWORD_SCRYPT_R, settings.PASSWORD_SCRYPT_P
+    digest = _scrypt(password, salt, n, r, p)
+    return f"{SCRYPT}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _verify_password(password: str, password_hash: str) -> bool:
+    algorithm, _, params = password_hash.partition("$")
+    try:
+        if algorithm == SCRYPT:
+            n, r, p, salt, digest = params.split("$")
+            expected = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        elif algorithm == PBKDF2:
+            iterations, salt, digest = params.split("$")
+            expected = _pbkdf2(password, base64.b64decode(salt), int(iterations))
+        else:
+            # старые хэши — sha256 без соли
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash)
+    except ValueError:
+        logger.error("Malformed password hash")
+        return False
+    return hmac.compare_digest(expected, base64.b64decode(digest))
+
+
+def _verify_unknown_user(password: str) -> bool:
+    """
+    Проверка пароля пользователя, которого нет: хэш считается так же, как для
+    существующего, чтобы время ответа не выдавало, зарегистрирован ли email
+    """
+    global _dummy_hash
+    if _dummy_hash is None or needs_rehash(_dummy_hash):
+        _dummy_hash = _hash_password(os.urandom(16).hex())
+    _verify_password(password, _dummy_hash)
+    return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Хэш старого формата или с параметрами, отличными от текущих настроек"""
+    if settings.PASSWORD_HASH_ALGORITHM == PBKDF2:
+        prefix = f"{PBKDF2}${settings.PASSWORD_PBKDF2_ITERATIONS}$"
+    else:
+        prefix = f"{SCRYPT}${settings.PASSWORD_SCRYPT_N}${settings.PASSWORD_SCRYPT_R}${settings.PASSWORD_SCRYPT_P}$"
+    return not password_hash.startswith(prefix)
+
+
+async def hash_password(password: str) -> str:
+    return await run_crypto(_hash_password, password)
+
+
+async def verify_password(password: str, password_hash: str | None) -> bool:
+    """password_hash=None — пользователь не найден: False, но за то же время, что и проверка"""
+    if password_hash is None:
+        return await run_crypto(_verify_unknown_user, password)
+    return await run_crypto(_verify_password, password, password_hash)
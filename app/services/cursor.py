@@ -0,0 +1,20 @@
+import base64
+import json
+
+
+def encode_cursor(**fields) -> str:
+    """Непрозрачный курсор страницы: base64 от компактного JSON"""
+    data = json.dumps(fields, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Разобрать курсор из encode_cursor; ValueError, если он повреждён"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        fields = json.loads(data)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if not isinstance(fields, dict):
+        raise ValueError("Некорректный курсор")
+    return fields
@@ -0,0 +1,151 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from telethon import TelegramClient, events, types
+
+from app.config.config import get_settings
+from app.services.client_pool import client_pool
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedDialog:
+    """Снимок диалога Telethon: только поля, которые нужны сервисам сообщений"""
+    id: int
+    entity: object
+    name: str
+    unread_count: int
+    is_group: bool
+    is_channel: bool
+    # последнее сообщение диалога — из него строится курсор следующей страницы
+    message_id: int = 0
+    date: datetime | None = None
+
+    @classmethod
+    def from_dialog(cls, dialog) -> "CachedDialog":
+        message = getattr(dialog, "message", None)
+        return cls(
+            id=dialog.id,
+            entity=dialog.entity,
+            name=dialog.name,
+            unread_count=dialog.unread_count,
+            is_group=dialog.is_group,
+            is_channel=dialog.is_channel,
+            message_id=message.id if message is not None else 0,
+            date=message.date if message is not None else None,
+        )
+
+
+@dataclass
+class _Entry:
+    dialogs: list[CachedDialog]
+    by_id: dict[int, CachedDialog]
+    limit: int | None
+    expires_at: float
+
+
+class DialogCache:
+    """
+    Кэш списка диалогов по телефону профиля.
+
+    Запись живёт ttl секунд. Пока клиент профиля подключён в пуле, запись
+    поддерживается в актуальном состоянии событиями Telegram: новое входящее
+    сообщение увеличивает unread_count и поднимает диалог наверх, прочтение
+    обнуляет счётчик, а закрепление диалогов или сообщение в неизвестный чат
+    сбрасывают запись целиком. Когда клиент уходит из пула, события больше
+    не приходят, и запись тоже сбрасывается.
+
+    В отличие от остальных кэшей, этот всегда живёт в памяти процесса: его
+    актуальность держится на событиях клиентов своего пула, а в общем
+    хранилище одно событие применили бы все воркеры с клиентом этого профиля.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[str, _Entry] = {}
+
+    def get(self, phone: str, limit: int | None = None) -> list[CachedDialog] | None:
+        """Диалоги из кэша, если запись свежая и покрывает limit (None — все диалоги)"""
+        entry = self._entries.get(phone)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            del self._entries[phone]
+            return None
+        if entry.limit is not None and (limit is None or limit > entry.limit):
+            return None
+        return entry.dialogs if limit is None else entry.dialogs[:limit]
+
+    def set(self, phone: str, dialogs, limit: int | None = None) -> list[CachedDialog]:
+        cached = [CachedDialog.from_dialog(dialog) for dialog in dialogs]
+        self._entries[phone] = _Entry(
+            dialogs=cached,
+            by_id={dialog.id: dialog for dialog in cached},
+            # Telegram вернул меньше limit — значит, это все диалоги аккаунта
+            limit=limit if limit is not None and len(cached) >= limit else None,
+            expires_at=time.monotonic() + self.ttl,
+        )
+        return cached
+
+    def invalidate(self, phone: str):
+        self._entries.pop(phone, None)
+
+    def on_new_message(self, phone: str, chat_id: int, incoming: bool, message_id: int = 0,
+                       date: datetime | None = None):
+        entry = self._entries.get(phone)
+        if entry is None:
+            return
+        dialog = entry.by_id.get(chat_id)
+        if dialog is None:
+            # новый диалог или диалог за пределами закэшированной страницы
+            self.invalidate(phone)
+            return
+        if incoming:
+            dialog.unread_count += 1
+        if message_id:
+            dialog.message_id, dialog.date = message_id, date
+        entry.dialogs.remove(dialog)
+        entry.dialogs.insert(0, dialog)
+
+    def mark_read(self, phone: str, chat_id: int):
+        """
+        Диалог прочитан до последнего сообщения.
+
+        Отметку о прочтении мы всегда ставим по самому новому сообщению
+        (get_messages отдаёт их от новых к старым), поэтому счётчик обнуляется.
+        """
+        entry = self._entries.get(phone)
+        if entry is None:
+            return
+        dialog = entry.by_id.get(chat_id)
+        if dialog is not None:
+            dialog.unread_count = 0
+
+    def attach(self, phone: str, client: TelegramClient):
+        """Подписать кэш на события клиента из пула"""
+
+        async def on_new_message(event):
+            self.on_new_message(phone, event.chat_id, incoming=not event.out,
+                                message_id=event.message.id, date=event.message.date)
+
+        async def on_read(event):
+            self.mark_read(phone, event.chat_id)
+
+        async def on_pinned(_):
+            self.invalidate(phone)
+
+        client.add_event_handler(on_new_message, events.NewMessage())
+        client.add_event_handler(on_read, events.MessageRead(inbox=True))
+        client.add_event_handler(on_pinned, events.Raw(types=[types.UpdateDialogPinned, types.UpdatePinnedDialogs]))
+
+    def detach(self, phone: str, _client: TelegramClient = None):
+        self.invalidate(phone)
+
+
+dialog_cache = DialogCache(ttl=settings.DIALOG_CACHE_TTL)
+client_pool.on_connect.append(dialog_cache.attach)
+client_pool.on_disconnect.append(dialog_cache.detach)
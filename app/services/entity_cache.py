@@ -0,0 +1,78 @@
+from telethon import utils
+from telethon.extensions import BinaryReader
+
+from app.config.config import get_settings
+from app.services.cache import MISSING, Codec, CacheBackend, create_cache_backend
+
+settings = get_settings()
+
+NOT_FOUND = object()
+
+
+def normalize_identifier(identifier: str) -> int | str:
+    """Привести получателя к каноническому виду: числовой id, телефон или username"""
+    identifier = identifier.strip()
+    if identifier.lstrip("-").isdigit():
+        return int(identifier)
+    if identifier.startswith("+"):
+        return identifier
+    return identifier.lstrip("@").lower()
+
+
+def to_input_peer(entity):
+    """InputPeer с access_hash — достаточно для отправки без повторного разрешения"""
+    try:
+        return utils.get_input_peer(entity)
+    except TypeError:
+        return entity
+
+
+class InputPeerCodec(Codec):
+    """InputPeer в бинарном формате TL (десятки байт), пустая строка — NOT_FOUND"""
+
+    def dumps(self, peer) -> bytes:
+        return b"" if peer is NOT_FOUND else bytes(peer)
+
+    def loads(self, data: bytes):
+        return NOT_FOUND if not data else BinaryReader(data).tgread_object()
+
+
+class EntityCache:
+    """
+    Кэш разрешённых получателей по (телефон профиля, идентификатор).
+
+    Хранит InputPeer вместе с access_hash, поэтому повторная отправка тому же
+    получателю не требует запросов к Telegram. Ненайденные получатели тоже
+    кэшируются, но на короткое время negative_ttl.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.backend = backend
+
+    @staticmethod
+    def _key(phone: str, identifier: int | str) -> str:
+        # числовой id, телефон с «+» и username после normalize_identifier не пересекаются
+        return f"{phone}:{identifier}"
+
+    async def get(self, phone: str, identifier: int | str):
+        """InputPeer, NOT_FOUND для закэшированного промаха или None, если записи нет"""
+        value = await self.backend.get(self._key(phone, identifier))
+        return None if value is MISSING else value
+
+    async def set(self, phone: str, identifier: int | str, peer):
+        await self.backend.set(self._key(phone, identifier), peer, self.ttl, tags=(phone,))
+
+    async def set_not_found(self, phone: str, identifier: int | str):
+        await self.backend.set(self._key(phone, identifier), NOT_FOUND, self.negative_ttl, tags=(phone,))
+
+    async def invalidate(self, phone: str):
+        await self.backend.delete_tag(phone)
+
+
+entity_cache = EntityCache(
+    create_cache_backend("entity", max_size=settings.ENTITY_CACHE_SIZE, codec=InputPeerCodec()),
+    ttl=settings.ENTITY_CACHE_TTL,
+    negative_ttl=settings.ENTITY_CACHE_NEGATIVE_TTL,
+)
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from telethon import TelegramClient, events, utils
+
+from app.config.config import get_settings
+from app.db.database import SessionLocal
+from app.db.message.requests import save_messages, reset_unread_messages
+from app.db.profile.requests import set_profile_authorized
+from app.db.session.requests import get_authorized_profile_sessions, deactivate_tg_session
+from app.services.auth import _build_client
+from app.services.client_pool import TelegramClientPool, client_pool
+from app.services.dialog_cache import dialog_cache
+from app.services.entity_cache import entity_cache
+from app.services.rate_limit import rate_limiter, READ
+from app.services.session_writer import session_writer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def sender_name(chat_name: str, msg) -> str:
+    """Имя отправителя для личных сообщений, иначе имя чата/канала"""
+    if msg.sender_id and msg.sender:
+        if getattr(msg.sender, "first_name", None):
+            return msg.sender.first_name
+        if getattr(msg.sender, "username", None):
+            return msg.sender.username
+    return chat_name
+
+
+def _message_row(profile_id: int, chat_id: int, chat_name: str, msg, is_read: bool = False) -> dict:
+    return {
+        "profile_id": profile_id,
+        "chat_id": chat_id,
+        "message_id": msg.id,
+        "chat_name": chat_name,
+        "sender_name": sender_name(chat_name, msg),
+        "text": msg.text or "[Медиа]",
+        "date": msg.date,
+        "is_read": is_read,
+    }
+
+
+class MessageSync:
+    """
+    Локальное хранилище входящих сообщений профилей.
+
+    Для каждого отслеживаемого профиля в пуле держится закреплённый клиент,
+    подписанный на NewMessage и MessageRead. Новые сообщения и отметки
+    о прочтении копятся в памяти и раз в flush_interval секунд пишутся в
+    telegram_messages одной транзакцией.
+
+    После подключения клиента непрочитанные профиля один раз забираются из
+    Telegram целиком (backfill); до этого и после отключения клиента профиль
+    не считается готовым, и непрочитанные берутся напрямую из Telegram.
+
+    Отслеживается не больше профилей, чем пул разрешает закрепить
+    (max_pinned): остальные профили работают как без хранилища.
+    Клиенты подключаются в фоне, не больше connect_concurrency одновременно.
+    """
+
+    def __init__(self, pool: TelegramClientPool, flush_interval: float, reconnect_interval: float,
+                 backfill_limit: int, connect_concurrency: int):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.reconnect_interval = reconnect_interval
+        self.backfill_limit = backfill_limit
+        self.connect_concurrency = connect_concurrency
+        self._profiles: dict[str, int] = {}
+        self._ready: set[str] = set()
+        self._rows: list[dict] = []
+        self._reads: dict[tuple[int, int], int] = {}
+        self._backfills: dict[str, asyncio.Task] = {}
+        self._worker: asyncio.Task | None = None
+        self._syncer: asyncio.Task | None = None
+
+    def track(self, phone: str, profile_id: int) -> bool:
+        """
+        Хранить сообщения профиля; клиент профиля закрепляется в пуле.
+        False, если закрепить клиент не удалось (лимит пула исчерпан).
+        """
+        if not self.pool.pin(phone):
+            return False
+        self._profiles[phone] = profile_id
+        return True
+
+    def untrack(self, phone: str):
+        self._profiles.pop(phone, None)
+        self._ready.discard(phone)
+        self.pool.unpin(phone)
+
+    def is_ready(self, phone: str) -> bool:
+        return phone in self._ready
+
+    def add_message(self, phone: str, row: dict):
+        if phone in self._profiles:
+            self._rows.append(row)
+
+    def mark_read(self, phone: str, chat_id: int, max_id: int):
+        profile_id = self._profiles.get(phone)
+        if profile_id is None:
+            return
+        key = (profile_id, chat_id)
+        self._reads[key] = max(self._reads.get(key, 0), max_id)
+
+    async def flush(self):
+        """Записать накопленные сообщения и отметки о прочтении"""
+        if not self._rows and not self._reads:
+            return
+        rows, self._rows = self._rows, []
+        reads, self._reads = self._reads, {}
+        try:
+            async with SessionLocal() as db:
+                await save_messages(
+                    db,
+                    rows,
+                    [(profile_id, chat_id, max_id) for (profile_id, chat_id), max_id in reads.items()],
+                )
+        except Exception:
+            # вернём назад, чтобы не потерять при следующей попытке
+            self._rows = rows + self._rows
+            for key, max_id in reads.items():
+                self._reads[key] = max(self._reads.get(key, 0), max_id)
+            raise
+
+    def attach(self, phone: str, client: TelegramClient):
+        """Подписать хранилище на события клиента из пула (хук client_pool.on_connect)"""
+        profile_id = self._profiles.get(phone)
+        if profile_id is None:
+            return
+
+        async def on_new_message(event):
+            chat_name = utils.get_display_name(event.chat) if event.chat else ""
+            self.add_message(phone, _message_row(profile_id, event.chat_id, chat_name, event.message))
+
+        async def on_read(event):
+            self.mark_read(phone, event.chat_id, event.max_id)
+
+        client.add_event_handler(on_new_message, events.NewMessage(incoming=True))
+        client.add_event_handler(on_read, events.MessageRead(inbox=True))
+        self._backfills[phone] = asyncio.create_task(self._backfill(phone, profile_id, client))
+
+    def detach(self, phone: str, _client: TelegramClient = None):
+        self._ready.discard(phone)
+        backfill = self._backfills.pop(phone, None)
+        if backfill is not None:
+            backfill.cancel()
+
+    async def start(self):
+        """Запустить фоновую запись и фоновое подключение клиентов авторизованных профилей"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        if self._syncer is None:
+            self._syncer = asyncio.create_task(self._reconnect())
+
+    async def close(self):
+        for task in (self._syncer, self._worker):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._syncer = self._worker = None
+        for backfill in self._backfills.values():
+            backfill.cancel()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Message store flush error: %s", e)
+
+    async def _reconnect(self):
+        """Подключать клиентов отслеживаемых профилей сразу после запуска и раз в reconnect_interval"""
+        while True:
+            try:
+                await self._sync_profiles()
+            except Exception as e:
+                logger.error("Message store reconnect error: %s", e)
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def _sync_profiles(self):
+        """Отслеживать авторизованные профили (в пределах лимита пула) и поднять клиентов, которых нет в пуле"""
+        async with SessionLocal() as db:
+            profile_sessions = await get_authorized_profile_sessions(db)
+        tracked = [
+            profile_session for profile_session in profile_sessions
+            if self.track(profile_session.phone, profile_session.profile_id)
+        ]
+        if len(tracked) < len(profile_sessions):
+            logger.warning(
+                "Message store tracks %s of %s profiles: pool pin limit is %s",
+                len(tracked), len(profile_sessions), self.pool.max_pinned,
+            )
+
+        slots = asyncio.Semaphore(max(1, self.connect_concurrency))
+
+        async def connect(profile_session):
+            async with slots:
+                await self._connect_profile(profile_session)
+
+        await asyncio.gather(*(connect(profile_session) for profile_session in tracked))
+
+    async def _connect_profile(self, profile_session):
+        phone = profile_session.phone
+        session_writer.track(phone, profile_session.session_id, profile_session.session_string)
+        async with self.pool.lock(phone):
+            client = await self.pool.checkout(phone)
+            if client is not None:
+                self.pool.release(phone)
+                return
+            client = _build_client(profile_session.session_string)
+            try:
+                await client.connect()
+                authorized = await client.is_user_authorized()
+            except Exception as e:
+                # сеть могла моргнуть: сессию не трогаем, попробуем при следующем переподключении
+                logger.error("Error connecting tracked profile %s: %s", phone, e)
+                await client.disconnect()
+                return
+            if not authorized:
+                # как в запросах: профиль больше не авторизован, и переподключать его незачем
+                logger.info("Session expired for tracked profile %s", phone)
+                await client.disconnect()
+                await entity_cache.invalidate(phone)
+                session_writer.forget(phone)
+                self.untrack(phone)
+                async with SessionLocal() as db:
+                    await deactivate_tg_session(db, profile_session.session_id)
+                    await set_profile_authorized(db, profile_session.profile_id, False)
+                return
+            await self.pool.put(phone, client)
+            self.pool.release(phone)
+
+    async def _backfill(self, phone: str, profile_id: int, client: TelegramClient):
+        """Снимок текущих непрочитанных профиля из Telegram"""
+        try:
+            # всё, что фоновая запись сохранит после этого момента, в снимок может не попасть
+            snapshot_at = datetime.now()
+            async with rate_limiter.limit(phone, READ):
+                dialogs = dialog_cache.set(phone, await client.get_dialogs())
+
+            rows = []
+            for dialog in dialogs:
+                if dialog.unread_count <= 0:
+                    continue
+                async with rate_limiter.limit(phone, READ):
+                    messages = await client.get_messages(
+                        dialog.entity,
+                        limit=min(dialog.unread_count, self.backfill_limit),
+                    )
+                rows.extend(_message_row(profile_id, dialog.id, dialog.name, msg) for msg in messages)
+
+            async with SessionLocal() as db:
+                await reset_unread_messages(db, profile_id, rows, before=snapshot_at)
+            self._ready.add(phone)
+            logger.info("Message store ready for profile %s: %s unread", phone, len(rows))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Message store backfill error for profile %s: %s", phone, e)
+        finally:
+            if self._backfills.get(phone) is asyncio.current_task():
+                del self._backfills[phone]
+
+
+message_sync = MessageSync(
+    client_pool,
+    flush_interval=settings.MESSAGE_STORE_FLUSH_INTERVAL,
+    reconnect_interval=settings.MESSAGE_STORE_RECONNECT_INTERVAL,
+    backfill_limit=settings.MESSAGE_STORE_BACKFILL_LIMIT,
+    connect_concurrency=settings.MESSAGE_STORE_CONNECT_CONCURRENCY,
+)
+if settings.UNREAD_FROM_STORE:
+    client_pool.on_connect.append(message_sync.attach)
+    client_pool.on_disconnect.append(message_sync.detach)
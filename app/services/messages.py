@@ -1,25 +1,157 @@
+import asyncio
+import base64
+from datetime import datetime
+
 from sqlalchemy.ext.asyncio import AsyncSession
+from telethon import functions, utils
+from telethon.errors import FloodWaitError
 
 from app.config.config import get_settings
 import logging
 
-from app.db.profile.requests import get_tg_profile, update_profile
-from app.db.session.requests import get_tg_session, update_session
-from app.services.auth import _get_client
+from app.db.database import SessionLocal
+from app.db.message.requests import get_stored_unread, get_history_range, get_chat_history, \
+    get_profile_history, save_history_page
+from app.db.profile.requests import set_profile_authorized, get_users_profiles
+from app.db.session.requests import get_profile_session, deactivate_tg_session
+from app.services.auth import _build_client
+from app.services.client_pool import client_pool
+from app.services.cursor import encode_cursor, decode_cursor
+from app.services.dialog_cache import dialog_cache, CachedDialog
+from app.services.entity_cache import entity_cache, normalize_identifier, to_input_peer, NOT_FOUND, InputPeerCodec
+from app.services.message_sync import message_sync, sender_name, _message_row
+from app.services.rate_limit import rate_limiter, READ, SEND, ACK
+from app.services.session_writer import session_writer
+from app.services.timings import timed
+from app.services.read_ack import read_ack_queue
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
-async def _get_tg_entity(client, identifier):
-    if identifier.isdigit():
-        identifier = int(identifier)
+# Общий на все запросы лимит профилей, опрашиваемых одновременно в /messages/unread/all
+all_profiles_semaphore = asyncio.Semaphore(settings.UNREAD_ALL_CONCURRENCY)
+
+async def _get_tg_entity(client, phone: str, identifier: str):
+    """
+    Разрешить получателя в InputPeer.
+
+    Сначала смотрим в entity_cache, затем спрашиваем Telegram, а если он не
+    знает получателя — ищем среди диалогов профиля (сперва в кэше диалогов).
+    """
+    identifier = normalize_identifier(identifier)
+
+    cached = await entity_cache.get(phone, identifier)
+    if cached is NOT_FOUND:
+        raise ValueError(f"Entity {identifier} not found")
+    if cached is not None:
+        return cached
+
     try:
-        return await client.get_entity(identifier)
+        async with rate_limiter.limit(phone, READ):
+            entity = await client.get_entity(identifier)
     except ValueError:
+        entity = await _find_dialog_entity(client, phone, identifier)
+        if entity is None:
+            await entity_cache.set_not_found(phone, identifier)
+            raise ValueError(f"Entity {identifier} not found")
+
+    peer = to_input_peer(entity)
+    await entity_cache.set(phone, identifier, peer)
+    return peer
+
+
+async def _find_dialog_entity(client, phone: str, identifier):
+    dialogs = dialog_cache.get(phone)
+    if dialogs is not None:
+        for dialog in dialogs:
+            if identifier in (dialog.id, dialog.entity.id):
+                return dialog.entity
+        return None
+
+    async with rate_limiter.limit(phone, READ):
         async for dialog in client.iter_dialogs():
             if dialog.id == identifier:
                 return dialog.entity
-        raise ValueError(f"Entity {identifier} not found")
+    return None
+
+
+async def _check_profile(db, user_id: int, phone: str):
+    """
+    Проверить профиль, его авторизацию и наличие активной сессии — только БД,
+    без обращения к Telegram. Профиль, владелец и сессия загружаются одним запросом.
+
+    Возвращает (error, profile_session): error — dict со статусом и сообщением или None.
+    """
+    profile_session = await get_profile_session(db, user_id, phone)
+    if not profile_session:
+        return {"status": "error", "message": "Профиль не найден"}, None
+
+    error = await _check_profile_session(db, profile_session)
+    if error:
+        return error, None
+
+    return None, profile_session
+
+
+async def _check_profile_session(db, profile_session):
+    """Авторизация и активная сессия уже загруженного профиля; error-dict или None"""
+    if not profile_session.is_authorized:
+        return {"status": "error", "message": "Профиль не авторизован"}
+
+    if profile_session.session_id is None:
+        await set_profile_authorized(db, profile_session.profile_id, False)
+        return {"status": "error", "message": "Сессия не найдена"}
+
+    return None
+
+
+async def _checkout_client(db, phone: str, profile_session):
+    """
+    Клиент профиля из пула или новый подключённый клиент.
+
+    Клиент нужно вернуть в пул через client_pool.release(phone).
+    Возвращает (error, client).
+    """
+    session_writer.track(phone, profile_session.session_id, profile_session.session_string)
+
+    async with client_pool.lock(phone):
+        # Тёплый путь: клиент уже подключён, handshake не нужен
+        client = await client_pool.checkout(phone)
+        if client is not None:
+            return None, client
+
+        client = _build_client(profile_session.session_string)
+
+        try:
+            with timed("tg_connect"):
+                await client.connect()
+
+            if not await client.is_user_authorized():
+                await client.disconnect()
+                await entity_cache.invalidate(phone)
+                session_writer.forget(phone)
+                await deactivate_tg_session(db, profile_session.session_id)
+                await set_profile_authorized(db, profile_session.profile_id, False)
+                return {"status": "error", "message": "Сессия истекла"}, None
+
+        except asyncio.CancelledError:
+            # Вызывающий оборвал подключение по таймауту (UNREAD_ALL_PROFILE_TIMEOUT):
+            # клиент ещё не попал в пул, и кроме нас отключить его некому
+            await client.disconnect()
+            raise
+
+        except Exception:
+            await client.disconnect()
+            session_writer.forget(phone)
+            await deactivate_tg_session(db, profile_session.session_id)
+            await set_profile_authorized(db, profile_session.profile_id, False)
+            return {"status": "error", "message": "Ошибка подключения к Telegram"}, None
+
+        if settings.UNREAD_FROM_STORE:
+            message_sync.track(phone, profile_session.profile_id)
+        await client_pool.put(phone, client)
+
+    return None, client
 
 
 async def _prepare_authorized_client(
@@ -28,45 +160,124 @@ async def _prepare_authorized_client(
         phone: str,
 ):
     """
-    Общая подготовка клиента:
-    - проверка профиля
-    - проверка авторизации
-    - проверка сессии
-    - создание и подключение клиента
+    Общая подготовка клиента: проверка профиля (_check_profile) и получение
+    клиента из пула или создание и подключение нового (_checkout_client).
+
+    Клиент нужно вернуть в пул через client_pool.release(phone).
 
     Возвращает:
       - error: dict со статусом и сообщением (если ошибка), иначе None
       - client: TelegramClient или None
-      - session_record: объект записи сессии или None
+      - profile_session: ProfileSession или None
     """
-    profile = await get_tg_profile(db, user_id, phone)
-    if not profile:
-        return {"status": "error", "message": "Профиль не найден"}, None, None
+    error, profile_session = await _check_profile(db, user_id, phone)
+    if error:
+        return error, None, None
 
-    if not profile.is_authorized:
-        return {"status": "error", "message": "Профиль не авторизован"}, None, None
+    error, client = await _checkout_client(db, phone, profile_session)
+    if error:
+        return error, None, None
 
-    session = await get_tg_session(db, phone)
-    if not session:
-        await update_profile(db, profile, is_authorized=False)
-        return {"status": "error", "message": "Сессия не найдена"}, None, None
+    return None, client, profile_session
 
-    client, session_record = await _get_client(db, phone)
 
-    try:
-        await client.connect()
+def _serialize_message(dialog, msg) -> dict:
+    return {
+        "id": msg.id,
+        "from": sender_name(dialog.name, msg),
+        "text": msg.text or "[Медиа]",
+        "date": msg.date.isoformat(),
+        "chat_name": dialog.name,
+        "chat_id": dialog.entity.id,
+    }
+
 
-        if not await client.is_user_authorized():
-            await update_session(db, session_record, is_active=False)
-            await update_profile(db, profile, is_authorized=False)
-            return {"status": "error", "message": "Сессия истекла"}, None, None
+async def _fetch_dialog_messages(
+        client,
+        phone: str,
+        dialog,
+        limit: int,
+        semaphore: asyncio.Semaphore,
+) -> list[dict]:
+    """
+    Получить непрочитанные сообщения одного диалога.
 
-    except Exception:
-        await update_session(db, session_record, is_active=False)
-        await update_profile(db, profile, is_authorized=False)
-        return {"status": "error", "message": "Ошибка подключения к Telegram"}, None, None
+    Число одновременных запросов ограничено семафором. На FloodWait (если он
+    не больше UNREAD_FLOOD_WAIT_MAX) повторяем запрос, не отпуская семафор,
+    но не больше UNREAD_FLOOD_WAIT_RETRIES раз: rate_limiter сам выдержит
+    паузу, указанную Telegram.
+    """
+    async with semaphore:
+        for attempt in range(settings.UNREAD_FLOOD_WAIT_RETRIES + 1):
+            try:
+                async with rate_limiter.limit(phone, READ):
+                    messages = await client.get_messages(
+                        dialog.entity,
+                        limit=min(dialog.unread_count, limit),
+                    )
+                break
+            except FloodWaitError as e:
+                if e.seconds > settings.UNREAD_FLOOD_WAIT_MAX or attempt == settings.UNREAD_FLOOD_WAIT_RETRIES:
+                    raise
+                logger.info("FloodWait %ss while fetching dialog %s, retrying", e.seconds, dialog.id)
+
+    return [_serialize_message(dialog, msg) for msg in messages]
+
+
+async def _load_dialogs(client, phone: str, limit: int | None = None):
+    """Диалоги профиля из кэша или из Telegram с сохранением в кэш"""
+    dialogs = dialog_cache.get(phone, limit)
+    if dialogs is None:
+        async with rate_limiter.limit(phone, READ):
+            loaded = await client.get_dialogs(limit=limit)
+        dialogs = dialog_cache.set(phone, loaded, limit)
+    return dialogs
+
+
+async def _acknowledge(client, phone: str, acks: list[tuple], read_ack: str):
+    """Отметить прочитанными тройки (chat_id, entity, max_id) в выбранном режиме"""
+    if read_ack == "none":
+        return
+    for chat_id, _, max_id in acks:
+        dialog_cache.mark_read(phone, chat_id)
+        message_sync.mark_read(phone, chat_id, max_id)
+    if read_ack == "sync":
+        async def ack(entity, max_id):
+            async with rate_limiter.limit(phone, ACK):
+                await client.send_read_acknowledge(entity, max_id=max_id)
+
+        await asyncio.gather(*(ack(entity, max_id) for _, entity, max_id in acks))
+    else:
+        for chat_id, entity, max_id in acks:
+            read_ack_queue.enqueue(phone, chat_id, entity, max_id)
+
+
+def _serialize_stored(row) -> dict:
+    """Сообщение из telegram_messages в формате ответа API (chat_id — id сущности, как у диалогов)"""
+    return {
+        "id": row["message_id"],
+        "from": row["sender_name"],
+        "text": row["text"],
+        "date": row["date"].isoformat(),
+        "chat_name": row["chat_name"],
+        "chat_id": utils.resolve_id(row["chat_id"])[0],
+    }
+
+
+async def _stored_unread_messages(db, client, phone: str, profile_id: int, limit: int, read_ack: str):
+    """
+    Непрочитанные из локального хранилища (UNREAD_FROM_STORE) — один запрос
+    к БД вместо обхода диалогов в Telegram. Сущности чатов для отметки
+    о прочтении Telethon берёт из кэша сессии по id чата.
+    """
+    rows = await get_stored_unread(db, profile_id, limit)
+    unread_messages = [_serialize_stored(row) for row in rows]
 
-    return None, client, session_record
+    max_ids: dict[int, int] = {}
+    for row in rows:
+        max_ids[row["chat_id"]] = max(max_ids.get(row["chat_id"], 0), row["message_id"])
+    await _acknowledge(client, phone, [(chat_id, chat_id, max_id) for chat_id, max_id in max_ids.items()], read_ack)
+    return unread_messages
 
 
 async def get_unread_messages(
@@ -74,10 +285,18 @@ async def get_unread_messages(
         user_id: int,
         phone: str,
         limit: int = 50,
+        read_ack: str = "deferred",
 ):
-    """Получить непрочитанные сообщения для профиля"""
+    """
+    Получить непрочитанные сообщения для профиля
+
+    read_ack:
+      - sync     — отметить прочитанными до ответа
+      - deferred — отметить в фоне после ответа (read_ack_queue)
+      - none     — не отмечать
+    """
     try:
-        error, client, session_record = await _prepare_authorized_client(
+        error, client, profile_session = await _prepare_authorized_client(
             db=db,
             user_id=user_id,
             phone=phone,
@@ -86,47 +305,38 @@ async def get_unread_messages(
             return error
 
         try:
-            unread_messages = []
-            dialogs = await client.get_dialogs()
-
-            for dialog in dialogs:
-                if dialog.unread_count <= 0:
-                    continue
-
-                entity = dialog.entity
-                messages = await client.get_messages(
-                    entity,
-                    limit=min(dialog.unread_count, limit),
+            if settings.UNREAD_FROM_STORE and message_sync.is_ready(phone):
+                unread_messages = await _stored_unread_messages(
+                    db, client, phone, profile_session.profile_id, limit, read_ack,
                 )
+                logger.info("User %s got unread messages for profile %s from store", user_id, phone)
+                return {
+                    "status": "success",
+                    "count": len(unread_messages),
+                    "messages": unread_messages,
+                }
 
-                for msg in messages:
-                    sender_name = dialog.name  # имя чата/канала по умолчанию
-
-                    # Личные сообщения
-                    if msg.sender_id and msg.sender:
-                        if getattr(msg.sender, "first_name", None):
-                            sender_name = msg.sender.first_name
-                        elif getattr(msg.sender, "username", None):
-                            sender_name = msg.sender.username
-
-                    unread_messages.append(
-                        {
-                            "id": msg.id,
-                            "from": sender_name,
-                            "text": msg.text or "[Медиа]",
-                            "date": msg.date.isoformat(),
-                            "chat_name": dialog.name,
-                            "chat_id": entity.id,
-                        }
-                    )
-            # Отмечаем как прочитанные
-            for dialog in dialogs:
-                if dialog.unread_count > 0:
-                    await client.send_read_acknowledge(dialog.entity)
-
-            session_record.session_string = client.session.save()
-            await db.commit()
-            logger.info(f"User {user_id} got unread messages for profile {phone}")
+            dialogs = await _load_dialogs(client, phone)
+            unread_dialogs = [dialog for dialog in dialogs if dialog.unread_count > 0]
+
+            semaphore = asyncio.Semaphore(settings.UNREAD_FETCH_CONCURRENCY)
+            batches = await asyncio.gather(
+                *(_fetch_dialog_messages(client, phone, dialog, limit, semaphore) for dialog in unread_dialogs)
+            )
+            # gather сохраняет порядок диалогов, поэтому результат детерминирован
+            unread_messages = [message for batch in batches for message in batch]
+
+            # Отмечаем прочитанным только то, что реально вернули
+            acks = [
+                (dialog.id, dialog.entity, max(message["id"] for message in batch))
+                for dialog, batch in zip(unread_dialogs, batches)
+                if batch
+            ]
+            await _acknowledge(client, phone, acks, read_ack)
+
+            # В БД уйдёт только изменившаяся строка, и не в этом запросе, а фоновой пачкой
+            session_writer.write(phone, client.session.save())
+            logger.info("User %s got unread messages for profile %s", user_id, phone)
             return {
                 "status": "success",
                 "count": len(unread_messages),
@@ -134,17 +344,174 @@ async def get_unread_messages(
             }
 
         finally:
-            await client.disconnect()
+            client_pool.release(phone)
 
     except Exception as e:
-        logger.error(f"Error getting messages: {e}")
+        logger.error("Error getting messages: %s", e)
         return {"status": "error", "message": str(e)}
 
 
+async def _profile_unread(user_id: int, phone: str, limit: int, read_ack: str) -> dict:
+    """Непрочитанные одного профиля в своей сессии БД: сессии нельзя делить между задачами"""
+    async with all_profiles_semaphore:
+        try:
+            async with SessionLocal() as db:
+                return await asyncio.wait_for(
+                    get_unread_messages(db, user_id, phone, limit, read_ack),
+                    timeout=settings.UNREAD_ALL_PROFILE_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            logger.error("Timeout getting unread messages for profile %s", phone)
+            return {"status": "error", "message": "Превышено время ожидания Telegram"}
+
+
+async def get_all_unread_messages(
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 50,
+        read_ack: str = "deferred",
+):
+    """
+    Непрочитанные сообщения всех авторизованных профилей пользователя.
+
+    Профили опрашиваются параллельно (не больше UNREAD_ALL_CONCURRENCY
+    одновременно на весь сервис), каждое сообщение помечено телефоном
+    профиля. Ошибка одного профиля не валит ответ: она попадает в profiles,
+    а статус ответа становится partial.
+    """
+    try:
+        profiles = [profile for profile in await get_users_profiles(db, user_id) if profile.is_authorized]
+        results = await asyncio.gather(
+            *(_profile_unread(user_id, profile.phone, limit, read_ack) for profile in profiles)
+        )
+
+        unread_messages = []
+        profile_results = []
+        for profile, result in zip(profiles, results):
+            if result["status"] != "success":
+                profile_results.append({"phone": profile.phone, "status": "error", "message": result["message"]})
+                continue
+            profile_results.append({"phone": profile.phone, "status": "success", "count": result["count"]})
+            unread_messages.extend({**message, "phone": profile.phone} for message in result["messages"])
+
+        failed = sum(1 for result in profile_results if result["status"] == "error")
+        logger.info("User %s got unread messages for %s profiles, %s failed", user_id, len(profiles), failed)
+        return {
+            "status": "partial" if failed else "success",
+            "count": len(unread_messages),
+            "profiles": profile_results,
+            "messages": unread_messages,
+        }
+
+    except Exception as e:
+        logger.error("Error getting unread messages for user %s: %s", user_id, e)
+        return {"status": "error", "message": str(e)}
+
+
+async def stream_unread_messages(
+        db: AsyncSession,
+        user_id: int,
+        phone: str,
+        limit: int = 50,
+        read_ack: str = "deferred",
+):
+    """
+    Потоковый вариант get_unread_messages.
+
+    Возвращает словарь-ошибку, если профиль не готов, иначе асинхронный
+    генератор записей:
+      - {"type": "dialog", ...} — сообщения одного диалога, по мере готовности;
+      - {"type": "end", ...}    — итог: количество сообщений и ошибки по диалогам.
+
+    Загружается не больше UNREAD_STREAM_BUFFER диалогов вперёд: место
+    занимается до начала загрузки диалога и освобождается, когда его запись
+    забрал клиент, поэтому при медленном чтении загрузка приостанавливается,
+    а не копит ответ в памяти.
+
+    Клиент берётся из пула уже внутри генератора: если поток так и не начался
+    (клиент HTTP отключился раньше), возвращать в пул нечего.
+    """
+    error, profile_session = await _check_profile(db, user_id, phone)
+    if error:
+        return error
+
+    async def records():
+        count = 0
+        errors = []
+        tasks = []
+        client = None
+        try:
+            # сессия запроса к началу потока уже может быть закрыта
+            async with SessionLocal() as stream_db:
+                checkout_error, client = await _checkout_client(stream_db, phone, profile_session)
+            if checkout_error:
+                raise RuntimeError(checkout_error["message"])
+
+            dialogs = await _load_dialogs(client, phone)
+            unread_dialogs = [dialog for dialog in dialogs if dialog.unread_count > 0]
+
+            buffer = asyncio.Queue()
+            slots = asyncio.Semaphore(max(1, settings.UNREAD_STREAM_BUFFER))
+            semaphore = asyncio.Semaphore(settings.UNREAD_FETCH_CONCURRENCY)
+
+            async def fetch(dialog):
+                try:
+                    batch = await _fetch_dialog_messages(client, phone, dialog, limit, semaphore)
+                    buffer.put_nowait((dialog, batch, None))
+                except Exception as e:
+                    buffer.put_nowait((dialog, None, e))
+
+            async def produce():
+                for dialog in unread_dialogs:
+                    await slots.acquire()
+                    tasks.append(asyncio.create_task(fetch(dialog)))
+
+            tasks.append(asyncio.create_task(produce()))
+
+            for _ in range(len(unread_dialogs)):
+                dialog, batch, fetch_error = await buffer.get()
+                slots.release()
+                if fetch_error is not None:
+                    logger.error("Error streaming dialog %s for profile %s: %s", dialog.id, phone, fetch_error)
+                    errors.append({"chat_id": dialog.entity.id, "message": str(fetch_error)})
+                    continue
+
+                count += len(batch)
+                yield {
+                    "type": "dialog",
+                    "chat_id": dialog.entity.id,
+                    "chat_name": dialog.name,
+                    "messages": batch,
+                }
+                if batch:
+                    await _acknowledge(
+                        client, phone, [(dialog.id, dialog.entity, max(m["id"] for m in batch))], read_ack,
+                    )
+
+            logger.info("User %s streamed unread messages for profile %s", user_id, phone)
+        except Exception as e:
+            logger.error("Error streaming messages for profile %s: %s", phone, e)
+            errors.append({"chat_id": None, "message": str(e)})
+        finally:
+            for task in tasks:
+                task.cancel()
+            if client is not None:
+                client_pool.release(phone)
+
+        yield {
+            "type": "end",
+            "status": "error" if errors else "success",
+            "count": count,
+            "errors": errors,
+        }
+
+    return records()
+
+
 async def send_message(db: AsyncSession, user_id: int, phone: str, text: str, tg_receiver: str):
     """Отправить сообщение от профиля"""
     try:
-        error, client, session_record = await _prepare_authorized_client(
+        error, client, profile_session = await _prepare_authorized_client(
             db=db,
             user_id=user_id,
             phone=phone,
@@ -153,23 +520,60 @@ async def send_message(db: AsyncSession, user_id: int, phone: str, text: str, tg
             return error
 
         try:
-            entity = await _get_tg_entity(client, tg_receiver)
-            await client.send_message(entity, text)
-            logger.info(f"Message sent from profile {phone} to chat {tg_receiver}")
+            entity = await _get_tg_entity(client, phone, tg_receiver)
+            async with rate_limiter.limit(phone, SEND):
+                await client.send_message(entity, text)
+            logger.info("Message sent from profile %s to chat %s", phone, tg_receiver)
             return {"status": "success", "message": "Сообщение отправлено"}
 
         finally:
-            await client.disconnect()
+            client_pool.release(phone)
 
     except Exception as e:
-        logger.error(f"Error sending message from profile {phone}: {e}")
+        logger.error("Error sending message from profile %s: %s", phone, e)
         return {"status": "error", "message": str(e)}
 
 
-async def get_dialogs(user_id: int, phone: str, db: AsyncSession, limit: int = 50):
-    """Получить список диалогов"""
+def _encode_dialogs_cursor(dialogs: list[CachedDialog]) -> str:
+    """
+    Курсор следующей страницы диалогов — offset_date, offset_id и offset_peer
+    для messages.getDialogs. Как и Telethon, дату и id берём у последнего
+    диалога с сообщением, а peer — у последнего диалога страницы.
+    """
+    last = next((dialog for dialog in reversed(dialogs) if dialog.message_id), None)
+    peer = InputPeerCodec().dumps(to_input_peer(dialogs[-1].entity))
+    return encode_cursor(
+        d=last.date.isoformat() if last is not None and last.date else None,
+        m=last.message_id if last is not None else 0,
+        p=base64.urlsafe_b64encode(peer).decode(),
+    )
+
+
+def _decode_dialogs_cursor(cursor: str) -> dict:
+    """Аргументы get_dialogs из курсора; ValueError, если курсор повреждён"""
+    position = decode_cursor(cursor)
     try:
-        error, client, session_record = await _prepare_authorized_client(
+        offset_peer = utils.get_input_peer(InputPeerCodec().loads(base64.urlsafe_b64decode(position["p"])))
+        return {
+            "offset_date": datetime.fromisoformat(position["d"]) if position["d"] else None,
+            "offset_id": int(position["m"]),
+            "offset_peer": offset_peer,
+        }
+    except Exception as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+async def get_dialogs(user_id: int, phone: str, db: AsyncSession, limit: int = 50, cursor: str | None = None):
+    """
+    Получить список диалогов постранично, по курсору next_cursor.
+
+    Первая страница берётся через кэш диалогов, каждая следующая — одним
+    запросом к Telegram со смещением из курсора, без повторной загрузки
+    предыдущих страниц. Закреплённые диалоги приходят только на первой.
+    """
+    try:
+        offsets = _decode_dialogs_cursor(cursor) if cursor else None
+        error, client, profile_session = await _prepare_authorized_client(
             db=db,
             user_id=user_id,
             phone=phone,
@@ -177,11 +581,17 @@ async def get_dialogs(user_id: int, phone: str, db: AsyncSession, limit: int = 5
         if error:
             return error
         try:
-            dialogs = await client.get_dialogs(limit=limit)
+            if offsets is None:
+                dialogs = await _load_dialogs(client, phone, limit)
+            else:
+                async with rate_limiter.limit(phone, READ):
+                    loaded = await client.get_dialogs(limit=limit, ignore_pinned=True, **offsets)
+                dialogs = [CachedDialog.from_dialog(dialog) for dialog in loaded]
 
             dialogs_list = [
                 {
                     "id": dialog.entity.id,
+                    "peer_id": dialog.id,
                     "name": dialog.name,
                     "unread_count": dialog.unread_count,
                     "is_group": dialog.is_group,
@@ -189,15 +599,162 @@ async def get_dialogs(user_id: int, phone: str, db: AsyncSession, limit: int = 5
                 }
                 for dialog in dialogs
             ]
-            logger.info(f"User {user_id} got dialogs for profile {phone}")
+            # Telegram вернул меньше limit — дальше диалогов нет
+            next_cursor = _encode_dialogs_cursor(dialogs) if dialogs and len(dialogs) >= limit else None
+            logger.info("User %s got dialogs for profile %s", user_id, phone)
             return {
                 "status": "success",
-                "dialogs": dialogs_list
+                "dialogs": dialogs_list,
+                "next_cursor": next_cursor,
             }
 
         finally:
-            await client.disconnect()
+            client_pool.release(phone)
+
+    except Exception as e:
+        logger.error("Error getting dialogs for profile %s: %s", phone, e)
+        return {"status": "error", "message": str(e)}
+
+
+async def _read_inbox_max_id(client, phone: str, entity) -> int:
+    """Граница прочитанного во входящих чата: сообщения с большим id ещё не прочитаны"""
+    async with rate_limiter.limit(phone, READ):
+        result = await client(functions.messages.GetPeerDialogsRequest(peers=[entity]))
+    return result.dialogs[0].read_inbox_max_id if result.dialogs else 0
+
+
+def _history_page(messages: list[dict], next_cursor: str | None, source: str) -> dict:
+    return {
+        "status": "success",
+        "count": len(messages),
+        "messages": messages,
+        "next_cursor": next_cursor,
+        "source": source,
+    }
+
+
+def _merge_history_range(history_range, min_id: int, max_id: int, reached_start: bool):
+    """Объединить новый участок с сохранённым, если они пересекаются или соседствуют"""
+    if history_range is None or min_id > history_range.max_id + 1 or max_id < history_range.min_id - 1:
+        return min_id, max_id, reached_start
+    if history_range.min_id < min_id:
+        reached_start = history_range.reached_start
+    elif history_range.min_id == min_id:
+        reached_start = reached_start or history_range.reached_start
+    return min(min_id, history_range.min_id), max(max_id, history_range.max_id), reached_start
+
+
+async def _get_chat_history(db, user_id: int, phone: str, peer_id: int, before_id: int | None, limit: int):
+    """
+    Страница истории одного чата от новых сообщений к старым.
+
+    Если страница целиком лежит внутри сохранённого непрерывного участка
+    (telegram_history_ranges), она отдаётся из БД без обращения к Telegram.
+    Иначе страница запрашивается у Telegram, сохраняется пачкой и расширяет
+    участок, так что повторный проход по истории идёт уже из БД. Первая
+    страница (без курсора) всегда берётся из Telegram: там могли появиться
+    новые сообщения.
+    """
+    profile_session = await get_profile_session(db, user_id, phone)
+    if not profile_session:
+        return {"status": "error", "message": "Профиль не найден"}
+    profile_id = profile_session.profile_id
+
+    history_range = await get_history_range(db, profile_id, peer_id)
+    if before_id is not None and history_range is not None:
+        if history_range.min_id <= before_id <= history_range.max_id + 1:
+            rows = await get_chat_history(db, profile_id, peer_id, before_id, history_range.min_id, limit)
+            if len(rows) == limit or history_range.reached_start:
+                next_cursor = encode_cursor(m=rows[-1]["message_id"]) if len(rows) == limit else None
+                return _history_page([_serialize_stored(row) for row in rows], next_cursor, "store")
+
+    # профиль уже загружен выше: проверяем его и берём клиента без повторного запроса
+    error = await _check_profile_session(db, profile_session)
+    if error:
+        return error
+    error, client = await _checkout_client(db, phone, profile_session)
+    if error:
+        return error
+
+    try:
+        entity = await _get_tg_entity(client, phone, str(peer_id))
+        async with rate_limiter.limit(phone, READ):
+            messages = await client.get_messages(entity, limit=limit, offset_id=before_id or 0)
+        read_max_id = 0
+        if any(not msg.out for msg in messages):
+            read_max_id = await _read_inbox_max_id(client, phone, entity)
+    finally:
+        client_pool.release(phone)
+
+    # Страница может задеть ещё не прочитанные входящие: флаг берём по границе
+    # прочитанного из Telegram, иначе они пропали бы из непрочитанных хранилища
+    rows = [
+        _message_row(profile_id, peer_id, utils.get_display_name(msg.chat) if msg.chat else "", msg,
+                     is_read=msg.out or msg.id <= read_max_id)
+        for msg in messages
+    ]
+    reached_start = len(rows) < limit
+    if rows or before_id is not None:
+        ids = [row["message_id"] for row in rows]
+        max_id = before_id - 1 if before_id is not None else max(ids)
+        min_id = 1 if reached_start else min(ids)
+        min_id, max_id, merged_start = _merge_history_range(history_range, min_id, max_id, reached_start)
+        await save_history_page(db, profile_id, peer_id, rows, min_id, max_id, merged_start)
+
+    next_cursor = None if reached_start else encode_cursor(m=rows[-1]["message_id"])
+    return _history_page([_serialize_stored(row) for row in rows], next_cursor, "telegram")
+
+
+def _decode_history_cursor(cursor: str, chat: bool):
+    """
+    Позиция из курсора истории: message_id для чата, (date, chat_id, message_id)
+    для ленты профиля. ValueError, если курсор повреждён или от другого вида истории.
+    """
+    position = decode_cursor(cursor)
+    if set(position) != ({"m"} if chat else {"d", "c", "m"}):
+        raise ValueError("Некорректный курсор")
+    try:
+        if chat:
+            return int(position["m"])
+        return datetime.fromisoformat(position["d"]), int(position["c"]), int(position["m"])
+    except (TypeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+async def get_history(
+        db: AsyncSession,
+        user_id: int,
+        phone: str,
+        peer_id: int | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+):
+    """
+    История сообщений с keyset-курсором (next_cursor из прошлого ответа).
+
+    peer_id задан — история одного чата (peer_id из /messages/dialogs).
+    Без peer_id — все сохранённые сообщения профиля по дате, только из БД.
+    """
+    try:
+        before = _decode_history_cursor(cursor, chat=peer_id is not None) if cursor else None
+
+        if peer_id is not None:
+            result = await _get_chat_history(db, user_id, phone, peer_id, before, limit)
+        else:
+            profile_session = await get_profile_session(db, user_id, phone)
+            if not profile_session:
+                return {"status": "error", "message": "Профиль не найден"}
+            rows = await get_profile_history(db, profile_session.profile_id, before, limit)
+            next_cursor = None
+            if len(rows) == limit:
+                last = rows[-1]
+                next_cursor = encode_cursor(d=last["date"].isoformat(), c=last["chat_id"], m=last["message_id"])
+            result = _history_page([_serialize_stored(row) for row in rows], next_cursor, "store")
+
+        if result["status"] == "success":
+            logger.info("User %s got history page for profile %s", user_id, phone)
+        return result
 
     except Exception as e:
-        logger.error(f"Error getting dialogs for profile {phone}: {e}")
+        logger.error("Error getting history for profile %s: %s", phone, e)
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from telethon.errors import FloodWaitError
+
+from app.config.config import get_settings
+from app.services.metrics import Counter, Histogram
+from app.services.timings import add_timing
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Классы методов Telegram, у каждого свой бюджет запросов на профиль
+READ = "read"    # get_dialogs, iter_dialogs, get_messages, get_entity
+SEND = "send"    # send_message
+ACK = "ack"      # send_read_acknowledge
+AUTH = "auth"    # send_code_request, sign_in, get_me
+
+telegram_flood_waits = Counter("telegram_flood_waits_total", "FloodWait от Telegram", ("method_class",))
+telegram_flood_wait_seconds = Counter(
+    "telegram_flood_wait_seconds_total", "Суммарная длительность FloodWait", ("method_class",))
+telegram_rate_limit_wait = Histogram(
+    "telegram_rate_limit_wait_seconds", "Ожидание токена ограничителя запросов к Telegram", ("method_class",))
+
+
+class TokenBucket:
+    """
+    Token bucket одного профиля и класса методов.
+
+    Запросы ждут своей очереди, а не отбрасываются: если токенов нет, запрос
+    резервирует следующий токен и спит до его появления, поэтому ожидающие
+    обслуживаются по порядку. На FloodWait bucket блокируется на время,
+    указанное Telegram, и снижает скорость в backoff раз; после каждого
+    успешного вызова скорость понемногу возвращается к исходной.
+    """
+
+    def __init__(self, rate: float, burst: int, backoff: float, recovery: float, min_rate: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.backoff = backoff
+        self.recovery = recovery
+        self.min_rate = min_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.flood_waits = 0
+        self.last_flood_wait = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Взять токен, дождавшись его при необходимости; возвращает время ожидания"""
+        start = time.monotonic()
+        self._refill(start)
+        self.tokens -= 1
+        delay = max(-self.tokens / self.rate, self.blocked_until - start)
+        if delay <= 0:
+            return 0.0
+
+        self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+            # пока ждали, мог прийти FloodWait
+            while (blocked := self.blocked_until - time.monotonic()) > 0:
+                await asyncio.sleep(blocked)
+        finally:
+            self.waiting -= 1
+        return time.monotonic() - start
+
+    def penalize(self, seconds: int):
+        now = time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.rate = max(self.rate * self.backoff, self.min_rate)
+        self.tokens = min(self.tokens, 0.0)
+        self.flood_waits += 1
+        self.last_flood_wait = seconds
+
+    def reward(self):
+        if self.rate < self.base_rate:
+            self._refill(time.monotonic())
+            self.rate = min(self.rate * self.recovery, self.base_rate)
+
+
+class _ClassStats:
+    def __init__(self):
+        self.calls = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, wait: float):
+        self.calls += 1
+        if wait > 0:
+            self.waited += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+@dataclass
+class _Block:
+    """Текущий блок limit(): клиент Telethon отчитывается в него о каждом RPC"""
+    phone: str
+    method_class: str
+    bucket: TokenBucket
+    rpcs: int = 0
+    # FloodWait, уже учтённый в bucket из клиента
+    flood_wait: FloodWaitError | None = None
+
+
+_current_block: ContextVar[_Block | None] = ContextVar("rate_limit_block", default=None)
+
+
+class RateLimiter:
+    """
+    Ограничение частоты вызовов Telegram по (телефон профиля, класс методов).
+
+    Использование:
+
+        async with rate_limiter.limit(phone, READ):
+            messages = await client.get_messages(...)
+
+    Блок берёт один токен на первый RPC; если вызов внутри блока делает
+    несколько RPC (get_dialogs без limit, iter_dialogs), клиент через
+    before_rpc берёт токен на каждую следующую страницу.
+
+    FloodWait не длиннее flood_retry_max клиент пережидает через flood_wait
+    и повторяет RPC один раз. Более длинный или повторный FloodWait
+    пробрасывается дальше, но сначала учитывается в bucket: следующие
+    вызовы того же класса от этого профиля подождут.
+    """
+
+    def __init__(self, limits: dict[str, tuple[float, int]], backoff: float, recovery: float, min_rate: float,
+                 flood_retry_max: float = 0):
+        self.limits = limits
+        self.backoff = backoff
+        self.recovery = recovery
+        self.min_rate = min_rate
+        self.flood_retry_max = flood_retry_max
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._stats = {method_class: _ClassStats() for method_class in limits}
+
+    def bucket(self, phone: str, method_class: str) -> TokenBucket:
+        key = (phone, method_class)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits[method_class]
+            bucket = self._buckets[key] = TokenBucket(
+                rate, burst, backoff=self.backoff, recovery=self.recovery, min_rate=self.min_rate,
+            )
+        return bucket
+
+    async def _acquire(self, bucket: TokenBucket, method_class: str):
+        wait = await bucket.acquire()
+        self._stats[method_class].record(wait)
+        telegram_rate_limit_wait.labels(method_class).observe(wait)
+        add_timing("queue", wait)
+
+    def _penalize(self, block: _Block, seconds: int):
+        block.bucket.penalize(seconds)
+        telegram_flood_waits.labels(block.method_class).inc()
+        telegram_flood_wait_seconds.labels(block.method_class).inc(seconds)
+        logger.warning(
+            "FloodWait %ss for profile %s (%s), rate lowered to %.2f/s",
+            seconds, block.phone, block.method_class, block.bucket.rate,
+        )
+
+    @asynccontextmanager
+    async def limit(self, phone: str, method_class: str):
+        block = _Block(phone, method_class, self.bucket(phone, method_class))
+        await self._acquire(block.bucket, method_class)
+        token = _current_block.set(block)
+        try:
+            yield
+        except FloodWaitError as e:
+            if e is not block.flood_wait:
+                self._penalize(block, e.seconds)
+            raise
+        finally:
+            _current_block.reset(token)
+        block.bucket.reward()
+
+    async def before_rpc(self):
+        """Перед каждым RPC клиента: первый идёт по токену блока limit(), следующие берут свой"""
+        block = _current_block.get()
+        if block is None:
+            return
+        block.rpcs += 1
+        if block.rpcs > 1:
+            await self._acquire(block.bucket, block.method_class)
+
+    async def flood_wait(self, error: FloodWaitError) -> bool:
+        """
+        FloodWait в RPC клиента: учесть его в bucket и, если пауза короткая,
+        дождаться её. True — RPC стоит повторить.
+        """
+        block = _current_block.get()
+        if block is None:
+            return False
+        self._penalize(block, error.seconds)
+        block.flood_wait = error
+        if error.seconds > self.flood_retry_max:
+            return False
+        # токен на повтор: bucket отдаст его не раньше конца паузы
+        await self._acquire(block.bucket, block.method_class)
+        return True
+
+    def stats(self) -> dict:
+        """Очереди, ожидание и FloodWait по классам методов"""
+        result = {}
+        for method_class, stats in self._stats.items():
+            buckets = [bucket for (_, cls), bucket in self._buckets.items() if cls == method_class]
+            result[method_class] = {
+                "profiles": len(buckets),
+                "waiting": sum(bucket.waiting for bucket in buckets),
+                "throttled": sum(1 for bucket in buckets if bucket.rate < bucket.base_rate),
+                "blocked": sum(1 for bucket in buckets if bucket.blocked_until > time.monotonic()),
+                "flood_waits": sum(bucket.flood_waits for bucket in buckets),
+                "calls": stats.calls,
+                "waited": stats.waited,
+                "avg_wait_ms": round(stats.wait_total / stats.waited * 1000, 3) if stats.waited else 0.0,
+                "max_wait_ms": round(stats.wait_max * 1000, 3),
+            }
+        return result
+
+
+rate_limiter = RateLimiter(
+    limits={
+        READ: (settings.TG_RATE_READ, settings.TG_RATE_READ_BURST),
+        SEND: (settings.TG_RATE_SEND, settings.TG_RATE_SEND_BURST),
+        ACK: (settings.TG_RATE_ACK, settings.TG_RATE_ACK_BURST),
+        AUTH: (settings.TG_RATE_AUTH, settings.TG_RATE_AUTH_BURST),
+    },
+    backoff=settings.TG_RATE_FLOOD_BACKOFF,
+    recovery=settings.TG_RATE_RECOVERY,
+    min_rate=settings.TG_RATE_MIN,
+    flood_retry_max=settings.TG_RATE_FLOOD_RETRY_MAX,
+)
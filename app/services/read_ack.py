@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from telethon.errors import FloodWaitError
+
+from app.config.config import get_settings
+from app.services.client_pool import TelegramClientPool, client_pool
+from app.services.rate_limit import rate_limiter, ACK
+from app.services.worker import DelayedFlushWorker
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingAck:
+    phone: str
+    chat_id: int
+    entity: object
+    max_id: int
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class ReadAckQueue(DelayedFlushWorker):
+    """
+    Отложенная отметка сообщений прочитанными.
+
+    Запрос кладёт в очередь (профиль, чат, max_id) и сразу отвечает клиенту.
+    Фоновый воркер раз в batch_delay секунд забирает накопившееся: повторные
+    отметки одного чата схлопываются в одну с наибольшим max_id. Неудачные
+    отметки повторяются с экспоненциальной задержкой до max_retries раз,
+    на FloodWait — не раньше, чем разрешит Telegram.
+    """
+
+    name = "Read acknowledge worker"
+
+    def __init__(self, pool: TelegramClientPool, batch_delay: float, max_retries: int):
+        super().__init__(delay=batch_delay)
+        self.pool = pool
+        self.max_retries = max_retries
+        self._pending: dict[tuple[str, int], _PendingAck] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _retry_delay(self) -> float:
+        """Отложенные отметки ждут времени самой ранней из них, а не опрашиваются каждые delay"""
+        earliest = min(pending.not_before for pending in self._pending.values())
+        return earliest - time.monotonic()
+
+    def enqueue(self, phone: str, chat_id: int, entity, max_id: int):
+        key = (phone, chat_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = _PendingAck(phone=phone, chat_id=chat_id, entity=entity, max_id=max_id)
+        else:
+            pending.max_id = max(pending.max_id, max_id)
+        self.wakeup()
+
+    async def flush(self):
+        """Отправить все отметки, время которых пришло"""
+        now = time.monotonic()
+        ready = [key for key, pending in self._pending.items() if pending.not_before <= now]
+        batch = [self._pending.pop(key) for key in ready]
+
+        by_phone: dict[str, list[_PendingAck]] = {}
+        for pending in batch:
+            by_phone.setdefault(pending.phone, []).append(pending)
+
+        await asyncio.gather(*(self._flush_profile(phone, items) for phone, items in by_phone.items()))
+
+    async def close(self):
+        """Остановить воркер, попытавшись отправить всё накопленное"""
+        await self.stop()
+        for pending in self._pending.values():
+            pending.not_before = 0.0
+        await self.flush()
+
+    async def _flush_profile(self, phone: str, items: list[_PendingAck]):
+        client = await self.pool.checkout(phone)
+        if client is None:
+            for pending in items:
+                self._retry(pending, delay=self.delay * 2 ** pending.attempts)
+            return
+        try:
+            for pending in items:
+                try:
+                    async with rate_limiter.limit(phone, ACK):
+                        await client.send_read_acknowledge(pending.entity, max_id=pending.max_id)
+                except FloodWaitError as e:
+                    self._retry(pending, delay=e.seconds)
+                except Exception as e:
+                    logger.error("Read acknowledge error for profile %s, chat %s: %s", phone, pending.chat_id, e)
+                    self._retry(pending, delay=self.delay * 2 ** pending.attempts)
+        finally:
+            self.pool.release(phone)
+
+    def _retry(self, pending: _PendingAck, delay: float):
+        pending.attempts += 1
+        if pending.attempts > self.max_retries:
+            logger.error("Dropping read acknowledge for profile %s, chat %s", pending.phone, pending.chat_id)
+            return
+        pending.not_before = time.monotonic() + delay
+        key = (pending.phone, pending.chat_id)
+        newer = self._pending.get(key)
+        if newer is not None:
+            # пока отметка ждала повтора, пришла новая — достаточно большего max_id
+            newer.max_id = max(newer.max_id, pending.max_id)
+        else:
+            self._pending[key] = pending
+
+
+read_ack_queue = ReadAckQueue(
+    client_pool,
+    batch_delay=settings.READ_ACK_BATCH_DELAY,
+    max_retries=settings.READ_ACK_MAX_RETRIES,
+)
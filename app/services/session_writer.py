@@ -0,0 +1,99 @@
+import logging
+from dataclasses import dataclass
+
+from app.config.config import get_settings
+from app.db.database import SessionLocal
+from app.db.session.requests import update_session_strings
+from app.services.worker import DelayedFlushWorker
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _TrackedSession:
+    session_id: int
+    persisted: str | None
+
+
+class SessionWriter(DelayedFlushWorker):
+    """
+    Отложенная запись строк сессий Telethon.
+
+    Помнит последнюю записанную в БД строку сессии каждого профиля и ставит
+    в очередь только реально изменившиеся. Фоновый воркер пишет накопленное
+    одним UPDATE не позже чем через flush_delay секунд после первого
+    изменения; при остановке приложения всё несохранённое дописывается.
+    """
+
+    name = "Session writer"
+
+    def __init__(self, flush_delay: float):
+        super().__init__(delay=flush_delay)
+        self._sessions: dict[str, _TrackedSession] = {}
+        self._dirty: dict[str, str] = {}
+
+    def __len__(self):
+        return len(self._dirty)
+
+    def track(self, phone: str, session_id: int, persisted: str | None):
+        """Запомнить сессию профиля и строку, которая сейчас лежит в БД"""
+        tracked = self._sessions.get(phone)
+        if tracked is None or tracked.session_id != session_id:
+            self._sessions[phone] = _TrackedSession(session_id=session_id, persisted=persisted)
+            self._dirty.pop(phone, None)
+            return
+        tracked.persisted = persisted
+        if self._dirty.get(phone) == persisted:
+            del self._dirty[phone]
+
+    def is_tracked(self, phone: str) -> bool:
+        return phone in self._sessions
+
+    def forget(self, phone: str):
+        """Сессия деактивирована: писать в неё больше нечего"""
+        self._sessions.pop(phone, None)
+        self._dirty.pop(phone, None)
+
+    def write(self, phone: str, session_string: str) -> bool:
+        """Поставить строку сессии в очередь на запись; False — не изменилась или сессия неизвестна"""
+        tracked = self._sessions.get(phone)
+        if tracked is None:
+            return False
+        if session_string == tracked.persisted:
+            self._dirty.pop(phone, None)
+            return False
+        self._dirty[phone] = session_string
+        self.wakeup()
+        return True
+
+    async def flush(self):
+        """Записать все изменившиеся строки сессий одной транзакцией"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        values = {}
+        for phone, session_string in dirty.items():
+            tracked = self._sessions.get(phone)
+            if tracked is not None:
+                values[phone] = (tracked.session_id, session_string)
+        if not values:
+            return
+
+        try:
+            async with SessionLocal() as db:
+                await update_session_strings(db, dict(values.values()))
+        except Exception:
+            # более свежие строки, пришедшие во время записи, не затираем
+            for phone, (_, session_string) in values.items():
+                self._dirty.setdefault(phone, session_string)
+            raise
+
+        for phone, (session_id, session_string) in values.items():
+            tracked = self._sessions.get(phone)
+            if tracked is not None and tracked.session_id == session_id:
+                tracked.persisted = session_string
+        logger.info("Saved %s session strings", len(values))
+
+
+session_writer = SessionWriter(flush_delay=settings.SESSION_WRITE_DELAY)
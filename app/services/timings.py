@@ -0,0 +1,99 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from fastapi.routing import APIRoute
+
+
+@dataclass
+class RequestTimings:
+    """
+    Из чего сложилось время запроса. Время параллельных задач запроса
+    суммируется, поэтому сумма полей может быть больше длительности запроса.
+    """
+    db_ms: float = 0.0
+    db_queries: int = 0
+    tg_connect_ms: float = 0.0
+    tg_rpc_ms: float = 0.0
+    tg_rpcs: int = 0
+    # ожидание очереди ограничителя запросов к Telegram
+    queue_ms: float = 0.0
+    serialize_ms: float = 0.0
+    endpoint_done: float | None = field(default=None, repr=False)
+
+    def log_fields(self) -> dict:
+        return {
+            "db_ms": round(self.db_ms, 2),
+            "db_queries": self.db_queries,
+            "tg_connect_ms": round(self.tg_connect_ms, 2),
+            "tg_rpc_ms": round(self.tg_rpc_ms, 2),
+            "tg_rpcs": self.tg_rpcs,
+            "queue_ms": round(self.queue_ms, 2),
+            "serialize_ms": round(self.serialize_ms, 2),
+        }
+
+
+# Задаётся LoggingMiddleware на время запроса; задачи, созданные внутри запроса,
+# получают ту же запись вместе с копией контекста
+request_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+_COUNTERS = {"db": "db_queries", "tg_rpc": "tg_rpcs"}
+
+
+def add_timing(kind: str, seconds: float):
+    """Добавить к текущему запросу время kind: db, tg_connect, tg_rpc, queue или serialize"""
+    timings = request_timings.get()
+    if timings is None:
+        return
+    name = f"{kind}_ms"
+    setattr(timings, name, getattr(timings, name) + seconds * 1000)
+    counter = _COUNTERS.get(kind)
+    if counter is not None:
+        setattr(timings, counter, getattr(timings, counter) + 1)
+
+
+@contextmanager
+def timed(kind: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(kind, time.perf_counter() - start)
+
+
+def _mark_endpoint_done(endpoint):
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = request_timings.get()
+            if timings is not None:
+                timings.endpoint_done = time.perf_counter()
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    Маршрут, который считает serialize_ms: время от возврата обработчика
+    до готового ответа (валидация, jsonable_encoder и рендер JSON).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _mark_endpoint_done(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timings = request_timings.get()
+            if timings is not None and timings.endpoint_done is not None:
+                timings.serialize_ms += (time.perf_counter() - timings.endpoint_done) * 1000
+                timings.endpoint_done = None
+            return response
+
+        return timed_handler
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+
+class DelayedFlushWorker(ABC):
+    """
+    Фоновый воркер для работы, которая копится в памяти и пишется пачками.
+
+    Наследник складывает работу в память и вызывает wakeup(). Воркер ждёт
+    пробуждения, выжидает delay секунд, чтобы набралась пачка, и вызывает
+    flush(); если после этого что-то осталось (len(self) > 0), следующий
+    проход начинается сам через _retry_delay() секунд или раньше, по новому
+    пробуждению. close() останавливает воркер и вызывает flush() последний раз.
+    """
+
+    # Как воркер называется в логах
+    name = "Background worker"
+    # Не чаще скольких секунд повторять проход по оставшейся работе,
+    # чтобы при delay=0 воркер не крутился вхолостую
+    min_retry_delay = 0.1
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Сколько работы ещё ждёт записи"""
+
+    @abstractmethod
+    async def flush(self):
+        """Записать накопленное; при ошибке вернуть его назад и пробросить исключение"""
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    async def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить воркер, ничего не дописывая"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def close(self):
+        """Остановить воркер и дописать накопленное"""
+        await self.stop()
+        await self.flush()
+
+    def _retry_delay(self) -> float:
+        """Через сколько секунд повторить проход, если после flush() что-то осталось"""
+        return self.delay
+
+    async def _run(self):
+        timeout = None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await asyncio.sleep(self.delay)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("%s error: %s", self.name, e)
+            timeout = max(self._retry_delay(), self.min_retry_delay) if len(self) else None
@@ -0,0 +1,153 @@
+"""
+Фейковый Telegram для нагрузочных замеров: клиент с тем же интерфейсом,
+что использует сервис, синтетическими диалогами, задержкой и FloodWait.
+"""
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telethon import types
+from telethon.errors import FloodWaitError
+
+_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class FakeTelegramConfig:
+    dialogs: int = 50
+    # доля диалогов с непрочитанными и сколько непрочитанных в каждом
+    unread_dialogs: float = 0.3
+    unread_per_dialog: int = 5
+    message_size: int = 200
+    # задержка ответа Telegram: среднее и разброс, секунды
+    latency: float = 0.02
+    jitter: float = 0.01
+    # вероятность FloodWait на вызов и его длительность
+    flood_wait_rate: float = 0.0
+    flood_wait_seconds: int = 1
+    seed: int = 0
+
+
+class _Session:
+    def __init__(self, session_string: str | None):
+        self.session_string = session_string or "fake"
+
+    def save(self) -> str:
+        return self.session_string
+
+
+class FakeTelegramClient:
+    """Минимальный TelegramClient: только методы, которые вызывает сервис"""
+
+    def __init__(self, config: FakeTelegramConfig, session_string: str | None = None):
+        self.config = config
+        self.session = _Session(session_string)
+        self._random = random.Random(f"{config.seed}:{session_string}")
+        self._connected = False
+        self._handlers = []
+        self._dialogs = [self._make_dialog(i) for i in range(config.dialogs)]
+        self._by_id = {dialog.id: dialog for dialog in self._dialogs}
+        self._sent = 0
+
+    def _make_dialog(self, index: int):
+        user = types.User(
+            id=1000 + index,
+            access_hash=self._random.getrandbits(63),
+            first_name=f"User {index}",
+            username=f"user{index}",
+        )
+        unread = self.config.unread_per_dialog if self._random.random() < self.config.unread_dialogs else 0
+        return SimpleNamespace(
+            id=user.id,
+            entity=user,
+            name=user.first_name,
+            unread_count=unread,
+            is_group=False,
+            is_channel=False,
+            # диалоги отсортированы от свежих к старым, как в Telegram
+            message=SimpleNamespace(id=self.config.dialogs - index, date=_EPOCH - timedelta(minutes=index)),
+        )
+
+    async def _call(self):
+        """Задержка сети и, с заданной вероятностью, FloodWait"""
+        delay = max(0.0, self.config.latency + self._random.uniform(-self.config.jitter, self.config.jitter))
+        await asyncio.sleep(delay)
+        if self.config.flood_wait_rate and self._random.random() < self.config.flood_wait_rate:
+            raise FloodWaitError(None, capture=self.config.flood_wait_seconds)
+
+    async def connect(self):
+        await self._call()
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def is_user_authorized(self) -> bool:
+        return True
+
+    async def get_me(self):
+        return types.User(id=1, first_name="Bench", username="bench")
+
+    def add_event_handler(self, callback, event=None):
+        self._handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self._handlers = [handler for handler in self._handlers if handler[0] is not callback]
+
+    async def get_dialogs(self, limit=None, offset_peer=None, **kwargs):
+        await self._call()
+        dialogs = self._dialogs
+        if offset_peer is not None:
+            # следующая страница начинается после диалога offset_peer
+            start = next(i for i, dialog in enumerate(dialogs) if dialog.id == offset_peer.user_id) + 1
+            dialogs = dialogs[start:]
+        return dialogs if limit is None else dialogs[:limit]
+
+    async def iter_dialogs(self, limit=None):
+        for dialog in await self.get_dialogs(limit):
+            yield dialog
+
+    async def get_entity(self, identifier):
+        await self._call()
+        if isinstance(identifier, int) and identifier in self._by_id:
+            return self._by_id[identifier].entity
+        for dialog in self._dialogs:
+            if identifier in (dialog.entity.username, getattr(dialog.entity, "phone", None)):
+                return dialog.entity
+        raise ValueError(f"Cannot find any entity corresponding to {identifier}")
+
+    async def get_messages(self, entity, limit=None, **kwargs):
+        await self._call()
+        dialog = self._by_id.get(getattr(entity, "id", entity))
+        count = min(limit or 1, dialog.unread_count) if dialog is not None else 0
+        text = "x" * self.config.message_size
+        now = datetime.now(timezone.utc)
+        return [
+            SimpleNamespace(id=count - i, text=text, date=now, sender_id=dialog.id if dialog else None,
+                            sender=dialog.entity if dialog else None)
+            for i in range(count)
+        ]
+
+    async def send_message(self, entity, text):
+        await self._call()
+        self._sent += 1
+        return SimpleNamespace(id=self._sent, text=text)
+
+    async def send_read_acknowledge(self, entity, max_id=None):
+        await self._call()
+
+
+def install(config: FakeTelegramConfig):
+    """Подменить создание клиентов Telethon во всех сервисах на FakeTelegramClient"""
+    from app.services import auth, message_sync, messages
+
+    def build_client(session_string: str | None):
+        return FakeTelegramClient(config, session_string)
+
+    for module in (auth, messages, message_sync):
+        module._build_client = build_client
@@ -0,0 +1,293 @@
+"""
+Нагрузочный замер API с фейковым Telegram.
+
+Поднимает app.main:app в процессе (httpx + ASGITransport, вместе с lifespan),
+клиентов Telethon подменяет FakeTelegramClient и гоняет /messages/unread,
+/messages/send и /messages/dialogs с заданной конкурентностью. Отчёт:
+p50/p95/p99 по каждому эндпоинту, запросов в секунду и память процесса.
+
+БД:
+  --db memory    без Postgres: пользователь и профили в памяти процесса
+  --db postgres  локальный Postgres из DATABASE_*: пользователь регистрируется
+                 через /auth/register, профили и сессии создаются в БД
+
+    python -m benchmarks.load_test --endpoints unread,send,dialogs --concurrency 50 --requests 2000
+    python -m benchmarks.load_test --latency 0.05 --flood-wait-rate 0.01
+    python -m benchmarks.load_test --save-baseline main
+    python -m benchmarks.load_test --compare main
+
+Клиент и приложение делят один event loop, поэтому абсолютные цифры
+занижены относительно uvicorn; сравнивать стоит прогоны между собой.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("DATABASE_URL", "localhost")
+os.environ.setdefault("DATABASE_PORT", "5432")
+os.environ.setdefault("DATABASE_NAME", "benchmark")
+os.environ.setdefault("DATABASE_USER", "benchmark")
+os.environ.setdefault("DATABASE_PASSWORD", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import httpx  # noqa: E402
+
+from app import main as main_module  # noqa: E402
+from app.db.database import SessionLocal, get_db  # noqa: E402
+from app.db.profile.requests import create_profile  # noqa: E402
+from app.db.session.requests import ProfileSession, create_tg_session  # noqa: E402
+from app.db.user.requests import get_app_user  # noqa: E402
+from app.middleware.jwt import Principal, get_current_user  # noqa: E402
+from app.services import broadcast, messages, session_writer as session_writer_module  # noqa: E402
+from app.services.rate_limit import rate_limiter  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramConfig, install  # noqa: E402
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+ENDPOINTS = ("unread", "send", "dialogs")
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Percentile методом ближайшего ранга по отсортированному списку"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def _phones(count: int, run_id: int) -> list[str]:
+    return [f"+7{run_id:03d}{i:07d}" for i in range(count)]
+
+
+def _setup_memory_db(app, phones: list[str]):
+    """Профили и пользователь в памяти: БД не нужна ни для одного запроса сценария"""
+    sessions = {
+        phone: ProfileSession(profile_id=i + 1, phone=phone, is_authorized=True, session_id=i + 1,
+                              session_string=f"fake-{phone}")
+        for i, phone in enumerate(phones)
+    }
+
+    async def get_profile_session(_db, _user_id, phone):
+        return sessions.get(phone)
+
+    async def update_session_strings(_db, _values):
+        pass
+
+    async def init_models():
+        pass
+
+    async def no_db():
+        yield None
+
+    principal = Principal(id=1, email="bench@example.com", created_at=datetime.now())
+    messages.get_profile_session = get_profile_session
+    broadcast.get_profile_session = get_profile_session
+    session_writer_module.update_session_strings = update_session_strings
+    main_module.init_models = init_models
+    app.dependency_overrides[get_db] = no_db
+    app.dependency_overrides[get_current_user] = lambda: principal
+
+
+async def _setup_postgres(http: httpx.AsyncClient, phones: list[str]):
+    """Пользователь через API, профили с сессиями — напрямую в БД"""
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    response = await http.post("/auth/register", json={"email": email, "password": "benchmark"})
+    response.raise_for_status()
+    http.headers["Authorization"] = f"Bearer {response.cookies['access_token']}"
+
+    user = await get_app_user(SessionLocal(), email)
+    for phone in phones:
+        profile = await create_profile(SessionLocal(), user_id=user.id, phone=phone, is_authorized=True)
+        await create_tg_session(SessionLocal(), profile.id, f"fake-{phone}")
+
+
+def _request(endpoint: str, phone: str, i: int, args) -> tuple[str, dict]:
+    if endpoint == "unread":
+        return "/messages/unread", {"phone": phone, "limit": args.limit, "read_ack": args.read_ack}
+    if endpoint == "send":
+        receiver = f"user{i % args.dialogs}"
+        return "/messages/send", {"phone": phone, "text": "x" * args.message_size, "tg_receiver": receiver}
+    return "/messages/dialogs", {"phone": phone, "limit": args.limit}
+
+
+async def _drive(http: httpx.AsyncClient, phones: list[str], args) -> tuple[dict, float]:
+    endpoints = args.endpoints
+    latencies = {endpoint: [] for endpoint in endpoints}
+    errors = {endpoint: 0 for endpoint in endpoints}
+    counter = iter(range(args.requests))
+
+    async def worker():
+        for i in counter:
+            endpoint = endpoints[i % len(endpoints)]
+            path, payload = _request(endpoint, phones[i % len(phones)], i, args)
+            start = time.perf_counter()
+            try:
+                response = await http.post(path, json=payload)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies[endpoint].append(time.perf_counter() - start)
+            if not ok:
+                errors[endpoint] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    for endpoint in endpoints:
+        values = sorted(latencies[endpoint])
+        results[endpoint] = {
+            "requests": len(values),
+            "errors": errors[endpoint],
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+        }
+    return results, elapsed
+
+
+async def run(args) -> dict:
+    install(FakeTelegramConfig(
+        dialogs=args.dialogs,
+        unread_dialogs=args.unread_dialogs,
+        unread_per_dialog=args.unread_per_dialog,
+        message_size=args.message_size,
+        latency=args.latency,
+        jitter=args.jitter,
+        flood_wait_rate=args.flood_wait_rate,
+        flood_wait_seconds=args.flood_wait_seconds,
+    ))
+    if not args.rate_limit:
+        # бюджет Telegram на профиль иначе ограничит замер раньше самого сервиса
+        rate_limiter.limits = {method_class: (1e9, 10 ** 9) for method_class in rate_limiter.limits}
+
+    app = main_module.app
+    phones = _phones(args.profiles, run_id=int(time.time()) % 1000)
+    if args.db == "memory":
+        _setup_memory_db(app, phones)
+
+    rss_start = _rss_mb()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            if args.db == "postgres":
+                await _setup_postgres(http, phones)
+            if args.warmup:
+                warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+                await _drive(http, phones, warmup)
+            endpoints, elapsed = await _drive(http, phones, args)
+            rss_end = _rss_mb()
+
+    total = sum(result["requests"] for result in endpoints.values())
+    return {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("save_baseline", "compare", "with_logs")},
+        "endpoints": endpoints,
+        "total": {
+            "requests": total,
+            "errors": sum(result["errors"] for result in endpoints.values()),
+            "seconds": round(elapsed, 2),
+            "rps": round(total / elapsed, 1),
+        },
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        },
+    }
+
+
+def _print_report(report: dict, baseline: dict | None = None):
+    def delta(value, old):
+        if not old:
+            return ""
+        return f" ({(value - old) / old * 100:+.1f}%)"
+
+    print(f"{'endpoint':<10}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, result in report["endpoints"].items():
+        print(f"{endpoint:<10}{result['requests']:>10}{result['errors']:>8}{result['rps']:>10}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}")
+        if baseline and endpoint in baseline["endpoints"]:
+            old = baseline["endpoints"][endpoint]
+            print(f"{'  vs base':<28}{delta(result['rps'], old['rps']):>10}"
+                  f"{delta(result['p50_ms'], old['p50_ms']):>10}{delta(result['p95_ms'], old['p95_ms']):>10}"
+                  f"{delta(result['p99_ms'], old['p99_ms']):>10}")
+    total, memory = report["total"], report["memory"]
+    print(f"total: {total['requests']} requests in {total['seconds']}s, {total['rps']} rps, "
+          f"{total['errors']} errors")
+    print(f"memory: rss {memory['rss_start_mb']} -> {memory['rss_end_mb']} MB, peak {memory['peak_rss_mb']} MB")
+    if baseline:
+        print(f"baseline total rps: {baseline['total']['rps']}{delta(total['rps'], baseline['total']['rps'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda value: [endpoint for endpoint in value.split(",") if endpoint in ENDPOINTS])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--profiles", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=50)
+    # по умолчанию без отметок о прочтении: иначе после первого круга непрочитанных не останется
+    parser.add_argument("--read-ack", default="none", choices=["sync", "deferred", "none"])
+    parser.add_argument("--db", default="memory", choices=["memory", "postgres"])
+    parser.add_argument("--rate-limit", action="store_true", help="не снимать лимиты запросов к Telegram")
+    # фейковый Telegram
+    parser.add_argument("--dialogs", type=int, default=50)
+    parser.add_argument("--unread-dialogs", type=float, default=0.3)
+    parser.add_argument("--unread-per-dialog", type=int, default=5)
+    parser.add_argument("--message-size", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--flood-wait-rate", type=float, default=0.0)
+    parser.add_argument("--flood-wait-seconds", type=int, default=1)
+    # результаты
+    parser.add_argument("--json", action="store_true", help="вывести отчёт в JSON")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--with-logs", action="store_true", help="не отключать INFO-логи приложения")
+    args = parser.parse_args()
+
+    if not args.with_logs:
+        logging.disable(logging.INFO)
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        baseline = json.loads((BASELINES_DIR / f"{args.compare}.json").read_text())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_report(report, baseline)
+    if args.save_baseline:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        (BASELINES_DIR / f"{args.save_baseline}.json").write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
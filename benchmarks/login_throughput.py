@@ -0,0 +1,83 @@
+"""
+Пропускная способность логина и задержка event loop во время «шторма» логинов.
+
+Каждый логин — проверка пароля и выпуск пары JWT, как в POST /auth/login
+(без БД). Параллельно раз в 10 мс просыпается проба — так видно, насколько
+логины задерживают остальные обработчики (например, сообщения).
+
+    python -m benchmarks.login_throughput --logins 200 --concurrency 50
+    python -m benchmarks.login_throughput --inline  # хэширование прямо в event loop, для сравнения
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("DATABASE_URL", "localhost")
+os.environ.setdefault("DATABASE_PORT", "5432")
+os.environ.setdefault("DATABASE_NAME", "benchmark")
+os.environ.setdefault("DATABASE_USER", "benchmark")
+os.environ.setdefault("DATABASE_PASSWORD", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from app.middleware.jwt import create_tokens, _create_token_pair  # noqa: E402
+from app.services.crypto import hash_password, verify_password, _verify_password  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe(lags: list[float], stop: asyncio.Event):
+    """Задержка пробуждения относительно ожидаемого — время, когда loop был занят"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def login(password_hash: str, inline: bool):
+    if inline:
+        assert _verify_password("password", password_hash)
+        _create_token_pair(1)
+    else:
+        assert await verify_password("password", password_hash)
+        await create_tokens(1)
+
+
+async def run(logins: int, concurrency: int, inline: bool):
+    password_hash = await hash_password("password")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await login(password_hash, inline)
+
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    print(f"mode:        {'inline' if inline else 'crypto pool'}")
+    print(f"logins:      {logins} in {elapsed:.2f}s ({logins / elapsed:.1f}/s)")
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(f"loop lag ms: p50={statistics.median(lags_ms):.1f} p99={p99:.1f} max={lags_ms[-1]:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--inline", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency, args.inline))
+
+
+if __name__ == "__main__":
+    main()
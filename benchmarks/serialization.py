@@ -0,0 +1,106 @@
+"""
+Кодирование большого ответа /messages/unread разными способами.
+
+Ответ собирается так же, как в get_unread_messages (словари с датами
+строками ISO), и кодируется:
+  - jsonable_encoder + json.dumps — путь FastAPI для маршрута без response_model;
+  - response_model + json.dumps   — валидация моделью, дамп в dict и JSONResponse;
+  - response_model + dump_json    — валидация и дамп моделью сразу в байты;
+  - FastJSONResponse              — orjson по готовому словарю (то, что отдают маршруты).
+
+    python -m benchmarks.serialization --messages 5000 --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("API_HASH", "benchmark")
+os.environ.setdefault("DATABASE_URL", "localhost")
+os.environ.setdefault("DATABASE_PORT", "5432")
+os.environ.setdefault("DATABASE_NAME", "benchmark")
+os.environ.setdefault("DATABASE_USER", "benchmark")
+os.environ.setdefault("DATABASE_PASSWORD", "benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app.models.response_model import FastJSONResponse, UnreadMessagesResponse  # noqa: E402
+
+
+def payload(messages: int, text_size: int) -> dict:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    unread = [
+        {
+            "id": i,
+            "from": f"Отправитель {i % 50}",
+            "text": "Сообщение " + "x" * text_size,
+            "date": (start + timedelta(seconds=i)).isoformat(),
+            "chat_name": f"Чат {i % 50}",
+            "chat_id": 1000 + i % 50,
+        }
+        for i in range(messages)
+    ]
+    return {"status": "success", "count": len(unread), "messages": unread}
+
+
+def default_encoder(data: dict) -> bytes:
+    return JSONResponse(jsonable_encoder(data)).body
+
+
+def model_json_dumps(data: dict) -> bytes:
+    model = UnreadMessagesResponse.model_validate(data)
+    return JSONResponse(model.model_dump(mode="json", by_alias=True)).body
+
+
+def model_dump_json(data: dict) -> bytes:
+    return UnreadMessagesResponse.model_validate(data).model_dump_json(by_alias=True).encode()
+
+
+def fast_json(data: dict) -> bytes:
+    return FastJSONResponse(data).body
+
+
+ENCODERS = {
+    "jsonable_encoder + json.dumps": default_encoder,
+    "response_model + json.dumps": model_json_dumps,
+    "response_model + dump_json": model_dump_json,
+    "FastJSONResponse (orjson)": fast_json,
+}
+
+
+def measure(encode, data: dict, repeat: int) -> list[float]:
+    encode(data)  # прогрев
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(data)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--text-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = payload(args.messages, args.text_size)
+    expected = json.loads(fast_json(data))
+    print(f"messages: {args.messages}, body: {len(fast_json(data)) / 1024:.0f} KiB")
+
+    baseline = None
+    for name, encode in ENCODERS.items():
+        assert json.loads(encode(data)) == expected, name
+        median = statistics.median(measure(encode, data, args.repeat)) * 1000
+        baseline = baseline or median
+        print(f"{name:<32} {median:8.2f} ms  x{baseline / median:.1f}")
+
+
+if __name__ == "__main__":
+    main()
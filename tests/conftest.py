@@ -1,4 +1,5 @@
 import os
+import time
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime
@@ -14,7 +15,18 @@ os.environ.setdefault("DATABASE_USER", "test_user")
 os.environ.setdefault("DATABASE_PASSWORD", "test_pass")
 os.environ.setdefault("SECRET_KEY", "test_secret_key")
 
-from app.services import auth
+from app.db.session.requests import ProfileSession
+from app.services import auth, broadcast, client_pool as client_pool_module, message_sync as message_sync_module, \
+    messages, read_ack
+from app.services.client_pool import TelegramClientPool
+from app.services.cache import MemoryCacheBackend
+from app.services.dialog_cache import DialogCache
+from app.services.entity_cache import EntityCache
+from app.services.activity import ActivityWriter
+from app.services.message_sync import MessageSync
+from app.services.rate_limit import RateLimiter, READ, SEND, ACK, AUTH
+from app.services.read_ack import ReadAckQueue
+from app.services.session_writer import SessionWriter
 
 
 # === Settings & Logger ===
@@ -58,6 +70,84 @@ def fake_logger(monkeypatch):
     return logger
 
 
+# === Client pool ===
+
+@pytest.fixture(autouse=True)
+def client_pool(monkeypatch):
+    """Свежий пул клиентов на каждый тест, чтобы тёплые клиенты не протекали между тестами"""
+    pool = TelegramClientPool(max_connected=10, idle_timeout=600, health_check_interval=60)
+    monkeypatch.setattr(messages, "client_pool", pool)
+    return pool
+
+
+@pytest.fixture(autouse=True)
+def dialog_cache(monkeypatch, client_pool):
+    """Свежий кэш диалогов, подписанный на тестовый пул"""
+    cache = DialogCache(ttl=60)
+    client_pool.on_connect.append(cache.attach)
+    client_pool.on_disconnect.append(cache.detach)
+    monkeypatch.setattr(messages, "dialog_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def entity_cache(monkeypatch):
+    cache = EntityCache(MemoryCacheBackend(max_size=100), ttl=60, negative_ttl=60)
+    for module in (messages, message_sync_module):
+        monkeypatch.setattr(module, "entity_cache", cache)
+    return cache
+
+
+@pytest.fixture(autouse=True)
+def read_ack_queue(monkeypatch, client_pool):
+    """Очередь отложенных отметок о прочтении без фонового воркера"""
+    queue = ReadAckQueue(client_pool, batch_delay=0, max_retries=2)
+    monkeypatch.setattr(messages, "read_ack_queue", queue)
+    return queue
+
+
+@pytest.fixture(autouse=True)
+def message_sync(monkeypatch, client_pool):
+    """Локальное хранилище непрочитанных без фоновой записи, подписанное на тестовый пул"""
+    sync = MessageSync(client_pool, flush_interval=0, reconnect_interval=60, backfill_limit=100,
+                       connect_concurrency=2)
+    client_pool.on_connect.append(sync.attach)
+    client_pool.on_disconnect.append(sync.detach)
+    monkeypatch.setattr(messages, "message_sync", sync)
+    return sync
+
+
+@pytest.fixture(autouse=True)
+def session_writer(monkeypatch):
+    """Отложенная запись сессий без фонового воркера: в тестах её можно только проверить"""
+    writer = SessionWriter(flush_delay=0)
+    for module in (client_pool_module, message_sync_module, messages):
+        monkeypatch.setattr(module, "session_writer", writer)
+    return writer
+
+
+@pytest.fixture(autouse=True)
+def activity_writer(monkeypatch):
+    """Отложенная запись времени активности без фонового воркера"""
+    writer = ActivityWriter(flush_interval=0)
+    monkeypatch.setattr(auth, "activity_writer", writer)
+    return writer
+
+
+@pytest.fixture(autouse=True)
+def rate_limiter(monkeypatch):
+    """Свежий ограничитель с запасом по лимитам, чтобы тесты не ждали токенов"""
+    limiter = RateLimiter(
+        limits={method_class: (1000.0, 1000) for method_class in (READ, SEND, ACK, AUTH)},
+        backoff=0.5,
+        recovery=1.05,
+        min_rate=1.0,
+    )
+    for module in (auth, broadcast, messages, read_ack):
+        monkeypatch.setattr(module, "rate_limiter", limiter)
+    return limiter
+
+
 # === Fake Client ===
 
 @pytest.fixture
@@ -193,8 +283,8 @@ def mock_client(request):
         last_name="User",
         username="test_username"
     ))
-    client.session = AsyncMock()
-    client.session.save = AsyncMock(return_value="new_session_string")
+    client.session = MagicMock()
+    client.session.save = MagicMock(return_value="new_session_string")
 
     # Методы для messages
     client.get_dialogs = AsyncMock()
@@ -204,6 +294,7 @@ def mock_client(request):
     client.get_entity = AsyncMock()
     client.iter_dialogs = AsyncMock()
     client.disconnect = AsyncMock()
+    client.add_event_handler = MagicMock()
 
     return client
 
@@ -221,6 +312,18 @@ def mock_profile_messages():
     return profile
 
 
+@pytest.fixture
+def mock_profile_session():
+    """Профиль с активной сессией, как его возвращает get_profile_session"""
+    return ProfileSession(
+        profile_id=1,
+        phone="+1234567890",
+        is_authorized=True,
+        session_id=1,
+        session_string="old_session",
+    )
+
+
 @pytest.fixture
 def mock_session():
     session = AsyncMock()
@@ -244,8 +347,8 @@ def mock_client_messages():
     client.send_message = AsyncMock()
     client.get_entity = AsyncMock()
     client.iter_dialogs = AsyncMock()
-    client.session = AsyncMock()
-    client.session.save = AsyncMock(return_value="new_session_string")
+    client.session = MagicMock()
+    client.session.save = MagicMock(return_value="new_session_string")
     return client
 
 
@@ -269,4 +372,105 @@ def mock_message():
     msg.date = datetime.now()
     msg.sender_id = 456
     msg.sender = AsyncMock(first_name="John", username="john_doe")
-    return msg
\ No newline at end of file
+    return msg
+
+# === Redis ===
+
+class FakeRedis:
+    """Redis в памяти: только команды, которые использует RedisCacheBackend"""
+
+    def __init__(self):
+        self.data: dict[str, tuple[float | None, object]] = {}
+        self.round_trips = 0
+
+    @staticmethod
+    def _name(key) -> str:
+        return key.decode() if isinstance(key, bytes) else key
+
+    def _alive(self, name: str):
+        item = self.data.get(name)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.data[name]
+            return None
+        return item
+
+    async def get(self, key):
+        self.round_trips += 1
+        item = self._alive(self._name(key))
+        return None if item is None else item[1]
+
+    async def set(self, key, value, px=None):
+        self.round_trips += 1
+        expires_at = None if px is None else time.monotonic() + px / 1000
+        self.data[self._name(key)] = (expires_at, value)
+
+    async def delete(self, *keys):
+        self.round_trips += 1
+        for key in keys:
+            self.data.pop(self._name(key), None)
+
+    async def sadd(self, key, *members):
+        self.round_trips += 1
+        name = self._name(key)
+        item = self._alive(name)
+        expires_at, value = item if item is not None else (None, set())
+        value.update(member.encode() if isinstance(member, str) else member for member in members)
+        self.data[name] = (expires_at, value)
+
+    async def smembers(self, key):
+        self.round_trips += 1
+        item = self._alive(self._name(key))
+        return set() if item is None else set(item[1])
+
+    async def pexpire(self, key, ms, nx=False, gt=False):
+        self.round_trips += 1
+        name = self._name(key)
+        item = self._alive(name)
+        if item is None:
+            return False
+        expires_at, value = item
+        new_expires_at = time.monotonic() + ms / 1000
+        if nx and expires_at is not None:
+            return False
+        # без TTL ключ живёт вечно, GT такой срок не сокращает
+        if gt and (expires_at is None or expires_at >= new_expires_at):
+            return False
+        self.data[name] = (new_expires_at, value)
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        results = []
+        for name, args, kwargs in self.calls:
+            results.append(await getattr(self.redis, name)(*args, **kwargs))
+        self.calls = []
+        self.redis.round_trips -= len(results) - 1  # пайплайн — один round trip
+        return results
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
@@ -0,0 +1,67 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.db.profile.requests import update_profile
+from app.services import activity as activity_module
+from app.services.activity import ActivityWriter
+
+
+@pytest.fixture
+def update_last_login(monkeypatch):
+    monkeypatch.setattr(activity_module, "SessionLocal", MagicMock())
+    with patch('app.services.activity.update_last_login', new_callable=AsyncMock) as mock_update:
+        yield mock_update
+
+
+@pytest.mark.asyncio
+async def test_touches_are_coalesced_into_one_write(update_last_login):
+    """Много отметок активности — один UPDATE с самым поздним временем на профиль"""
+    writer = ActivityWriter(flush_interval=0)
+    now = datetime.now()
+    writer.touch(1, now)
+    writer.touch(1, now + timedelta(seconds=5))
+    writer.touch(1, now + timedelta(seconds=2))
+    writer.touch(2, now)
+
+    assert writer.last_seen(1) == now + timedelta(seconds=5)
+    await writer.flush()
+
+    update_last_login.assert_awaited_once()
+    assert update_last_login.await_args.args[1] == {1: now + timedelta(seconds=5), 2: now}
+    assert len(writer) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_kept_until_close(update_last_login):
+    """Неудачная запись не теряется и дописывается при остановке"""
+    writer = ActivityWriter(flush_interval=0)
+    writer.touch(1)
+    update_last_login.side_effect = [Exception("db down"), None]
+
+    with pytest.raises(Exception):
+        await writer.flush()
+    assert len(writer) == 1
+
+    await writer.close()
+    assert update_last_login.await_count == 2
+    assert len(writer) == 0
+
+
+@pytest.mark.asyncio
+async def test_update_profile_writes_only_changed_fields():
+    """update_profile: один UPDATE по изменившимся полям, без refresh и last_login"""
+    db = AsyncMock()
+    db.__aenter__.return_value = db
+    profile = MagicMock(id=1, is_authorized=True, phone_code_hash="hash", first_name="A",
+                        last_name=None, username="a", last_login=None)
+
+    await update_profile(db, profile, is_authorized=True)
+    db.execute.assert_not_called()
+
+    await update_profile(db, profile, is_authorized=True, phone_code_hash=None, first_name="B")
+    db.execute.assert_awaited_once()
+    db.refresh.assert_not_called()
+    assert profile.phone_code_hash is None
+    assert profile.first_name == "B"
+    assert profile.last_login is None
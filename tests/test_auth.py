@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, patch
 
+from app.models.response_model import ProfilesResponse
 from app.services.auth import (
     start_auth,
     verify_code,
@@ -190,6 +191,7 @@ async def test_get_user_profiles_success(mock_db, mock_profile, fake_logger):
         assert result["status"] == "success"
         assert len(result["profiles"]) == 1
         assert result["profiles"][0]["phone"] == "+1234567890"
+        ProfilesResponse.model_validate(result)
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from dataclasses import replace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from telethon.errors import FloodWaitError
+
+from app.models.response_model import BatchJobResponse
+from app.services import broadcast
+from app.services.broadcast import BatchScheduler, send_batch, get_batch_status
+
+
+@pytest.fixture(autouse=True)
+def batch_scheduler(monkeypatch):
+    scheduler = BatchScheduler(interval=0, flood_wait_max=5, job_ttl=60)
+    monkeypatch.setattr(broadcast, "batch_scheduler", scheduler)
+    monkeypatch.setattr(broadcast, "SessionLocal", MagicMock())
+    return scheduler
+
+
+@pytest.fixture
+def prepared_client(mock_client):
+    with patch('app.services.broadcast._prepare_authorized_client', new_callable=AsyncMock) as mock_prepare, \
+            patch('app.services.broadcast._get_tg_entity', new_callable=AsyncMock) as mock_get_entity:
+        mock_prepare.return_value = (None, mock_client, None)
+        mock_get_entity.side_effect = lambda client, phone, receiver: f"peer:{receiver}"
+        yield mock_client
+
+
+@pytest.mark.asyncio
+async def test_send_batch_reports_per_receiver_results(mock_db, mock_profile_session, prepared_client):
+    """Результат по каждому получателю, в порядке запроса"""
+    prepared_client.send_message.side_effect = [None, Exception("Chat write forbidden"), None]
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": r} for r in ("a", "b", "c")]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = mock_profile_session
+
+        result = await send_batch(mock_db, user_id=1, messages=messages, wait=True)
+
+    assert result["status"] == "done"
+    assert (result["sent"], result["failed"], result["pending"]) == (2, 1, 0)
+    assert [r["status"] for r in result["results"]] == ["sent", "error", "sent"]
+    assert result["results"][1]["message"] == "Chat write forbidden"
+    BatchJobResponse.model_validate(result)
+
+
+@pytest.mark.asyncio
+async def test_send_batch_waits_out_flood_wait(mock_db, mock_profile_session, prepared_client):
+    """FloodWait не теряет отправку: сообщение уходит после ожидания"""
+    prepared_client.send_message.side_effect = [FloodWaitError(request=None, capture=0), None]
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": "a"}]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = mock_profile_session
+
+        result = await send_batch(mock_db, user_id=1, messages=messages, wait=True)
+
+    assert result["sent"] == 1
+    assert prepared_client.send_message.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_send_batch_rejects_unauthorized_profile(mock_db, mock_profile_session, prepared_client):
+    """Сообщения от неавторизованного профиля сразу получают ошибку"""
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": "a"}]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = replace(mock_profile_session, is_authorized=False)
+
+        result = await send_batch(mock_db, user_id=1, messages=messages, wait=True)
+
+    assert result["failed"] == 1
+    prepared_client.send_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_batch_progress_is_pollable(mock_db, mock_profile_session, prepared_client, batch_scheduler):
+    """Без wait возвращается job_id, по которому виден прогресс; чужой пользователь задачу не видит"""
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": "a"}]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = mock_profile_session
+
+        accepted = await send_batch(mock_db, user_id=1, messages=messages)
+
+    assert "results" not in accepted
+    BatchJobResponse.model_validate(accepted)
+    await batch_scheduler.get_job(accepted["job_id"], 1).done.wait()
+
+    status = get_batch_status(1, accepted["job_id"])
+    assert status["sent"] == 1
+    BatchJobResponse.model_validate(status)
+    assert get_batch_status(2, accepted["job_id"])["status"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_send_batch_client_error_fails_queued_sends(mock_db, mock_profile_session, mock_client):
+    """Ошибка подключения не роняет воркер: отправки профиля получают error, задача завершается"""
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": r} for r in ("a", "b")]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.broadcast._prepare_authorized_client', new_callable=AsyncMock) as mock_prepare:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_prepare.side_effect = [ConnectionError("Connection lost"), (None, mock_client, None)]
+
+        result = await send_batch(mock_db, user_id=1, messages=messages, wait=True)
+        assert result["status"] == "done"
+        assert [r["message"] for r in result["results"]] == ["Connection lost", "Connection lost"]
+
+        # воркер поднимается заново на следующую пачку
+        result = await send_batch(mock_db, user_id=1, messages=messages[:1], wait=True)
+        assert result["sent"] == 1
+
+
+@pytest.mark.asyncio
+async def test_send_batch_wait_is_bounded(mock_db, mock_profile_session, prepared_client, monkeypatch):
+    """wait=True не ждёт дольше SEND_BATCH_WAIT_TIMEOUT: отдаёт прогресс"""
+    monkeypatch.setattr(broadcast.settings, "SEND_BATCH_WAIT_TIMEOUT", 0.01)
+    async def slow_send(*args):
+        await asyncio.sleep(1)
+
+    prepared_client.send_message.side_effect = slow_send
+    messages = [{"phone": "+1234567890", "text": "Hi", "tg_receiver": "a"}]
+
+    with patch('app.services.broadcast.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = mock_profile_session
+
+        result = await send_batch(mock_db, user_id=1, messages=messages, wait=True)
+
+    assert (result["status"], result["pending"]) == ("running", 1)
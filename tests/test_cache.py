@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock
+from redis.exceptions import ConnectionError as RedisConnectionError
+from telethon import types
+
+from app.middleware.jwt import PrincipalCache, PrincipalCodec, Principal
+from app.services import cache as cache_module
+from app.services.cache import MemoryCacheBackend, RedisCacheBackend, MISSING
+from app.services.entity_cache import EntityCache, InputPeerCodec, NOT_FOUND
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend_factory(request, fake_redis):
+    """Одни и те же тесты для кэша в памяти и для Redis"""
+    def factory(namespace, codec):
+        if request.param == "memory":
+            return MemoryCacheBackend(max_size=100)
+        return RedisCacheBackend(fake_redis, namespace, codec)
+    return factory
+
+
+@pytest.mark.asyncio
+async def test_principal_cache_roundtrip_and_invalidate_user(backend_factory):
+    cache = PrincipalCache(backend_factory("principal", PrincipalCodec()), ttl=60)
+    principal = Principal(id=1, email="user@example.com", created_at=datetime(2025, 1, 1, 12, 30))
+    expires_at = datetime.now().timestamp() + 3600
+
+    await cache.set("h.p.sig1", principal, expires_at)
+    await cache.set("h.p.sig2", principal, expires_at)
+    assert await cache.get("h.p.sig1") == principal
+
+    await cache.invalidate_user(1)
+
+    assert await cache.get("h.p.sig1") is None
+    assert await cache.get("h.p.sig2") is None
+
+
+@pytest.mark.asyncio
+async def test_entity_cache_roundtrip_and_invalidate_phone(backend_factory):
+    cache = EntityCache(backend_factory("entity", InputPeerCodec()), ttl=60, negative_ttl=60)
+    peer = types.InputPeerUser(user_id=42, access_hash=-123456789)
+
+    await cache.set("+1", 42, peer)
+    await cache.set_not_found("+1", "ghost")
+    await cache.set("+2", 42, peer)
+
+    assert await cache.get("+1", 42) == peer
+    assert await cache.get("+1", "ghost") is NOT_FOUND
+
+    await cache.invalidate("+1")
+
+    assert await cache.get("+1", 42) is None
+    assert await cache.get("+1", "ghost") is None
+    assert await cache.get("+2", 42) == peer
+
+
+@pytest.mark.asyncio
+async def test_redis_set_with_tags_is_one_round_trip(fake_redis):
+    """Запись и её теги уходят одним пайплайном, TTL ставит Redis"""
+    backend = RedisCacheBackend(fake_redis, "entity", InputPeerCodec())
+
+    await backend.set("+1:42", types.InputPeerUser(user_id=42, access_hash=1), ttl=60, tags=("+1",))
+
+    assert fake_redis.round_trips == 1
+    assert await backend.get("+1:missing") is MISSING
+
+    await backend.set("+1:43", types.InputPeerUser(user_id=43, access_hash=1), ttl=0)
+    assert await backend.get("+1:43") is MISSING
+
+
+def test_codecs_are_compact():
+    peer = types.InputPeerChannel(channel_id=1234567890, access_hash=-987654321)
+    principal = Principal(id=1, email="user@example.com", created_at=datetime(2025, 1, 1))
+
+    assert len(InputPeerCodec().dumps(peer)) == 20
+    assert PrincipalCodec().loads(PrincipalCodec().dumps(principal)) == principal
+
+
+@pytest.mark.asyncio
+async def test_memory_tags_forget_evicted_and_expired_keys():
+    """Вытесненные и просроченные записи уходят из тегов, теги не растут без предела"""
+    backend = MemoryCacheBackend(max_size=2)
+    await backend.set("a", 1, ttl=60, tags=("user:1",))
+    await backend.set("b", 2, ttl=0.001, tags=("user:1", "user:2"))
+    await backend.set("c", 3, ttl=60, tags=("user:3",))
+
+    assert "a" not in backend._tags["user:1"]
+    assert "a" not in backend._key_tags
+
+    await asyncio.sleep(0.01)
+    assert await backend.get("b") is MISSING
+    assert backend._tags == {"user:3": {"c"}}
+    assert backend._key_tags == {"c": {"user:3"}}
+
+
+@pytest.mark.asyncio
+async def test_redis_errors_are_cache_misses(caplog):
+    """Недоступный Redis — промах и строка в логе, а не 500 на каждый запрос"""
+    redis = AsyncMock()
+    redis.get.side_effect = RedisConnectionError("connection refused")
+    redis.smembers.side_effect = RedisConnectionError("connection refused")
+    redis.delete.side_effect = RedisConnectionError("connection refused")
+    backend = RedisCacheBackend(redis, "principal", PrincipalCodec())
+
+    assert await backend.get("h.p.sig") is MISSING
+    await backend.delete("h.p.sig")
+    await backend.delete_tag("user:1")
+
+    assert [record.levelname for record in caplog.records if record.name == "app.services.cache"] == ["ERROR"] * 3
+
+
+@pytest.mark.asyncio
+async def test_hanging_redis_is_a_fast_cache_miss(monkeypatch, caplog):
+    """Redis, который принимает соединение и молчит, не подвешивает запросы: срабатывает socket_timeout"""
+    connections = []
+
+    async def silent(reader, writer):
+        connections.append(writer)
+
+    server = await asyncio.start_server(silent, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(cache_module.settings, "REDIS_URL", f"redis://127.0.0.1:{port}/0")
+    monkeypatch.setattr(cache_module.settings, "REDIS_SOCKET_TIMEOUT", 0.05)
+    monkeypatch.setattr(cache_module.settings, "REDIS_CONNECT_TIMEOUT", 0.05)
+    monkeypatch.setattr(cache_module, "_redis", None)
+    backend = RedisCacheBackend(cache_module.get_redis(), "principal", PrincipalCodec())
+    try:
+        assert await asyncio.wait_for(backend.get("h.p.sig"), timeout=2) is MISSING
+        await asyncio.wait_for(backend.delete_tag("user:1"), timeout=2)
+    finally:
+        await cache_module.close_redis()
+        for writer in connections:
+            writer.close()
+        server.close()
+        await server.wait_closed()
+
+    assert any(record.name == "app.services.cache" for record in caplog.records)
@@ -0,0 +1,116 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.services.client_pool import TelegramClientPool
+
+
+def _make_client(connected: bool = True):
+    client = AsyncMock()
+    client.is_connected = MagicMock(return_value=connected)
+    client.is_user_authorized = AsyncMock(return_value=True)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_checkout_returns_pooled_client():
+    """Клиент, возвращённый в пул, выдаётся повторно"""
+    pool = TelegramClientPool(max_connected=2, idle_timeout=600, health_check_interval=60)
+    client = _make_client()
+
+    await pool.put("+1", client)
+    pool.release("+1")
+
+    assert await pool.checkout("+1") is client
+    assert await pool.checkout("+2") is None
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_saves_session():
+    """При переполнении вытесняется давно не использованный свободный клиент"""
+    on_evict = AsyncMock()
+    pool = TelegramClientPool(max_connected=2, idle_timeout=600, health_check_interval=60, on_evict=on_evict)
+    clients = {phone: _make_client() for phone in ("+1", "+2", "+3")}
+
+    for phone in ("+1", "+2"):
+        await pool.put(phone, clients[phone])
+        pool.release(phone)
+    await pool.checkout("+1")
+    pool.release("+1")
+    await pool.put("+3", clients["+3"])
+
+    on_evict.assert_called_once_with("+2", clients["+2"])
+    clients["+2"].disconnect.assert_called_once()
+    assert len(pool) == 2
+
+
+@pytest.mark.asyncio
+async def test_busy_clients_are_not_evicted():
+    """Клиенты, занятые запросами, не вытесняются даже при переполнении"""
+    pool = TelegramClientPool(max_connected=1, idle_timeout=600, health_check_interval=60)
+    first, second = _make_client(), _make_client()
+
+    await pool.put("+1", first)
+    await pool.put("+2", second)
+
+    first.disconnect.assert_not_called()
+    assert len(pool) == 2
+
+
+@pytest.mark.asyncio
+async def test_pinned_clients_are_not_evicted():
+    """Закреплённый клиент не отключается ни по простою, ни при переполнении"""
+    pool = TelegramClientPool(max_connected=1, idle_timeout=0, health_check_interval=60)
+    pinned, other = _make_client(), _make_client()
+    pool.pin("+1")
+
+    await pool.put("+1", pinned)
+    pool.release("+1")
+    await pool.put("+2", other)
+    pool.release("+2")
+    await pool.evict_idle()
+
+    pinned.disconnect.assert_not_called()
+    other.disconnect.assert_called_once()
+    assert await pool.checkout("+1") is pinned
+
+
+@pytest.mark.asyncio
+async def test_health_check_drops_dead_client():
+    """Отключившийся клиент выбрасывается из пула"""
+    pool = TelegramClientPool(max_connected=2, idle_timeout=600, health_check_interval=0)
+    client = _make_client()
+    await pool.put("+1", client)
+    pool.release("+1")
+
+    client.is_user_authorized.return_value = False
+
+    assert await pool.checkout("+1") is None
+    assert len(pool) == 0
+    client.disconnect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_close_evicts_everything():
+    """При остановке все клиенты отключаются с сохранением сессии"""
+    on_evict = AsyncMock()
+    pool = TelegramClientPool(max_connected=2, idle_timeout=600, health_check_interval=60, on_evict=on_evict)
+    client = _make_client()
+    await pool.put("+1", client)
+
+    await pool.close()
+
+    on_evict.assert_called_once_with("+1", client)
+    assert len(pool) == 0
+
+
+def test_pin_is_capped_by_max_pinned():
+    """Закрепить можно не больше max_pinned профилей, повторное закрепление не считается"""
+    pool = TelegramClientPool(max_connected=3, idle_timeout=600, health_check_interval=60, max_pinned=2)
+
+    assert pool.pin("+1") and pool.pin("+2")
+    assert not pool.pin("+3")
+    assert pool.pin("+2")
+
+    pool.unpin("+1")
+    assert pool.pin("+3")
+    assert pool.stats()["pinned"] == 2
@@ -0,0 +1,68 @@
+import hashlib
+
+import pytest
+
+from app.services import crypto
+from app.services.crypto import hash_password, verify_password, needs_rehash
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashing(monkeypatch):
+    """Минимальная стоимость хэширования, чтобы тесты шли быстро"""
+    monkeypatch.setattr(crypto.settings, "PASSWORD_HASH_ALGORITHM", "scrypt")
+    monkeypatch.setattr(crypto.settings, "PASSWORD_SCRYPT_N", 2 ** 4)
+    monkeypatch.setattr(crypto.settings, "PASSWORD_PBKDF2_ITERATIONS", 10)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["scrypt", "pbkdf2_sha256"])
+async def test_hash_and_verify(monkeypatch, algorithm):
+    monkeypatch.setattr(crypto.settings, "PASSWORD_HASH_ALGORITHM", algorithm)
+
+    password_hash = await hash_password("secret")
+
+    assert password_hash.startswith(f"{algorithm}$")
+    assert password_hash != await hash_password("secret")  # соль каждый раз новая
+    assert await verify_password("secret", password_hash)
+    assert not await verify_password("wrong", password_hash)
+    assert not needs_rehash(password_hash)
+
+
+@pytest.mark.asyncio
+async def test_legacy_sha256_is_verified_and_needs_rehash():
+    """Старые sha256-хэши принимаются, но помечаются на перехэширование"""
+    legacy = hashlib.sha256(b"secret").hexdigest()
+
+    assert await verify_password("secret", legacy)
+    assert not await verify_password("wrong", legacy)
+    assert needs_rehash(legacy)
+
+
+@pytest.mark.asyncio
+async def test_changed_cost_needs_rehash(monkeypatch):
+    password_hash = await hash_password("secret")
+
+    monkeypatch.setattr(crypto.settings, "PASSWORD_SCRYPT_N", 2 ** 5)
+
+    assert needs_rehash(password_hash)
+    assert await verify_password("secret", password_hash)
+
+
+@pytest.mark.asyncio
+async def test_malformed_hash_is_rejected():
+    assert not await verify_password("secret", "scrypt$broken")
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_is_verified_against_dummy_hash(monkeypatch):
+    """Для несуществующего пользователя scrypt всё равно выполняется, а результат — False"""
+    calls = []
+    original = crypto._scrypt
+    monkeypatch.setattr(crypto, "_scrypt", lambda *args: calls.append(args) or original(*args))
+
+    assert not await verify_password("secret", None)
+    calls.clear()
+    assert not await verify_password("secret", None)
+
+    assert len(calls) == 1
+    assert not needs_rehash(crypto._dummy_hash)
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, event, exc, text
+
+from app.config.config import Settings
+from app.db.database import PoolStats, get_pool_status, _query_started, _query_finished, _query_failed
+from app.services.timings import RequestTimings, request_timings
+
+
+def test_pool_limits_default_to_per_worker_settings():
+    settings = Settings.for_testing()
+
+    assert settings.db_pool_limits() == (settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+
+
+def test_pool_limits_split_connection_budget_between_workers():
+    """Общий лимит соединений делится между воркерами"""
+    settings = Settings.for_testing().model_copy(
+        update={"DB_MAX_CONNECTIONS": 30, "WEB_CONCURRENCY": 4, "DB_POOL_SIZE": 5, "DB_MAX_OVERFLOW": 10}
+    )
+
+    pool_size, max_overflow = settings.db_pool_limits()
+
+    assert (pool_size, max_overflow) == (5, 2)
+    assert (pool_size + max_overflow) * 4 <= 30
+
+
+def test_pool_stats_record_wait():
+    stats = PoolStats()
+
+    stats.record(0.002)
+    stats.record(0.010)
+
+    assert stats.checkouts == 2
+    assert stats.wait_max == 0.010
+
+
+def test_pool_status_fields():
+    status = get_pool_status()
+
+    assert {"size", "checked_out", "overflow", "checkouts", "timeouts", "avg_wait_ms", "max_wait_ms"} <= status.keys()
+
+
+def test_failed_query_does_not_skew_query_timings():
+    """Упавший запрос учитывается в db_ms и не сбивает время следующих запросов"""
+    engine = create_engine("sqlite://")
+    event.listen(engine, "before_cursor_execute", _query_started)
+    event.listen(engine, "after_cursor_execute", _query_finished)
+    event.listen(engine, "handle_error", _query_failed)
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(exc.OperationalError):
+                conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            assert "query_start" not in conn.info
+    finally:
+        request_timings.reset(token)
+        engine.dispose()
+
+    assert timings.db_queries == 2
+    assert timings.db_ms > 0
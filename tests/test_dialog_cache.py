@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+from unittest.mock import MagicMock
+
+from app.services.dialog_cache import DialogCache
+
+
+def _dialog(dialog_id: int, unread_count: int = 0):
+    dialog = MagicMock(unread_count=unread_count, is_group=False, is_channel=False)
+    dialog.id = dialog_id
+    dialog.name = f"Chat {dialog_id}"
+    return dialog
+
+
+def test_get_respects_ttl():
+    """Просроченная запись не отдаётся"""
+    cache = DialogCache(ttl=-1)
+    cache.set("+1", [_dialog(1)])
+
+    assert cache.get("+1") is None
+
+
+def test_partial_page_does_not_serve_full_list():
+    """Закэшированная первая страница не подменяет полный список диалогов"""
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1), _dialog(2)], limit=2)
+
+    assert [d.id for d in cache.get("+1", limit=1)] == [1]
+    assert cache.get("+1", limit=5) is None
+    assert cache.get("+1") is None
+
+
+def test_short_page_is_complete():
+    """Если Telegram вернул меньше limit, это весь список"""
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1)], limit=50)
+
+    assert [d.id for d in cache.get("+1")] == [1]
+
+
+def test_new_message_updates_entry_incrementally():
+    """Входящее сообщение увеличивает счётчик и поднимает диалог наверх"""
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1), _dialog(2, unread_count=1)])
+
+    cache.on_new_message("+1", 2, incoming=True)
+
+    dialogs = cache.get("+1")
+    assert [d.id for d in dialogs] == [2, 1]
+    assert dialogs[0].unread_count == 2
+
+
+def test_new_message_moves_cursor_position():
+    """Последнее сообщение диалога обновляется — курсор страницы строится по нему"""
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1), _dialog(2)])
+
+    cache.on_new_message("+1", 2, incoming=True, message_id=77, date=datetime(2024, 1, 1))
+
+    dialog = cache.get("+1")[0]
+    assert (dialog.id, dialog.message_id, dialog.date) == (2, 77, datetime(2024, 1, 1))
+
+
+def test_message_in_unknown_chat_invalidates():
+    """Сообщение в незакэшированный чат сбрасывает запись"""
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1)])
+
+    cache.on_new_message("+1", 99, incoming=True)
+
+    assert cache.get("+1") is None
+
+
+def test_mark_read_resets_unread_count():
+    cache = DialogCache(ttl=60)
+    cache.set("+1", [_dialog(1, unread_count=3)])
+
+    cache.mark_read("+1", 1)
+
+    assert cache.get("+1")[0].unread_count == 0
+
+
+@pytest.mark.asyncio
+async def test_attach_registers_event_handlers():
+    """Кэш подписывается на новые сообщения, прочтение и закрепление диалогов"""
+    cache = DialogCache(ttl=60)
+    client = MagicMock()
+
+    cache.attach("+1", client)
+
+    assert client.add_event_handler.call_count == 3
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.middleware import jwt as jwt_module
+from app.middleware.jwt import PrincipalCache, Principal, create_access_token, get_current_user, forget_tokens
+from app.services import crypto
+from app.services.cache import MemoryCacheBackend
+
+
+@pytest.fixture(autouse=True)
+def principal_cache(monkeypatch):
+    cache = PrincipalCache(MemoryCacheBackend(max_size=10), ttl=60)
+    monkeypatch.setattr(jwt_module, "principal_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def db_user():
+    user = MagicMock()
+    user.id = 1
+    user.email = "user@example.com"
+    user.created_at = datetime(2025, 1, 1)
+    return user
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_is_cached(mock_db, db_user):
+    """Повторный запрос с тем же токеном не проверяет подпись и не ходит в БД"""
+    token = create_access_token(1)
+
+    with patch('app.middleware.jwt.get_user_by_id', new_callable=AsyncMock) as mock_get_user, \
+            patch('app.middleware.jwt.jwt.decode', wraps=jwt_module.jwt.decode) as mock_decode:
+        mock_get_user.return_value = db_user
+
+        first = await get_current_user(MagicMock(), None, token, mock_db)
+        second = await get_current_user(MagicMock(), None, token, mock_db)
+
+        assert first == second == Principal(id=1, email="user@example.com", created_at=datetime(2025, 1, 1))
+        mock_get_user.assert_called_once()
+        mock_decode.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_invalidate_user_drops_cached_tokens(mock_db, db_user, principal_cache):
+    """После invalidate_user токен проверяется заново"""
+    token = create_access_token(1)
+
+    with patch('app.middleware.jwt.get_user_by_id', new_callable=AsyncMock) as mock_get_user:
+        mock_get_user.return_value = db_user
+
+        await get_current_user(MagicMock(), None, token, mock_db)
+        await principal_cache.invalidate_user(1)
+        await get_current_user(MagicMock(), None, token, mock_db)
+
+        assert mock_get_user.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_entry_does_not_outlive_token(principal_cache):
+    """Запись не живёт дольше срока действия токена"""
+    principal = Principal(id=1, email="user@example.com", created_at=datetime(2025, 1, 1))
+
+    await principal_cache.set("a.b.expired", principal, expires_at=time.time() - 1)
+
+    assert await principal_cache.get("a.b.expired") is None
+
+
+@pytest.mark.asyncio
+async def test_forget_tokens_drops_all_user_tokens(mock_db, db_user, principal_cache):
+    """Выход по bearer-токену сбрасывает и остальные токены пользователя"""
+    bearer, cookie = create_access_token(1), create_access_token(1) + "x"
+    principal = Principal(id=1, email="user@example.com", created_at=datetime(2025, 1, 1))
+    await principal_cache.set(cookie, principal, expires_at=time.time() + 60)
+
+    await forget_tokens(bearer, None)
+
+    assert await principal_cache.get(cookie) is None
+
+
+@pytest.mark.asyncio
+async def test_token_check_does_not_queue_behind_password_hashing(mock_db, db_user, monkeypatch):
+    """Проверка JWT не ждёт в пуле crypto, даже если он целиком занят хэшированием паролей"""
+    busy = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(crypto, "crypto_executor", executor)
+    hashing = asyncio.ensure_future(crypto.run_crypto(busy.wait))
+    token = create_access_token(1)
+    try:
+        with patch('app.middleware.jwt.get_user_by_id', new_callable=AsyncMock, return_value=db_user):
+            principal = await asyncio.wait_for(get_current_user(MagicMock(), None, token, mock_db), timeout=1)
+        tokens = await asyncio.wait_for(jwt_module.create_tokens(1), timeout=1)
+    finally:
+        busy.set()
+        await hashing
+        executor.shutdown()
+
+    assert principal.id == 1
+    assert tokens["token_type"] == "bearer"
@@ -0,0 +1,200 @@
+import logging
+import queue
+
+import pytest
+
+from app.middleware import logging as logging_module
+from app.middleware.logging import BoundedQueueHandler, ErrorDeduplicationFilter, LogSampler, LoggingMiddleware
+from app.services.metrics import metrics_registry
+from app.services.timings import add_timing, request_timings
+
+
+def _scope(path="/messages/unread"):
+    return {
+        "type": "http",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"x-real-ip", b"10.0.0.1")],
+        "client": ("127.0.0.1", 5000),
+        "server": ("testserver", 80),
+        "state": {},
+    }
+
+
+@pytest.fixture
+def log_queue(monkeypatch):
+    log_queue = queue.Queue()
+    handler = BoundedQueueHandler(log_queue)
+    logger = logging.getLogger("test.middleware")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [handler]
+    monkeypatch.setattr(logging_module, "logger", logger)
+    return log_queue
+
+
+@pytest.mark.asyncio
+async def test_request_is_logged_with_vector_fields(log_queue):
+    """В лог попадают поля, которые разбирает vector.yaml"""
+    async def app(scope, receive, send):
+        scope["state"]["user"] = type("Principal", (), {"email": "user@example.com"})()
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    await LoggingMiddleware(app)(_scope(), None, send)
+
+    record = log_queue.get_nowait()
+    assert record.levelno == logging.INFO
+    assert record.msg["http_code"] == 201
+    assert record.msg["username"] == "user@example.com"
+    assert record.msg["user_ip"] == "10.0.0.1"
+    assert record.msg["request_method"] == "POST"
+    assert record.msg["request_url"] == "http://testserver/messages/unread"
+    assert "request_duration_ms" in record.msg
+
+
+@pytest.mark.asyncio
+async def test_request_timings_are_logged(log_queue):
+    """Время БД и Telegram, добавленное во время запроса, попадает в его запись"""
+    async def app(scope, receive, send):
+        add_timing("db", 0.002)
+        add_timing("db", 0.003)
+        add_timing("tg_rpc", 0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    await LoggingMiddleware(app)(_scope(), None, send)
+
+    record = log_queue.get_nowait()
+    assert record.msg["db_ms"] == 5.0
+    assert record.msg["db_queries"] == 2
+    assert record.msg["tg_rpc_ms"] == 10.0
+    assert record.msg["tg_rpcs"] == 1
+    assert record.msg["tg_connect_ms"] == 0.0
+    assert request_timings.get() is None
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_is_not_buffered(log_queue):
+    """Куски потокового ответа уходят сразу, запись в лог — после последнего"""
+    sent = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"a", "more_body": True})
+        assert sent[-1]["body"] == b"a"
+        assert log_queue.empty()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send(message):
+        sent.append(message)
+
+    await LoggingMiddleware(app)(_scope(), None, send)
+
+    assert log_queue.qsize() == 1
+
+
+@pytest.mark.asyncio
+async def test_exception_is_logged(log_queue):
+    async def app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await LoggingMiddleware(app)(_scope(), None, None)
+
+    record = log_queue.get_nowait()
+    assert record.levelno == logging.ERROR
+    assert record.msg["exception_type"] == "RuntimeError"
+
+
+@pytest.mark.parametrize("overflow, kept", [("drop_new", "first"), ("drop_oldest", "second")])
+def test_queue_overflow_policy(overflow, kept):
+    """Переполнение очереди не блокирует, потерянные записи считаются"""
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1), overflow=overflow)
+
+    for msg in ("first", "second"):
+        handler.emit(logging.makeLogRecord({"msg": msg}))
+
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == kept
+
+
+def test_success_sampled_but_errors_and_slow_requests_kept(log_queue, monkeypatch):
+    """Успешные быстрые запросы режутся долей маршрута, ошибки и медленные — никогда"""
+    monkeypatch.setattr(logging_module, "log_sampler", LogSampler(0.0, {}, budget=0))
+    monkeypatch.setattr(logging_module.settings, "LOG_SLOW_REQUEST_MS", 1000)
+
+    LoggingMiddleware.log(_scope(), 200, 0.0, 0.01)
+    assert log_queue.empty()
+
+    LoggingMiddleware.log(_scope(), 404, 0.0, 0.01)
+    LoggingMiddleware.log(_scope(), 200, 0.0, 1.5)
+    codes = [log_queue.get_nowait().msg["http_code"] for _ in range(2)]
+    assert codes == [404, 200]
+
+
+def test_sample_rate_by_route_template(log_queue, monkeypatch):
+    route = type("Route", (), {"path": "/messages/send/batch/{job_id}"})()
+    monkeypatch.setattr(logging_module, "log_sampler", LogSampler(0.0, {route.path: 1.0}, budget=0))
+
+    LoggingMiddleware.log({**_scope("/messages/send/batch/7"), "route": route}, 200, 0.0, 0.01)
+    LoggingMiddleware.log(_scope("/messages/dialogs"), 200, 0.0, 0.01)
+
+    record = log_queue.get_nowait()
+    assert record.msg["request_path"] == "/messages/send/batch/7"
+    assert record.msg["sample_rate"] == 1.0
+    assert log_queue.empty()
+
+
+def test_sampler_budget_follows_previous_second(monkeypatch):
+    """За прошлую секунду было 40 запросов при бюджете 10 — пишется четверть"""
+    now = [100.0]
+    monkeypatch.setattr(logging_module.time, "monotonic", lambda: now[0])
+    sampler = LogSampler(1.0, {}, budget=10)
+
+    rates = [sampler.sample_rate("/messages/unread") for _ in range(40)]
+    assert rates == [1.0] * 40
+
+    now[0] = 101.0
+    assert sampler.sample_rate("/messages/unread") == 0.25
+
+    # секунда без запросов — бюджет снова не ограничивает
+    now[0] = 103.0
+    assert sampler.sample_rate("/messages/unread") == 1.0
+
+
+def test_repeated_errors_are_deduplicated(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logging_module.time, "monotonic", lambda: now[0])
+    dedup = ErrorDeduplicationFilter(window=60)
+
+    def record(msg, *args, level=logging.ERROR):
+        return logging.makeLogRecord({"name": "app.services.messages", "levelno": level, "msg": msg, "args": args})
+
+    assert dedup.filter(record("Error sending message for profile %s: %s", "+7900", "timeout"))
+    for _ in range(3):
+        assert not dedup.filter(record("Error sending message for profile %s: %s", "+7900", "timeout"))
+    # другой текст и INFO не схлопываются
+    assert dedup.filter(record("Error sending message for profile %s: %s", "+7901", "timeout"))
+    assert dedup.filter(record("Sent", level=logging.INFO))
+    assert dedup.filter(record("Sent", level=logging.INFO))
+
+    now[0] = 61.0
+    after = record("Error sending message for profile %s: %s", "+7900", "timeout")
+    assert dedup.filter(after)
+    assert after.repeated == 3
+    assert after.getMessage().startswith("Error sending message for profile +7900: timeout")
+
+
+def test_dropped_records_are_exported(monkeypatch):
+    monkeypatch.setattr(logging_module.queue_handler, "dropped", 3)
+
+    assert "log_queue_dropped_records 3" in metrics_registry.render()
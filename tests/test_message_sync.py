@@ -0,0 +1,212 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services import message_sync as message_sync_module
+from app.services import messages
+from app.services.messages import get_unread_messages
+
+
+@pytest.fixture(autouse=True)
+def store_db(monkeypatch):
+    """БД хранилища подменена: пишем в моки save_messages / reset_unread_messages"""
+    monkeypatch.setattr(message_sync_module, "SessionLocal", MagicMock())
+    with patch('app.services.message_sync.save_messages', new_callable=AsyncMock) as save_messages, \
+            patch('app.services.message_sync.reset_unread_messages', new_callable=AsyncMock) as reset_unread:
+        yield SimpleNamespace(save_messages=save_messages, reset_unread_messages=reset_unread)
+
+
+@pytest.fixture
+def store_mode(monkeypatch):
+    monkeypatch.setattr(messages.settings, "UNREAD_FROM_STORE", True)
+
+
+def _handlers(client):
+    return {type(builder).__name__: callback for (callback, builder), _ in client.add_event_handler.call_args_list}
+
+
+@pytest.mark.asyncio
+async def test_attach_backfills_unread_snapshot(message_sync, client_pool, mock_client, mock_dialog, mock_message,
+                                                store_db):
+    """После подключения клиента текущие непрочитанные сохраняются снимком, профиль готов"""
+    mock_dialog.unread_count = 1
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
+    mock_client.get_messages = AsyncMock(return_value=[mock_message])
+    message_sync.track("+1", profile_id=7)
+
+    await client_pool.put("+1", mock_client)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert message_sync.is_ready("+1")
+    profile_id, rows = store_db.reset_unread_messages.await_args.args[1:]
+    assert profile_id == 7
+    assert [(row["chat_id"], row["message_id"], row["sender_name"]) for row in rows] == [(123, 1, "John")]
+    assert client_pool.is_pinned("+1")
+
+
+@pytest.mark.asyncio
+async def test_backfill_resets_only_rows_saved_before_snapshot(message_sync, client_pool, mock_client, store_db):
+    """Снимок не отмечает прочитанными сообщения, записанные уже после его начала"""
+    before_snapshot = datetime.now()
+    mock_client.get_dialogs = AsyncMock(return_value=[])
+    message_sync.track("+1", profile_id=7)
+
+    await client_pool.put("+1", mock_client)
+    await asyncio.sleep(0)
+
+    snapshot_at = store_db.reset_unread_messages.await_args.kwargs["before"]
+    assert before_snapshot <= snapshot_at <= datetime.now()
+
+
+def test_track_respects_pool_pin_limit(message_sync, client_pool):
+    """Профили сверх лимита закреплённых клиентов не отслеживаются"""
+    client_pool.max_pinned = 1
+
+    assert message_sync.track("+1", profile_id=1)
+    assert not message_sync.track("+2", profile_id=2)
+    assert message_sync.track("+1", profile_id=1)
+
+    assert client_pool.is_pinned("+1") and not client_pool.is_pinned("+2")
+    assert list(message_sync._profiles) == ["+1"]
+
+
+@pytest.mark.asyncio
+async def test_sync_profiles_connects_with_bounded_concurrency(message_sync, client_pool, store_db):
+    """Клиенты профилей подключаются параллельно, но не больше connect_concurrency сразу"""
+    profile_sessions = [
+        SimpleNamespace(phone=f"+{i}", profile_id=i, session_id=i, session_string=f"session-{i}")
+        for i in range(5)
+    ]
+    active = peak = 0
+
+    async def connect():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    def build_client(_session_string):
+        client = AsyncMock()
+        client.is_connected = MagicMock(return_value=True)
+        client.add_event_handler = MagicMock()
+        client.connect = AsyncMock(side_effect=connect)
+        client.is_user_authorized = AsyncMock(return_value=True)
+        client.get_dialogs = AsyncMock(return_value=[])
+        return client
+
+    with patch('app.services.message_sync.get_authorized_profile_sessions', new_callable=AsyncMock) as mock_get, \
+            patch('app.services.message_sync._build_client', side_effect=build_client):
+        mock_get.return_value = profile_sessions
+        await message_sync._sync_profiles()
+
+    assert peak == message_sync.connect_concurrency
+    assert len(client_pool) == 5
+    assert all(client_pool.is_pinned(profile_session.phone) for profile_session in profile_sessions)
+
+
+@pytest.mark.asyncio
+async def test_events_are_buffered_and_flushed(message_sync, client_pool, mock_client, mock_message, store_db):
+    """Новые сообщения и прочтения пишутся одной пачкой при flush"""
+    mock_client.get_dialogs = AsyncMock(return_value=[])
+    message_sync.track("+1", profile_id=7)
+    await client_pool.put("+1", mock_client)
+    handlers = _handlers(mock_client)
+
+    await handlers["NewMessage"](SimpleNamespace(chat=None, chat_id=555, message=mock_message))
+    await handlers["MessageRead"](SimpleNamespace(chat_id=555, max_id=3))
+    await handlers["MessageRead"](SimpleNamespace(chat_id=555, max_id=2))
+    await message_sync.flush()
+
+    rows, reads = store_db.save_messages.await_args.args[1:]
+    assert [(row["profile_id"], row["chat_id"], row["message_id"]) for row in rows] == [(7, 555, 1)]
+    assert reads == [(7, 555, 3)]
+
+    store_db.save_messages.reset_mock()
+    await message_sync.flush()
+    store_db.save_messages.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_detach_makes_profile_not_ready(message_sync, client_pool, mock_client, store_db):
+    """Без подключённого клиента события не приходят — хранилищу больше не доверяем"""
+    mock_client.get_dialogs = AsyncMock(return_value=[])
+    message_sync.track("+1", profile_id=7)
+    await client_pool.put("+1", mock_client)
+    await asyncio.sleep(0)
+    assert message_sync.is_ready("+1")
+
+    await client_pool.discard("+1")
+
+    assert not message_sync.is_ready("+1")
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_served_from_store(mock_db, mock_profile_session, mock_client, message_sync,
+                                                     read_ack_queue, store_mode, fake_logger):
+    """Готовый профиль отвечает из БД без обхода диалогов в Telegram"""
+    mock_client.is_user_authorized.return_value = True
+    message_sync._ready.add("+1234567890")
+    stored = [
+        dict(chat_id=-1001234567890, message_id=11, chat_name="Channel", sender_name="Channel",
+             text="news", date=datetime(2024, 1, 1, tzinfo=timezone.utc)),
+        dict(chat_id=-1001234567890, message_id=10, chat_name="Channel", sender_name="Channel",
+             text="older", date=datetime(2024, 1, 1, tzinfo=timezone.utc)),
+    ]
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client, \
+            patch('app.services.messages.get_stored_unread', new_callable=AsyncMock) as mock_get_stored_unread:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+        mock_get_stored_unread.return_value = stored
+
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890", limit=20)
+
+    assert result["status"] == "success"
+    assert [m["id"] for m in result["messages"]] == [11, 10]
+    assert result["messages"][0]["chat_id"] == 1234567890
+    mock_get_stored_unread.assert_awaited_once_with(mock_db, mock_profile_session.profile_id, 20)
+    mock_client.get_dialogs.assert_not_called()
+    assert read_ack_queue._pending[("+1234567890", -1001234567890)].max_id == 11
+
+
+def _tracked_session(phone="+1"):
+    return SimpleNamespace(phone=phone, profile_id=7, session_id=70, session_string="session")
+
+
+@pytest.mark.asyncio
+async def test_connect_error_disconnects_client_and_keeps_session(message_sync, client_pool, mock_client, store_db):
+    """Ошибка подключения не оставляет висящий клиент, но и сессию не деактивирует"""
+    mock_client.connect = AsyncMock(side_effect=ConnectionError("network down"))
+    message_sync.track("+1", profile_id=7)
+
+    with patch('app.services.message_sync._build_client', return_value=mock_client), \
+            patch('app.services.message_sync.deactivate_tg_session', new_callable=AsyncMock) as mock_deactivate:
+        await message_sync._connect_profile(_tracked_session())
+
+    mock_client.disconnect.assert_awaited_once()
+    mock_deactivate.assert_not_called()
+    assert len(client_pool) == 0
+    assert client_pool.is_pinned("+1")
+
+
+@pytest.mark.asyncio
+async def test_expired_session_is_marked_unauthorized(message_sync, client_pool, mock_client, store_db):
+    """Истёкшая сессия деактивируется, как в запросах, и профиль больше не переподключается"""
+    mock_client.is_user_authorized = AsyncMock(return_value=False)
+    message_sync.track("+1", profile_id=7)
+
+    with patch('app.services.message_sync._build_client', return_value=mock_client), \
+            patch('app.services.message_sync.deactivate_tg_session', new_callable=AsyncMock) as mock_deactivate, \
+            patch('app.services.message_sync.set_profile_authorized', new_callable=AsyncMock) as mock_set_authorized:
+        await message_sync._connect_profile(_tracked_session())
+
+    mock_client.disconnect.assert_awaited_once()
+    assert mock_deactivate.await_args.args[1] == 70
+    assert mock_set_authorized.await_args.args[1:] == (7, False)
+    assert not client_pool.is_pinned("+1")
@@ -1,10 +1,29 @@
-import pytest
-from unittest.mock import AsyncMock, patch
+import asyncio
+import json
+from datetime import datetime, timezone
+from dataclasses import replace
+from types import SimpleNamespace
 
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from telethon import TelegramClient, types
+from telethon.errors import FloodWaitError
+from pydantic import ValidationError
+
+from app.routers import messages as messages_router
+from app.services import messages as messages_module
+from app.models.request_model import AllMessagesRequest, DialogsRequest, MessagesHistoryRequest, MessagesRequest
+from app.models.response_model import UnreadMessagesResponse, DialogsResponse, HistoryResponse, \
+    AllUnreadMessagesResponse, SendMessageResponse
+from app.services.cursor import encode_cursor, decode_cursor
+from app.services.timings import RequestTimings, request_timings
 from app.services.messages import (
     get_unread_messages,
     send_message,
     get_dialogs,
+    stream_unread_messages,
+    get_history,
+    get_all_unread_messages,
 )
 
 
@@ -15,8 +34,8 @@ from app.services.messages import (
 @pytest.mark.asyncio
 async def test_get_unread_messages_profile_not_found(mock_db, fake_logger):
     """Профиль не найден"""
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile:
-        mock_get_profile.return_value = None
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = None
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
@@ -25,12 +44,12 @@ async def test_get_unread_messages_profile_not_found(mock_db, fake_logger):
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_not_authorized(mock_db, mock_profile, fake_logger):
+async def test_get_unread_messages_not_authorized(mock_db, mock_profile_session, fake_logger):
     """Профиль не авторизован"""
-    mock_profile.is_authorized = False
+    mock_profile_session = replace(mock_profile_session, is_authorized=False)
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile:
-        mock_get_profile.return_value = mock_profile
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = mock_profile_session
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
@@ -39,54 +58,53 @@ async def test_get_unread_messages_not_authorized(mock_db, mock_profile, fake_lo
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_session_not_found(mock_db, mock_profile, fake_logger):
+async def test_get_unread_messages_session_not_found(mock_db, mock_profile_session, fake_logger):
     """Сессия не найдена"""
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = None
+    mock_profile_session = replace(mock_profile_session, session_id=None, session_string=None)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages.set_profile_authorized', new_callable=AsyncMock) as mock_set_authorized:
+        mock_get_profile_session.return_value = mock_profile_session
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
         assert result["status"] == "error"
         assert "Сессия не найдена" in result["message"]
+        mock_set_authorized.assert_called_once_with(mock_db, mock_profile_session.profile_id, False)
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_client_not_authorized(mock_db, mock_profile, mock_session, mock_client, fake_logger):
+async def test_get_unread_messages_client_not_authorized(mock_db, mock_profile_session, mock_client, fake_logger):
     """Клиент не авторизован при подключении"""
     mock_client.is_user_authorized = AsyncMock(return_value=False)
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client, \
-            patch('app.services.messages.update_session', new_callable=AsyncMock) as mock_update_session, \
-            patch('app.services.messages.update_profile', new_callable=AsyncMock) as mock_update_profile:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client, \
+            patch('app.services.messages.deactivate_tg_session', new_callable=AsyncMock) as mock_deactivate_session, \
+            patch('app.services.messages.set_profile_authorized', new_callable=AsyncMock) as mock_set_authorized:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
         assert result["status"] == "error"
         assert "истекла" in result["message"]
-        mock_update_session.assert_called_once()
-        mock_update_profile.assert_called_once()
+        mock_build_client.assert_called_once_with(mock_profile_session.session_string)
+        mock_deactivate_session.assert_called_once()
+        mock_set_authorized.assert_called_once()
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_connection_error(mock_db, mock_profile, mock_session, mock_client, fake_logger):
+async def test_get_unread_messages_connection_error(mock_db, mock_profile_session, mock_client, fake_logger):
     """Ошибка подключения к Telegram"""
     mock_client.connect.side_effect = Exception("Connection error")
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client, \
-            patch('app.services.messages.update_session', new_callable=AsyncMock) as mock_update_session, \
-            patch('app.services.messages.update_profile', new_callable=AsyncMock) as mock_update_profile:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client, \
+            patch('app.services.messages.deactivate_tg_session', new_callable=AsyncMock), \
+            patch('app.services.messages.set_profile_authorized', new_callable=AsyncMock):
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
@@ -95,41 +113,206 @@ async def test_get_unread_messages_connection_error(mock_db, mock_profile, mock_
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_success(mock_db, mock_profile, mock_session, mock_client, mock_dialog, mock_message, fake_logger):
+async def test_get_unread_messages_success(mock_db, mock_profile_session, mock_client, mock_dialog, mock_message, fake_logger):
     """Успешное получение непрочитанных сообщений"""
     mock_dialog.unread_count = 1
     mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
     mock_client.get_messages = AsyncMock(return_value=[mock_message])
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
-        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="sync")
 
         assert result["status"] == "success"
         assert result["count"] == 1
         assert len(result["messages"]) == 1
         assert result["messages"][0]["from"] == "John"
-        mock_client.send_read_acknowledge.assert_called_once()
-        mock_client.disconnect.assert_called_once()
+        UnreadMessagesResponse.model_validate(result)
+        mock_client.send_read_acknowledge.assert_called_once_with(mock_dialog.entity, max_id=mock_message.id)
+        mock_client.disconnect.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_deferred_read_ack(mock_db, mock_profile_session, mock_client, mock_dialog,
+                                                     mock_message, read_ack_queue, fake_logger):
+    """В режиме deferred отметка о прочтении уходит в фоновую очередь"""
+    mock_dialog.unread_count = 1
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
+    mock_client.get_messages = AsyncMock(return_value=[mock_message])
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="deferred")
+
+        assert result["status"] == "success"
+        mock_client.send_read_acknowledge.assert_not_called()
+        assert len(read_ack_queue) == 1
+
+        mock_client.is_connected.return_value = True
+        await read_ack_queue.flush()
+
+        mock_client.send_read_acknowledge.assert_called_once_with(mock_dialog.entity, max_id=mock_message.id)
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_reuses_pooled_client(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Повторный запрос берёт клиент из пула без нового подключения"""
+    mock_client.get_dialogs = AsyncMock(return_value=[])
+    mock_client.is_connected.return_value = True
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+
+        assert result["status"] == "success"
+        mock_build_client.assert_called_once()
+        mock_client.connect.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_keeps_dialog_order(mock_db, mock_profile_session, mock_client, mock_message, fake_logger):
+    """Диалоги запрашиваются параллельно, но порядок сообщений совпадает с порядком диалогов"""
+    dialogs = []
+    for chat_id in (1, 2, 3):
+        dialog = AsyncMock(unread_count=1, is_group=False, is_channel=False)
+        dialog.id = chat_id
+        dialog.name = f"Chat {chat_id}"
+        dialog.entity = AsyncMock(id=chat_id)
+        dialogs.append(dialog)
+
+    in_flight = 0
+    max_in_flight = 0
+
+    async def get_messages(entity, limit):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # первый диалог отвечает последним
+        await asyncio.sleep(0.01 * (4 - entity.id))
+        in_flight -= 1
+        return [mock_message]
+
+    mock_client.get_dialogs = AsyncMock(return_value=dialogs)
+    mock_client.get_messages = AsyncMock(side_effect=get_messages)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+
+        assert [m["chat_id"] for m in result["messages"]] == [1, 2, 3]
+        assert max_in_flight > 1
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_retries_flood_wait(mock_db, mock_profile_session, mock_client, mock_dialog, mock_message, fake_logger):
+    """Короткий FloodWait пережидается, сообщения не теряются"""
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
+    mock_client.get_messages = AsyncMock(side_effect=[FloodWaitError(request=None, capture=0), [mock_message]])
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+
+        assert result["status"] == "success"
+        assert result["count"] == 1
+        assert mock_client.get_messages.call_count == 2
 
 
 @pytest.mark.asyncio
-async def test_get_unread_messages_no_unread(mock_db, mock_profile, mock_session, mock_client, mock_dialog, fake_logger):
+async def test_get_unread_messages_flood_wait_retries_are_capped(mock_db, mock_profile_session, mock_client,
+                                                                mock_dialog, monkeypatch, fake_logger):
+    """FloodWait подряд повторяется не больше UNREAD_FLOOD_WAIT_RETRIES раз"""
+    monkeypatch.setattr(messages_module.settings, "UNREAD_FLOOD_WAIT_RETRIES", 2)
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
+    mock_client.get_messages = AsyncMock(side_effect=FloodWaitError(request=None, capture=0))
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
+
+    assert result["status"] == "error"
+    assert mock_client.get_messages.call_count == 3
+
+
+def test_client_does_not_sleep_through_flood_wait():
+    """FloodWait не пережидается внутри Telethon, а доходит до rate_limiter"""
+    assert messages_module._build_client(None).flood_sleep_threshold == 0
+
+
+@pytest.mark.asyncio
+async def test_client_retries_rpc_after_short_flood_wait(monkeypatch, rate_limiter):
+    """Короткий FloodWait пережидается в rate_limiter, и RPC повторяется один раз"""
+    calls = []
+
+    async def telethon_call(self, request, ordered=False, flood_sleep_threshold=None):
+        calls.append(request)
+        if len(calls) == 1:
+            raise FloodWaitError(request=None, capture=0)
+        return "ok"
+
+    monkeypatch.setattr(TelegramClient, "__call__", telethon_call)
+    rate_limiter.flood_retry_max = 1
+    client = messages_module._build_client(None)
+
+    async with rate_limiter.limit("+1", "read"):
+        assert await client("GetDialogsRequest") == "ok"
+
+    assert calls == ["GetDialogsRequest", "GetDialogsRequest"]
+    assert rate_limiter.stats()["read"]["flood_waits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_serves_dialogs_from_cache(mock_db, mock_profile_session, mock_client,
+                                                             mock_dialog, mock_message, fake_logger):
+    """Повторный опрос берёт список диалогов из кэша; прочитанный диалог больше не запрашивается"""
+    mock_dialog.unread_count = 1
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
+    mock_client.get_messages = AsyncMock(return_value=[mock_message])
+    mock_client.is_connected.return_value = True
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        first = await get_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="sync")
+        second = await get_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="sync")
+
+        assert first["count"] == 1
+        assert second["count"] == 0
+        mock_client.get_dialogs.assert_called_once()
+        mock_client.get_messages.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_unread_messages_no_unread(mock_db, mock_profile_session, mock_client, mock_dialog, fake_logger):
     """Нет непрочитанных сообщений"""
     mock_dialog.unread_count = 0
     mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await get_unread_messages(mock_db, user_id=1, phone="+1234567890")
 
@@ -138,6 +321,126 @@ async def test_get_unread_messages_no_unread(mock_db, mock_profile, mock_session
         assert len(result["messages"]) == 0
 
 
+@pytest.mark.asyncio
+async def test_get_unread_messages_query_count(mock_client, session_writer, fake_logger):
+    """На запрос — один SELECT профиля с сессией; изменившаяся строка сессии уходит в фоновую запись"""
+    row = (1, "+1234567890", True, 1, "old_session")
+    db = AsyncMock()
+    db.__aenter__.return_value = db
+    db.execute.return_value = MagicMock(first=MagicMock(return_value=row))
+    mock_client.get_dialogs = AsyncMock(return_value=[])
+
+    with patch('app.services.messages._build_client') as mock_build_client:
+        mock_build_client.return_value = mock_client
+
+        result = await get_unread_messages(db, user_id=1, phone="+1234567890")
+
+    assert result["status"] == "success"
+    statements = [call.args[0] for call in db.execute.await_args_list]
+    assert [statement.is_select for statement in statements] == [True]
+    mock_build_client.assert_called_once_with("old_session")
+    assert session_writer._dirty == {"+1234567890": "new_session_string"}
+
+
+# ============================================================================
+# Tests for stream_unread_messages
+# ============================================================================
+
+@pytest.mark.asyncio
+async def test_stream_unread_messages_profile_not_found(mock_db, fake_logger):
+    """Профиль не найден — ошибка до начала потока"""
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = None
+
+        result = await stream_unread_messages(mock_db, user_id=1, phone="+1234567890")
+
+        assert result["status"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_stream_unread_messages_success(mock_db, mock_profile_session, mock_client, mock_dialog,
+                                              mock_message, client_pool, fake_logger):
+    """Сообщения отдаются по диалогам, в конце — итоговая запись с ошибками"""
+    broken = AsyncMock(unread_count=1, is_group=False, is_channel=False)
+    broken.id = 777
+    broken.name = "Broken"
+    broken.entity = AsyncMock(id=777)
+
+    async def get_messages(entity, limit):
+        if entity.id == 777:
+            raise Exception("Fetch error")
+        return [mock_message]
+
+    mock_dialog.unread_count = 1
+    mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog, broken])
+    mock_client.get_messages = AsyncMock(side_effect=get_messages)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        stream = await stream_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="none")
+        records = [record async for record in stream]
+
+        assert records[0]["type"] == "dialog"
+        assert records[0]["chat_id"] == 123
+        assert len(records[0]["messages"]) == 1
+        assert records[-1] == {
+            "type": "end",
+            "status": "error",
+            "count": 1,
+            "errors": [{"chat_id": 777, "message": "Fetch error"}],
+        }
+        assert client_pool._clients["+1234567890"].in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_unread_messages_bounds_prefetch(mock_db, mock_profile_session, mock_client, mock_message,
+                                                      client_pool, monkeypatch, fake_logger):
+    """Медленный читатель: вперёд загружается не больше UNREAD_STREAM_BUFFER диалогов"""
+    monkeypatch.setattr(messages_module.settings, "UNREAD_STREAM_BUFFER", 2)
+    dialogs = []
+    for dialog_id in range(10):
+        dialog = AsyncMock(unread_count=1, is_group=False, is_channel=False, entity=AsyncMock(id=dialog_id))
+        dialog.id = dialog_id
+        dialog.name = f"Chat {dialog_id}"
+        dialogs.append(dialog)
+    mock_client.get_dialogs = AsyncMock(return_value=dialogs)
+    mock_client.get_messages = AsyncMock(return_value=[mock_message])
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        stream = await stream_unread_messages(mock_db, user_id=1, phone="+1234567890", read_ack="none")
+        await anext(stream)
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert mock_client.get_messages.await_count <= 3
+        await stream.aclose()
+
+    assert client_pool._clients["+1234567890"].in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_unread_messages_not_started_holds_no_client(mock_db, mock_profile_session, mock_client,
+                                                                 client_pool, fake_logger):
+    """Поток, который так и не начали читать, не держит клиента пула"""
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        stream = await stream_unread_messages(mock_db, user_id=1, phone="+1234567890")
+        await stream.aclose()
+
+    mock_build_client.assert_not_called()
+    assert "+1234567890" not in client_pool._clients
+
+
 # ============================================================================
 # Tests for send_message
 # ============================================================================
@@ -145,8 +448,8 @@ async def test_get_unread_messages_no_unread(mock_db, mock_profile, mock_session
 @pytest.mark.asyncio
 async def test_send_message_profile_not_found(mock_db, fake_logger):
     """Профиль не найден"""
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile:
-        mock_get_profile.return_value = None
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = None
 
         result = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="123")
 
@@ -155,43 +458,86 @@ async def test_send_message_profile_not_found(mock_db, fake_logger):
 
 
 @pytest.mark.asyncio
-async def test_send_message_success(mock_db, mock_profile, mock_session, mock_client, fake_logger):
+async def test_send_message_success(mock_db, mock_profile_session, mock_client, fake_logger):
     """Успешная отправка сообщения"""
     entity = AsyncMock()
     mock_client.get_entity = AsyncMock(return_value=entity)
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="123")
 
         assert result["status"] == "success"
+        SendMessageResponse.model_validate(result)
         mock_client.get_entity.assert_called_once_with(123)  # Число, а не строка
         mock_client.send_message.assert_called_once_with(entity, "Hi")
-        mock_client.disconnect.assert_called_once()
+        mock_client.disconnect.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_send_message_entity_not_found(mock_db, mock_profile, mock_session, mock_client, fake_logger):
+async def test_send_message_entity_not_found(mock_db, mock_profile_session, mock_client, fake_logger):
     """Сущность не найдена"""
     mock_client.get_entity.side_effect = ValueError("Entity not found")
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="invalid")
 
         assert result["status"] == "error"
 
 
+@pytest.mark.asyncio
+async def test_send_message_reuses_resolved_receiver(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Повторная отправка тому же получателю не разрешает его заново"""
+    entity = AsyncMock()
+    mock_client.get_entity = AsyncMock(return_value=entity)
+    mock_client.is_connected.return_value = True
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="@John_Doe")
+        result = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="john_doe")
+
+        assert result["status"] == "success"
+        mock_client.get_entity.assert_called_once_with("john_doe")
+        assert mock_client.send_message.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_send_message_caches_missing_receiver(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Ненайденный получатель кэшируется, повторный поиск по диалогам не выполняется"""
+    async def no_dialogs():
+        return
+        yield
+
+    mock_client.get_entity.side_effect = ValueError("Entity not found")
+    mock_client.iter_dialogs = MagicMock(side_effect=no_dialogs)
+    mock_client.is_connected.return_value = True
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        first = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="nobody")
+        second = await send_message(mock_db, user_id=1, phone="+1234567890", text="Hi", tg_receiver="nobody")
+
+        assert first["status"] == "error"
+        assert second["status"] == "error"
+        mock_client.get_entity.assert_called_once()
+        mock_client.iter_dialogs.assert_called_once()
+        mock_client.send_message.assert_not_called()
+
+
 # ============================================================================
 # Tests for get_dialogs
 # ============================================================================
@@ -199,8 +545,8 @@ async def test_send_message_entity_not_found(mock_db, mock_profile, mock_session
 @pytest.mark.asyncio
 async def test_get_dialogs_profile_not_found(mock_db, fake_logger):
     """Профиль не найден"""
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile:
-        mock_get_profile.return_value = None
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session:
+        mock_get_profile_session.return_value = None
 
         result = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db)
 
@@ -209,16 +555,14 @@ async def test_get_dialogs_profile_not_found(mock_db, fake_logger):
 
 
 @pytest.mark.asyncio
-async def test_get_dialogs_success(mock_db, mock_profile, mock_session, mock_client, mock_dialog, fake_logger):
+async def test_get_dialogs_success(mock_db, mock_profile_session, mock_client, mock_dialog, fake_logger):
     """Успешное получение диалогов"""
     mock_client.get_dialogs = AsyncMock(return_value=[mock_dialog])
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db)
 
@@ -226,22 +570,318 @@ async def test_get_dialogs_success(mock_db, mock_profile, mock_session, mock_cli
         assert len(result["dialogs"]) == 1
         assert result["dialogs"][0]["name"] == "Test Chat"
         assert result["dialogs"][0]["unread_count"] == 2
-        mock_client.disconnect.assert_called_once()
+        DialogsResponse.model_validate(result)
+        mock_client.disconnect.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_get_dialogs_empty(mock_db, mock_profile, mock_session, mock_client, fake_logger):
+async def test_get_dialogs_empty(mock_db, mock_profile_session, mock_client, fake_logger):
     """Диалогов нет"""
     mock_client.get_dialogs = AsyncMock(return_value=[])
 
-    with patch('app.services.messages.get_tg_profile', new_callable=AsyncMock) as mock_get_profile, \
-            patch('app.services.messages.get_tg_session', new_callable=AsyncMock) as mock_get_session, \
-            patch('app.services.messages._get_client', new_callable=AsyncMock) as mock_get_client:
-        mock_get_profile.return_value = mock_profile
-        mock_get_session.return_value = mock_session
-        mock_get_client.return_value = (mock_client, mock_session)
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
 
         result = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db)
 
         assert result["status"] == "success"
-        assert len(result["dialogs"]) == 0
\ No newline at end of file
+        assert len(result["dialogs"]) == 0
+
+
+def _tg_dialog(user_id: int, message_id: int, date: datetime):
+    return MagicMock(
+        id=user_id, entity=types.User(id=user_id, access_hash=user_id * 10), name=f"User {user_id}",
+        unread_count=0, is_group=False, is_channel=False, message=MagicMock(id=message_id, date=date),
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_dialogs_cursor_pages(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Следующая страница — один запрос со смещением из курсора, первые диалоги не загружаются снова"""
+    first_page = [
+        _tg_dialog(1, 50, datetime(2024, 1, 3, tzinfo=timezone.utc)),
+        _tg_dialog(2, 40, datetime(2024, 1, 2, tzinfo=timezone.utc)),
+    ]
+    mock_client.get_dialogs = AsyncMock(side_effect=[
+        first_page,
+        [_tg_dialog(3, 30, datetime(2024, 1, 1, tzinfo=timezone.utc))],
+    ])
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+
+        page = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db, limit=2)
+        assert [dialog["id"] for dialog in page["dialogs"]] == [1, 2]
+        assert page["next_cursor"]
+
+        page = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db, limit=2, cursor=page["next_cursor"])
+
+    assert [dialog["id"] for dialog in page["dialogs"]] == [3]
+    assert page["next_cursor"] is None
+    mock_client.get_dialogs.assert_awaited_with(
+        limit=2,
+        ignore_pinned=True,
+        offset_date=datetime(2024, 1, 2, tzinfo=timezone.utc),
+        offset_id=40,
+        offset_peer=types.InputPeerUser(user_id=2, access_hash=20),
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_dialogs_invalid_cursor(mock_db, mock_client, fake_logger):
+    for cursor in ("not a cursor", encode_cursor(d=None, m=0, p="AAAA")):
+        result = await get_dialogs(user_id=1, phone="+1234567890", db=mock_db, cursor=cursor)
+
+        assert result == {"status": "error", "message": "Некорректный курсор"}
+    mock_client.get_dialogs.assert_not_called()
+
+
+# ============================================================================
+# Tests for get_all_unread_messages
+# ============================================================================
+
+@pytest.mark.asyncio
+async def test_get_all_unread_messages_tags_profiles_and_reports_failures(mock_db, monkeypatch, fake_logger):
+    """Сообщения помечены профилем, ошибка одного профиля не мешает остальным"""
+    profiles = [MagicMock(phone=phone, is_authorized=authorized)
+                for phone, authorized in (("+1", True), ("+2", True), ("+3", False))]
+    monkeypatch.setattr(messages_module, "SessionLocal", MagicMock())
+    message = {"id": 1, "from": "Bob", "text": "hi", "date": "2024-01-01T00:00:00", "chat_name": "Chat", "chat_id": 10}
+
+    async def fake_unread(db, user_id, phone, limit, read_ack):
+        if phone == "+2":
+            return {"status": "error", "message": "Сессия истекла"}
+        return {"status": "success", "count": 1, "messages": [dict(message)]}
+
+    with patch('app.services.messages.get_users_profiles', new_callable=AsyncMock) as mock_get_users_profiles, \
+            patch('app.services.messages.get_unread_messages', side_effect=fake_unread) as mock_unread:
+        mock_get_users_profiles.return_value = profiles
+
+        result = await get_all_unread_messages(mock_db, user_id=1)
+
+    assert result["status"] == "partial"
+    assert result["messages"] == [{**message, "phone": "+1"}]
+    assert result["profiles"] == [
+        {"phone": "+1", "status": "success", "count": 1},
+        {"phone": "+2", "status": "error", "message": "Сессия истекла"},
+    ]
+    assert mock_unread.call_count == 2
+    AllUnreadMessagesResponse.model_validate(result)
+
+
+@pytest.mark.asyncio
+async def test_get_all_unread_messages_bounds_concurrency(mock_db, monkeypatch, fake_logger):
+    """Профили опрашиваются параллельно, но не больше лимита одновременно"""
+    profiles = [MagicMock(phone=f"+{i}", is_authorized=True) for i in range(6)]
+    monkeypatch.setattr(messages_module, "SessionLocal", MagicMock())
+    monkeypatch.setattr(messages_module, "all_profiles_semaphore", asyncio.Semaphore(2))
+    running = peak = 0
+
+    async def fake_unread(db, user_id, phone, limit, read_ack):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"status": "success", "count": 0, "messages": []}
+
+    with patch('app.services.messages.get_users_profiles', new_callable=AsyncMock) as mock_get_users_profiles, \
+            patch('app.services.messages.get_unread_messages', side_effect=fake_unread):
+        mock_get_users_profiles.return_value = profiles
+
+        result = await get_all_unread_messages(mock_db, user_id=1)
+
+    assert result["status"] == "success"
+    assert len(result["profiles"]) == 6
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_profile_timeout_during_connect_disconnects_client(mock_db, mock_profile_session, mock_client, client_pool,
+                                                               monkeypatch, fake_logger):
+    """Клиент, не успевший подключиться до таймаута профиля, отключается, а не остаётся висеть"""
+    monkeypatch.setattr(messages_module.settings, "UNREAD_ALL_PROFILE_TIMEOUT", 0.01)
+    monkeypatch.setattr(messages_module, "SessionLocal", MagicMock(return_value=mock_db))
+
+    async def slow_connect():
+        await asyncio.sleep(1)
+
+    mock_client.connect = AsyncMock(side_effect=slow_connect)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client', return_value=mock_client):
+        mock_get_profile_session.return_value = mock_profile_session
+
+        result = await messages_module._profile_unread(1, "+1234567890", 50, "none")
+
+    assert result == {"status": "error", "message": "Превышено время ожидания Telegram"}
+    mock_client.disconnect.assert_awaited_once()
+    assert len(client_pool) == 0
+    assert not client_pool.lock("+1234567890").locked()
+
+
+# ============================================================================
+# Tests for get_history
+# ============================================================================
+
+def _stored_row(message_id, chat_id=-1001234567890):
+    return {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "chat_name": "Channel",
+        "sender_name": "Channel",
+        "text": f"message {message_id}",
+        "date": datetime(2024, 1, 1, tzinfo=timezone.utc),
+    }
+
+
+def test_cursor_roundtrip():
+    """Курсор непрозрачен для клиента, но без потерь разбирается обратно"""
+    assert decode_cursor(encode_cursor(m=42)) == {"m": 42}
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.asyncio
+async def test_get_history_first_page_fetched_and_saved(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Первая страница берётся из Telegram и сохраняется вместе с покрытым участком"""
+    messages = [MagicMock(id=message_id, text="hi", chat=None, sender=None, sender_id=None, out=False,
+                          date=datetime(2024, 1, 1, tzinfo=timezone.utc)) for message_id in (30, 29)]
+    mock_client.get_messages = AsyncMock(return_value=messages)
+    mock_client.get_entity = AsyncMock(return_value="peer")
+    mock_client.return_value = SimpleNamespace(dialogs=[SimpleNamespace(read_inbox_max_id=29)])
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client, \
+            patch('app.services.messages.get_history_range', new_callable=AsyncMock) as mock_get_range, \
+            patch('app.services.messages.save_history_page', new_callable=AsyncMock) as mock_save:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_build_client.return_value = mock_client
+        mock_get_range.return_value = None
+
+        result = await get_history(mock_db, user_id=1, phone="+1234567890", peer_id=-1001234567890, limit=2)
+
+    assert result["source"] == "telegram"
+    assert [m["id"] for m in result["messages"]] == [30, 29]
+    assert decode_cursor(result["next_cursor"]) == {"m": 29}
+    HistoryResponse.model_validate(result)
+    mock_client.get_messages.assert_awaited_once_with("peer", limit=2, offset_id=0)
+    _, profile_id, chat_id, rows, min_id, max_id, reached_start = mock_save.await_args.args
+    assert (chat_id, min_id, max_id, reached_start) == (-1001234567890, 29, 30, False)
+    # 30 ещё не прочитано в Telegram — в хранилище оно тоже непрочитанное
+    assert [(row["message_id"], row["is_read"]) for row in rows] == [(30, False), (29, True)]
+
+
+@pytest.mark.asyncio
+async def test_get_history_page_inside_saved_range_served_from_store(mock_db, mock_profile_session, fake_logger):
+    """Страница внутри сохранённого участка отдаётся из БД, Telegram не нужен"""
+    saved_range = MagicMock(min_id=1, max_id=30, reached_start=True)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client') as mock_build_client, \
+            patch('app.services.messages.get_history_range', new_callable=AsyncMock) as mock_get_range, \
+            patch('app.services.messages.get_chat_history', new_callable=AsyncMock) as mock_get_chat_history:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_get_range.return_value = saved_range
+        mock_get_chat_history.return_value = [_stored_row(28), _stored_row(27)]
+
+        result = await get_history(mock_db, user_id=1, phone="+1234567890", peer_id=-1001234567890,
+                                   cursor=encode_cursor(m=29), limit=2)
+
+    assert result["source"] == "store"
+    assert [m["id"] for m in result["messages"]] == [28, 27]
+    assert result["messages"][0]["chat_id"] == 1234567890
+    mock_get_chat_history.assert_awaited_once_with(mock_db, 1, -1001234567890, 29, 1, 2)
+    mock_build_client.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_history_profile_feed_uses_keyset(mock_db, mock_profile_session, fake_logger):
+    """Лента профиля листается по ключу (date, chat_id, message_id), а не по смещению"""
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages.get_profile_history', new_callable=AsyncMock) as mock_get_profile_history:
+        mock_get_profile_session.return_value = mock_profile_session
+        mock_get_profile_history.return_value = [_stored_row(5), _stored_row(4)]
+
+        first = await get_history(mock_db, user_id=1, phone="+1234567890", limit=2)
+        await get_history(mock_db, user_id=1, phone="+1234567890", cursor=first["next_cursor"], limit=2)
+
+    assert mock_get_profile_history.await_args_list[0].args[2] is None
+    assert mock_get_profile_history.await_args_list[1].args[2] == (
+        datetime(2024, 1, 1, tzinfo=timezone.utc), -1001234567890, 4,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_history_rejects_cursor_of_other_kind(mock_db, mock_profile_session, fake_logger):
+    """Курсор ленты профиля не подходит для истории чата и наоборот — ошибка вместо KeyError"""
+    feed_cursor = encode_cursor(d="2024-01-01T00:00:00+00:00", c=-1001234567890, m=4)
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages.get_profile_history', new_callable=AsyncMock) as mock_get_profile_history:
+        mock_get_profile_session.return_value = mock_profile_session
+
+        chat_result = await get_history(mock_db, user_id=1, phone="+1234567890", peer_id=-1001234567890,
+                                        cursor=feed_cursor)
+        feed_result = await get_history(mock_db, user_id=1, phone="+1234567890", cursor=encode_cursor(m=29))
+
+    assert chat_result == {"status": "error", "message": "Некорректный курсор"}
+    assert feed_result == {"status": "error", "message": "Некорректный курсор"}
+    mock_get_profile_session.assert_not_called()
+    mock_get_profile_history.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_get_history_loads_profile_once(mock_db, mock_profile_session, mock_client, fake_logger):
+    """Страница из Telegram не перечитывает профиль из БД второй раз"""
+    mock_client.get_messages = AsyncMock(return_value=[])
+    mock_client.get_entity = AsyncMock(return_value="peer")
+
+    with patch('app.services.messages.get_profile_session', new_callable=AsyncMock) as mock_get_profile_session, \
+            patch('app.services.messages._build_client', return_value=mock_client), \
+            patch('app.services.messages.get_history_range', new_callable=AsyncMock, return_value=None), \
+            patch('app.services.messages.save_history_page', new_callable=AsyncMock):
+        mock_get_profile_session.return_value = mock_profile_session
+
+        result = await get_history(mock_db, user_id=1, phone="+1234567890", peer_id=-1001234567890, limit=2)
+
+    assert result["status"] == "success"
+    mock_get_profile_session.assert_awaited_once()
+
+
+@pytest.mark.parametrize("limit", [0, 101])
+def test_messages_requests_bound_limit(limit):
+    """Размер страницы ограничен: limit=0 или слишком большой отклоняется валидацией"""
+    for model, fields in (
+            (MessagesRequest, {"phone": "+1"}),
+            (AllMessagesRequest, {}),
+            (MessagesHistoryRequest, {"phone": "+1"}),
+    ):
+        with pytest.raises(ValidationError):
+            model(limit=limit, **fields)
+
+
+@pytest.mark.asyncio
+async def test_dialogs_endpoint_encodes_service_result_directly(monkeypatch):
+    """Ответ сервиса кодируется в JSON как есть и совпадает со схемой response_model"""
+    result = {"status": "success", "dialogs": [
+        {"id": 1, "peer_id": -1001, "name": "Чат", "unread_count": 0, "is_group": True, "is_channel": False},
+    ], "next_cursor": None}
+    monkeypatch.setattr(messages_router, "get_dialogs", AsyncMock(return_value=result))
+    timings = RequestTimings()
+    token = request_timings.set(timings)
+    try:
+        response = await messages_router.MessagesRouter.get_dialogs_endpoint(
+            DialogsRequest(phone="+1234567890"), user=MagicMock(id=1), db=None,
+        )
+    finally:
+        request_timings.reset(token)
+
+    assert json.loads(response.body) == result
+    assert "Чат".encode() in response.body
+    assert DialogsResponse.model_validate_json(response.body).dialogs[0].peer_id == -1001
+    assert timings.serialize_ms > 0
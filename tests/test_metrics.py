@@ -0,0 +1,119 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from telethon.errors import FloodWaitError
+from telethon.sessions import StringSession
+from telethon.tl.functions.messages import GetDialogsRequest
+
+from app.middleware import metrics as metrics_middleware
+from app.middleware.metrics import MetricsMiddleware
+from app.services import auth
+from app.services import metrics as metrics_module
+from app.services.auth import MeteredTelegramClient
+from app.services.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = Counter("requests_total", "Запросы", ("route",), registry=registry)
+    in_flight = Gauge("in_flight", "В обработке", registry=registry)
+    duration = Histogram("duration_seconds", "Время", buckets=(0.1, 1.0), registry=registry)
+
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    in_flight.inc()
+    duration.observe(0.1)
+    duration.observe(0.5)
+    duration.observe(5)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/a\\"b"} 3' in lines
+    assert "in_flight 1" in lines
+    assert 'duration_seconds_bucket{le="0.1"} 1' in lines
+    assert 'duration_seconds_bucket{le="1"} 2' in lines
+    assert 'duration_seconds_bucket{le="+Inf"} 3' in lines
+    assert "duration_seconds_count 3" in lines
+    assert "duration_seconds_sum 5.6" in lines
+
+
+def test_gauge_function_is_read_on_render():
+    registry = Registry()
+    value = {"connected": 1}
+    Gauge("connected", "Подключено", registry=registry).set_function(lambda: value["connected"])
+
+    value["connected"] = 7
+
+    assert "connected 7" in registry.render().splitlines()
+
+
+@pytest.mark.asyncio
+async def test_middleware_records_route_template(monkeypatch):
+    """Метка — шаблон маршрута, in-flight возвращается к нулю"""
+    registry = Registry()
+    requests = Counter("http_requests_total", "", ("method", "route", "status"), registry=registry)
+    duration = Histogram("http_request_duration_seconds", "", ("method", "route"), registry=registry)
+    in_flight = Gauge("http_requests_in_flight", "", ("method",), registry=registry)
+    monkeypatch.setattr(metrics_middleware, "http_requests", requests)
+    monkeypatch.setattr(metrics_middleware, "http_request_duration", duration)
+    monkeypatch.setattr(metrics_middleware, "http_requests_in_flight", in_flight)
+
+    async def app(scope, receive, send):
+        scope["route"] = type("Route", (), {"path": "/messages/send/batch/{job_id}"})()
+        await send({"type": "http.response.start", "status": 404, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def send(message):
+        pass
+
+    await MetricsMiddleware(app)({"type": "http", "method": "GET", "path": "/messages/send/batch/42"}, None, send)
+
+    assert requests.labels("GET", "/messages/send/batch/{job_id}", "404").value == 1
+    assert duration.labels("GET", "/messages/send/batch/{job_id}").count == 1
+    assert in_flight.labels("GET").value == 0
+
+
+@pytest.mark.asyncio
+async def test_middleware_maps_unknown_method_to_other(monkeypatch):
+    """Произвольный метод от клиента не становится новой меткой"""
+    registry = Registry()
+    requests = Counter("http_requests_total", "", ("method", "route", "status"), registry=registry)
+    duration = Histogram("http_request_duration_seconds", "", ("method", "route"), registry=registry)
+    in_flight = Gauge("http_requests_in_flight", "", ("method",), registry=registry)
+    monkeypatch.setattr(metrics_middleware, "http_requests", requests)
+    monkeypatch.setattr(metrics_middleware, "http_request_duration", duration)
+    monkeypatch.setattr(metrics_middleware, "http_requests_in_flight", in_flight)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 405, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    await MetricsMiddleware(app)({"type": "http", "method": "X-RANDOM-1", "path": "/"}, None, send)
+
+    assert set(in_flight._children) == {("other",)}
+    assert requests.labels("other", "<unmatched>", "405").value == 1
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        metrics_module._Metric("abstract", "", registry=Registry())
+
+
+@pytest.mark.asyncio
+async def test_telegram_rpc_is_timed_and_errors_counted(monkeypatch):
+    registry = Registry()
+    rpc_duration = Histogram("telegram_rpc_duration_seconds", "", ("method",), registry=registry)
+    rpc_errors = Counter("telegram_rpc_errors_total", "", ("method", "error"), registry=registry)
+    monkeypatch.setattr(auth, "telegram_rpc_duration", rpc_duration)
+    monkeypatch.setattr(auth, "telegram_rpc_errors", rpc_errors)
+    client = MeteredTelegramClient(StringSession(), 1, "hash")
+    client._call = AsyncMock(side_effect=FloodWaitError(None, capture=3))
+    request = GetDialogsRequest(offset_date=None, offset_id=0, offset_peer=None, limit=10, hash=0)
+
+    with pytest.raises(FloodWaitError):
+        await client(request)
+
+    assert rpc_duration.labels("GetDialogsRequest").count == 1
+    assert rpc_errors.labels("GetDialogsRequest", "FloodWaitError").value == 1
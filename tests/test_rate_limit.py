@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+from telethon.errors import FloodWaitError
+
+from app.services.rate_limit import RateLimiter, TokenBucket, READ, SEND
+
+
+def make_limiter(rate=100.0, burst=2):
+    return RateLimiter(limits={READ: (rate, burst), SEND: (rate, burst)}, backoff=0.5, recovery=2.0, min_rate=1.0)
+
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst_then_paces():
+    """Всплеск до burst проходит сразу, дальше — со скоростью rate"""
+    bucket = TokenBucket(rate=50.0, burst=3, backoff=0.5, recovery=2.0, min_rate=1.0)
+
+    start = time.monotonic()
+    waits = [await bucket.acquire() for _ in range(5)]
+
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert time.monotonic() - start >= 2 / 50 * 0.9
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_counted_as_queue_depth():
+    """Ожидающие токена видны в stats как очередь"""
+    limiter = make_limiter(rate=20.0, burst=1)
+
+    async def call():
+        async with limiter.limit("+1", READ):
+            pass
+
+    tasks = [asyncio.create_task(call()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.stats()[READ]["waiting"] == 2
+
+    await asyncio.gather(*tasks)
+    stats = limiter.stats()[READ]
+    assert stats["waiting"] == 0
+    assert stats["calls"] == 3
+    assert stats["waited"] == 2
+
+
+@pytest.mark.asyncio
+async def test_flood_wait_blocks_bucket_and_lowers_rate():
+    """FloodWait блокирует класс методов профиля и снижает его скорость"""
+    limiter = make_limiter()
+
+    with pytest.raises(FloodWaitError):
+        async with limiter.limit("+1", READ):
+            raise FloodWaitError(request=None, capture=1)
+
+    bucket = limiter.bucket("+1", READ)
+    assert bucket.rate == 50.0
+    assert bucket.blocked_until > time.monotonic()
+    stats = limiter.stats()[READ]
+    assert stats["flood_waits"] == 1
+    assert stats["blocked"] == 1
+    assert stats["throttled"] == 1
+
+    # другие классы и профили не затронуты
+    assert limiter.bucket("+1", SEND).blocked_until == 0.0
+    assert limiter.bucket("+2", READ).blocked_until == 0.0
+
+
+@pytest.mark.asyncio
+async def test_rate_recovers_after_successful_calls():
+    """После FloodWait скорость постепенно возвращается к исходной"""
+    limiter = make_limiter()
+    bucket = limiter.bucket("+1", READ)
+    bucket.penalize(0)
+    bucket.penalize(0)
+    assert bucket.rate == 25.0
+
+    for _ in range(3):
+        async with limiter.limit("+1", READ):
+            pass
+
+    assert bucket.rate == 100.0
+
+
+@pytest.mark.asyncio
+async def test_each_rpc_inside_block_takes_a_token():
+    """Многостраничный вызов платит токеном за каждую страницу, а не один раз за блок"""
+    limiter = make_limiter(rate=1.0, burst=5)
+
+    async with limiter.limit("+1", READ):
+        for _ in range(3):
+            await limiter.before_rpc()
+
+    assert limiter.stats()[READ]["calls"] == 3
+    assert limiter.bucket("+1", READ).tokens < 3
+
+
+@pytest.mark.asyncio
+async def test_short_flood_wait_is_waited_out_once():
+    """Короткий FloodWait учитывается в bucket и пережидается, длинный — нет"""
+    limiter = make_limiter()
+    limiter.flood_retry_max = 1
+
+    async with limiter.limit("+1", READ):
+        assert await limiter.flood_wait(FloodWaitError(request=None, capture=0))
+    assert limiter.stats()[READ]["flood_waits"] == 1
+
+    with pytest.raises(FloodWaitError):
+        async with limiter.limit("+1", READ):
+            error = FloodWaitError(request=None, capture=5)
+            assert not await limiter.flood_wait(error)
+            raise error
+    # FloodWait, уже учтённый клиентом, не считается второй раз
+    assert limiter.stats()[READ]["flood_waits"] == 2
+    assert not await limiter.flood_wait(FloodWaitError(request=None, capture=0))
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from telethon.errors import FloodWaitError
+
+from app.services.client_pool import TelegramClientPool
+from app.services.read_ack import ReadAckQueue
+
+
+@pytest.fixture
+def pooled_client():
+    client = AsyncMock()
+    client.is_connected = MagicMock(return_value=True)
+    return client
+
+
+@pytest.fixture
+async def pool(pooled_client):
+    pool = TelegramClientPool(max_connected=2, idle_timeout=600, health_check_interval=60)
+    await pool.put("+1", pooled_client)
+    pool.release("+1")
+    return pool
+
+
+@pytest.mark.asyncio
+async def test_acks_for_same_chat_are_coalesced(pool, pooled_client):
+    """Несколько отметок одного чата схлопываются в одну с наибольшим max_id"""
+    queue = ReadAckQueue(pool, batch_delay=0, max_retries=2)
+    entity = MagicMock(id=10)
+
+    queue.enqueue("+1", entity.id, entity, 5)
+    queue.enqueue("+1", entity.id, entity, 9)
+    queue.enqueue("+1", entity.id, entity, 7)
+    await queue.flush()
+
+    pooled_client.send_read_acknowledge.assert_called_once_with(entity, max_id=9)
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_ack_is_retried(pool, pooled_client):
+    """Неудачная отметка остаётся в очереди и повторяется"""
+    queue = ReadAckQueue(pool, batch_delay=0, max_retries=2)
+    entity = MagicMock(id=10)
+    pooled_client.send_read_acknowledge.side_effect = [Exception("network"), None]
+
+    queue.enqueue("+1", entity.id, entity, 3)
+    await queue.flush()
+    assert len(queue) == 1
+
+    await queue.flush()
+    assert len(queue) == 0
+    assert pooled_client.send_read_acknowledge.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_flood_wait_postpones_ack(pool, pooled_client):
+    """На FloodWait отметка откладывается на указанное время"""
+    queue = ReadAckQueue(pool, batch_delay=0, max_retries=2)
+    entity = MagicMock(id=10)
+    pooled_client.send_read_acknowledge.side_effect = FloodWaitError(request=None, capture=60)
+
+    queue.enqueue("+1", entity.id, entity, 3)
+    await queue.flush()
+    await queue.flush()
+
+    pooled_client.send_read_acknowledge.assert_called_once()
+    assert len(queue) == 1
+
+
+@pytest.mark.asyncio
+async def test_ack_dropped_after_max_retries(pool, pooled_client):
+    """После max_retries неудачных попыток отметка выбрасывается"""
+    queue = ReadAckQueue(pool, batch_delay=0, max_retries=1)
+    entity = MagicMock(id=10)
+    pooled_client.send_read_acknowledge.side_effect = Exception("network")
+
+    queue.enqueue("+1", entity.id, entity, 3)
+    await queue.flush()
+    await queue.flush()
+
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_postponed_ack_does_not_spin_worker(pool, pooled_client):
+    """Отложенная отметка не заставляет воркер опрашивать очередь каждые batch_delay"""
+    queue = ReadAckQueue(pool, batch_delay=0, max_retries=2)
+    entity = MagicMock(id=10)
+    pooled_client.send_read_acknowledge.side_effect = FloodWaitError(request=None, capture=60)
+    flushes = 0
+    flush = queue.flush
+
+    async def counting_flush():
+        nonlocal flushes
+        flushes += 1
+        await flush()
+
+    queue.flush = counting_flush
+    await queue.start()
+    queue.enqueue("+1", entity.id, entity, 3)
+    await asyncio.sleep(0.3)
+    await queue.stop()
+
+    assert flushes == 1
+    assert queue._retry_delay() > 50
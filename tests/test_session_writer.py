@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.db.session.requests import update_session
+from app.services import session_writer as session_writer_module
+from app.services.session_writer import SessionWriter
+
+
+@pytest.fixture
+def update_session_strings(monkeypatch):
+    monkeypatch.setattr(session_writer_module, "SessionLocal", MagicMock())
+    with patch('app.services.session_writer.update_session_strings', new_callable=AsyncMock) as mock_update:
+        yield mock_update
+
+
+@pytest.mark.asyncio
+async def test_unchanged_session_is_not_written(update_session_strings):
+    """Строка, совпадающая с записанной в БД, в очередь не попадает"""
+    writer = SessionWriter(flush_delay=0)
+    writer.track("+1", session_id=1, persisted="s1")
+
+    assert writer.write("+1", "s1") is False
+    await writer.flush()
+
+    update_session_strings.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_changes_are_coalesced_into_one_write(update_session_strings):
+    """Несколько изменений между записями — один UPDATE с последними строками"""
+    writer = SessionWriter(flush_delay=0)
+    writer.track("+1", session_id=1, persisted="s1")
+    writer.track("+2", session_id=2, persisted="t1")
+
+    writer.write("+1", "s2")
+    writer.write("+1", "s3")
+    writer.write("+2", "t2")
+    await writer.flush()
+
+    update_session_strings.assert_awaited_once()
+    assert update_session_strings.await_args.args[1] == {1: "s3", 2: "t2"}
+
+    # записанное повторно не пишется
+    assert writer.write("+1", "s3") is False
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_retried(update_session_strings):
+    """Если запись не удалась, строка остаётся в очереди"""
+    writer = SessionWriter(flush_delay=0)
+    writer.track("+1", session_id=1, persisted="s1")
+    writer.write("+1", "s2")
+    update_session_strings.side_effect = [Exception("db down"), None]
+
+    with pytest.raises(Exception):
+        await writer.flush()
+    assert len(writer) == 1
+
+    await writer.close()
+    assert update_session_strings.await_count == 2
+    assert len(writer) == 0
+
+
+@pytest.mark.asyncio
+async def test_forgotten_session_is_not_written(update_session_strings):
+    """Деактивированная сессия не перезаписывается"""
+    writer = SessionWriter(flush_delay=0)
+    writer.track("+1", session_id=1, persisted="s1")
+    writer.write("+1", "s2")
+    writer.forget("+1")
+
+    await writer.close()
+
+    update_session_strings.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_update_session_skips_unchanged_fields():
+    """update_session без реальных изменений не ходит в БД"""
+    db = AsyncMock()
+    db.__aenter__.return_value = db
+    record = MagicMock(id=1, is_active=True, session_string="s1")
+
+    await update_session(db, record, is_active=True, session_string="s1")
+    db.execute.assert_not_called()
+
+    await update_session(db, record, session_string="s2")
+    db.execute.assert_awaited_once()
+    assert record.session_string == "s2"
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.services.worker import DelayedFlushWorker
+
+
+class _Collector(DelayedFlushWorker):
+    def __init__(self, failures: int = 0):
+        super().__init__(delay=0)
+        self.pending: list[int] = []
+        self.written: list[list[int]] = []
+        self.failures = failures
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, item: int):
+        self.pending.append(item)
+        self.wakeup()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        if self.failures:
+            self.failures -= 1
+            self.pending = batch + self.pending
+            raise RuntimeError("db down")
+        self.written.append(batch)
+
+
+@pytest.mark.asyncio
+async def test_worker_batches_and_retries_after_error():
+    """Накопленное пишется пачкой, после ошибки воркер повторяет запись сам"""
+    worker = _Collector(failures=1)
+    await worker.start()
+    worker.add(1)
+    worker.add(2)
+    for _ in range(50):
+        if worker.written:
+            break
+        await asyncio.sleep(0.01)
+
+    assert worker.written == [[1, 2]]
+    assert len(worker) == 0
+    await worker.close()
+
+
+@pytest.mark.asyncio
+async def test_close_stops_worker_and_flushes():
+    """Остановка дописывает то, что воркер ещё не успел записать"""
+    worker = _Collector()
+    worker.pending.append(1)
+
+    await worker.start()
+    await worker.close()
+
+    assert worker.written == [[1]]
+    assert worker._worker is None
+
+
+@pytest.mark.asyncio
+async def test_worker_does_not_spin_while_work_is_left():
+    """Если работа осталась, а delay=0, повторы идут не чаще min_retry_delay"""
+    worker = _Collector(failures=1000)
+    flushes = 0
+    flush = worker.flush
+
+    async def counting_flush():
+        nonlocal flushes
+        flushes += 1
+        await flush()
+
+    worker.flush = counting_flush
+    await worker.start()
+    worker.add(1)
+    await asyncio.sleep(worker.min_retry_delay * 2.5)
+    await worker.stop()
+
+    assert 2 <= flushes <= 4